@@ -5,8 +5,9 @@ from flask_jwt_extended import (
     create_access_token, create_refresh_token, 
     get_jwt_identity, jwt_required
 )
-from backend.app import db, cache
+from backend.app import db
 from backend.models.user import User
+from backend.utils.cache_keys import cached_view, invalidate, bump_generation, USER
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -34,6 +35,9 @@ def register():
     db.session.add(new_user)
     db.session.commit()
     
+    # Invalidate cached user lists
+    bump_generation(USER)
+    
     return jsonify({'message': 'User registered successfully'}), 201
 
 @auth_bp.route('/login', methods=['POST'])
@@ -74,7 +78,7 @@ def refresh():
 
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix='user_me')
+@cached_view(timeout=60, kinds=(USER,), per_user=True)
 def get_current_user():
     current_user_id = get_jwt_identity()
     user = User.query.get(current_user_id)
@@ -98,6 +102,6 @@ def change_password():
     db.session.commit()
     
     # Invalidate cache
-    cache.delete('user_me')
+    invalidate(USER, current_user_id)
     
     return jsonify({'message': 'Password changed successfully'}), 200
@@ -1,42 +1,57 @@
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from backend.app import db, cache
+from backend.app import db
 from backend.models import User, Chart, Dataset
+from backend.utils.chart_data import get_chart_data as compute_chart_data, merge_filters, chart_data_table, QUERY_MODES
+from backend.utils.cache_keys import chart_data_key, cached_view, invalidate, bump_generation, CHART
+from backend.utils.pagination import paginate_query
+from backend.utils.tiered_cache import tiered_cache
+from backend.utils.response_formats import negotiate_format, table_response, json_response
 
 charts_bp = Blueprint('charts', __name__)
 
 @charts_bp.route('/', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix='charts')
+@cached_view(timeout=60, kinds=(CHART,))
 def get_charts():
-    # Get query parameters for pagination and filtering
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
-    
     # Query charts
     query = Chart.query
     
-    # Filter by dataset if specified
+    # Filter by dataset and creator if specified
     dataset_id = request.args.get('dataset_id')
     if dataset_id:
         query = query.filter_by(dataset_id=dataset_id)
+    created_by = request.args.get('created_by')
+    if created_by:
+        query = query.filter_by(created_by=created_by)
     
     # Apply pagination
-    pagination = query.paginate(page=page, per_page=per_page)
+    try:
+        pagination = paginate_query(query, (Chart.created_at, Chart.id), request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
     # Return paginated results
     return jsonify({
-        'data': [chart.to_dict() for chart in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'page': page,
-        'per_page': per_page
+        'data': [chart.to_dict() for chart in pagination.pop('items')],
+        **pagination
     }), 200
 
+@charts_bp.route('/cache-stats', methods=['GET'])
+@jwt_required()
+def get_cache_stats():
+    current_user = User.query.get(get_jwt_identity())
+    
+    # Only admin can inspect cache counters
+    if not current_user or current_user.role != 'admin':
+        return jsonify({'message': 'Permission denied'}), 403
+    
+    return jsonify(tiered_cache.stats()), 200
+
 @charts_bp.route('/<chart_id>', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix=lambda: f'chart_{request.view_args["chart_id"]}')
+@cached_view(timeout=60, objects={CHART: 'chart_id'})
 def get_chart(chart_id):
     chart = Chart.query.get(chart_id)
     
@@ -56,7 +71,7 @@ def create_chart():
         return jsonify({'message': 'Name, dataset_id, and chart_type are required'}), 400
     
     # Check if the dataset exists
-    dataset = Dataset.query.get(data.get('dataset_id'))
+    dataset = db.session.query(Dataset).filter_by(id=data.get('dataset_id')).first()
     if not dataset:
         return jsonify({'message': 'Dataset not found'}), 404
     
@@ -75,7 +90,7 @@ def create_chart():
     db.session.commit()
     
     # Invalidate cache
-    cache.delete('charts')
+    bump_generation(CHART)
     
     return jsonify(new_chart.to_dict()), 201
 
@@ -103,10 +118,8 @@ def update_chart(chart_id):
     
     db.session.commit()
     
-    # Invalidate cache
-    cache.delete('charts')
-    cache.delete(f'chart_{chart_id}')
-    cache.delete(f'chart_data_{chart_id}')
+    # Invalidate cache, including the chart's data and its dashboards
+    invalidate(CHART, chart_id)
     
     return jsonify(chart.to_dict()), 200
 
@@ -119,27 +132,32 @@ def delete_chart(chart_id):
     if not chart:
         return jsonify({'message': 'Chart not found'}), 404
     
+    # Invalidate cache while the chart's dashboards can still be found
+    invalidate(CHART, chart_id)
+    
     db.session.delete(chart)
     db.session.commit()
     
-    # Invalidate cache
-    cache.delete('charts')
-    cache.delete(f'chart_{chart_id}')
-    cache.delete(f'chart_data_{chart_id}')
+    bump_generation(CHART)
     
     return jsonify({'message': 'Chart deleted successfully'}), 200
 
 @charts_bp.route('/<chart_id>/data', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=300, key_prefix=lambda: f'chart_data_{request.view_args["chart_id"]}')
 def get_chart_data(chart_id):
     chart = Chart.query.get(chart_id)
     
     if not chart:
         return jsonify({'message': 'Chart not found'}), 404
     
+    # Exact unless estimates are asked for
+    mode = request.args.get('mode', 'exact')
+    if mode not in QUERY_MODES:
+        return jsonify({'message': f"mode must be one of: {', '.join(QUERY_MODES)}"}), 400
+    approximate = mode == 'approximate'
+    
     # Get the dataset
-    dataset = Dataset.query.get(chart.dataset_id)
+    dataset = db.session.query(Dataset).filter_by(id=chart.dataset_id).first()
     if not dataset:
         return jsonify({'message': 'Dataset not found'}), 404
     
@@ -159,64 +177,40 @@ def get_chart_data(chart_id):
                 filters = {}
         
         # Apply any chart-specific filters from query_params
-        if chart.query_params and 'filters' in chart.query_params:
-            # Merge with request filters
-            for key, value in chart.query_params['filters'].items():
-                if key not in filters:
-                    filters[key] = value
+        filters = merge_filters(chart, filters)
+        
+        # Each filter state is cached separately, under the current versions
+        # of the chart, its dataset and its data source
+        cache_key = chart_data_key(chart, dataset, source, filters, approximate)
+        
+        # Aggregate in the data source and shape the result for the chart
+        # type; concurrent misses wait for (or get the stale copy of) one
+        # computation instead of all running the query
+        data = tiered_cache.get_or_compute(
+            cache_key,
+            lambda: compute_chart_data(
+                chart,
+                dataset,
+                source,
+                filters=filters,
+                row_limit=current_app.config['CHART_DATA_ROW_LIMIT'],
+                timeout=current_app.config['CHART_QUERY_TIMEOUT'],
+                approximate=approximate
+            ),
+            timeout=current_app.config['CHART_DATA_CACHE_TIMEOUT']
+        )
         
-        # Process data based on chart type and configuration
-        # Return sample data for now
-        if chart.chart_type == 'bar':
-            data = {
-                'labels': ['Category 1', 'Category 2', 'Category 3', 'Category 4', 'Category 5'],
-                'datasets': [{
-                    'label': 'Values',
-                    'data': [65, 59, 80, 81, 56]
-                }]
-            }
-        elif chart.chart_type == 'line':
-            data = {
-                'labels': ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun'],
-                'datasets': [{
-                    'label': 'Series 1',
-                    'data': [12, 19, 3, 5, 2, 3]
-                }, {
-                    'label': 'Series 2',
-                    'data': [5, 10, 15, 7, 8, 12]
-                }]
-            }
-        elif chart.chart_type == 'pie':
-            data = {
-                'labels': ['Red', 'Blue', 'Yellow', 'Green', 'Purple'],
-                'datasets': [{
-                    'data': [300, 50, 100, 40, 120]
-                }]
-            }
-        elif chart.chart_type == 'scatter':
-            data = {
-                'datasets': [{
-                    'label': 'Scatter Dataset',
-                    'data': [
-                        { 'x': -10, 'y': 0 },
-                        { 'x': 0, 'y': 10 },
-                        { 'x': 10, 'y': 5 },
-                        { 'x': 0.5, 'y': 5.5 }
-                    ]
-                }]
-            }
-        else:
-            # Default data for other chart types
-            data = {
-                'labels': ['Label 1', 'Label 2', 'Label 3'],
-                'datasets': [{
-                    'label': 'Default',
-                    'data': [10, 20, 30]
-                }]
-            }
+        # Chart data is already column-oriented JSON; Arrow and columnar JSON
+        # are built from it
+        fmt = negotiate_format()
+        if fmt != 'json':
+            table, metadata = chart_data_table(data)
+            return table_response(table, fmt, metadata)
         
-        return jsonify(data), 200
+        return json_response(data)
     
+    except ValueError as e:
+        return jsonify({'message': f'Invalid chart configuration: {str(e)}'}), 400
     except Exception as e:
         return jsonify({'message': f'Error getting chart data: {str(e)}'}), 500
 
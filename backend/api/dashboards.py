@@ -1,39 +1,56 @@
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from backend.app import db, cache
-from backend.models import User, Dashboard, Chart, DashboardChart, DashboardComment
+from backend.app import db
+from backend.models import User, Dashboard, Chart, DashboardChart, DashboardComment, Dataset, DataSource
+from backend.utils.cache_keys import cached_view, invalidate, bump_generation, CHART, DASHBOARD, COMMENT
+from backend.utils.chart_data import QUERY_MODES
+from backend.utils.dashboard_data import get_dashboard_data
+from backend.utils.pagination import paginate_query
+from backend.utils.serializers import (
+    dashboards_query,
+    load_dashboard,
+    serialize_dashboards,
+    serialize_dashboard_export,
+    comment_threads,
+    comment_replies,
+    DEFAULT_REPLY_DEPTH
+)
 
 dashboards_bp = Blueprint('dashboards', __name__)
 
 @dashboards_bp.route('/', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix='dashboards')
+@cached_view(timeout=60, kinds=(DASHBOARD, CHART))
 def get_dashboards():
-    # Get query parameters for pagination and filtering
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    # Summaries leave out chart configurations
+    summary = request.args.get('view') == 'summary'
     
-    # Query dashboards
-    query = Dashboard.query
+    # Query dashboards, loading their charts up front
+    query = dashboards_query(summary=summary)
+    
+    # Filter by creator if specified
+    created_by = request.args.get('created_by')
+    if created_by:
+        query = query.filter_by(created_by=created_by)
     
     # Apply pagination
-    pagination = query.paginate(page=page, per_page=per_page)
+    try:
+        pagination = paginate_query(query, (Dashboard.created_at, Dashboard.id), request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
     # Return paginated results
     return jsonify({
-        'data': [dashboard.to_dict() for dashboard in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'page': page,
-        'per_page': per_page
+        'data': serialize_dashboards(pagination.pop('items'), summary=summary),
+        **pagination
     }), 200
 
 @dashboards_bp.route('/<dashboard_id>', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix=lambda: f'dashboard_{request.view_args["dashboard_id"]}')
+@cached_view(timeout=60, objects={DASHBOARD: 'dashboard_id'})
 def get_dashboard(dashboard_id):
-    dashboard = Dashboard.query.get(dashboard_id)
+    dashboard = load_dashboard(dashboard_id)
     
     if not dashboard:
         return jsonify({'message': 'Dashboard not found'}), 404
@@ -65,7 +82,7 @@ def create_dashboard():
     db.session.commit()
     
     # Invalidate cache
-    cache.delete('dashboards')
+    bump_generation(DASHBOARD)
     
     return jsonify(new_dashboard.to_dict()), 201
 
@@ -75,7 +92,7 @@ def update_dashboard(dashboard_id):
     current_user_id = get_jwt_identity()
     data = request.json
     
-    dashboard = Dashboard.query.get(dashboard_id)
+    dashboard = load_dashboard(dashboard_id)
     if not dashboard:
         return jsonify({'message': 'Dashboard not found'}), 404
     
@@ -96,8 +113,7 @@ def update_dashboard(dashboard_id):
     db.session.commit()
     
     # Invalidate cache
-    cache.delete('dashboards')
-    cache.delete(f'dashboard_{dashboard_id}')
+    invalidate(DASHBOARD, dashboard_id)
     
     return jsonify(dashboard.to_dict()), 200
 
@@ -114,8 +130,7 @@ def delete_dashboard(dashboard_id):
     db.session.commit()
     
     # Invalidate cache
-    cache.delete('dashboards')
-    cache.delete(f'dashboard_{dashboard_id}')
+    invalidate(DASHBOARD, dashboard_id)
     
     return jsonify({'message': 'Dashboard deleted successfully'}), 200
 
@@ -148,7 +163,7 @@ def add_chart_to_dashboard(dashboard_id):
     db.session.commit()
     
     # Invalidate cache
-    cache.delete(f'dashboard_{dashboard_id}')
+    invalidate(DASHBOARD, dashboard_id)
     
     return jsonify(dashboard_chart.to_dict()), 201
 
@@ -172,7 +187,7 @@ def update_dashboard_chart(dashboard_id, chart_id):
     db.session.commit()
     
     # Invalidate cache
-    cache.delete(f'dashboard_{dashboard_id}')
+    invalidate(DASHBOARD, dashboard_id)
     
     return jsonify(dashboard_chart.to_dict()), 200
 
@@ -192,7 +207,7 @@ def remove_chart_from_dashboard(dashboard_id, chart_id):
     db.session.commit()
     
     # Invalidate cache
-    cache.delete(f'dashboard_{dashboard_id}')
+    invalidate(DASHBOARD, dashboard_id)
     
     return jsonify({'message': 'Chart removed from dashboard successfully'}), 200
 
@@ -223,28 +238,48 @@ def add_comment(dashboard_id):
     db.session.commit()
     
     # Invalidate comments cache
-    cache.delete(f'dashboard_comments_{dashboard_id}')
+    invalidate(COMMENT, dashboard_id)
     
     return jsonify(new_comment.to_dict()), 201
 
 @dashboards_bp.route('/<dashboard_id>/comments', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=120, key_prefix=lambda: f'dashboard_comments_{request.view_args["dashboard_id"]}')
+@cached_view(timeout=120, objects={COMMENT: 'dashboard_id'})
 def get_comments(dashboard_id):
     dashboard = Dashboard.query.get(dashboard_id)
     if not dashboard:
         return jsonify({'message': 'Dashboard not found'}), 404
     
-    # Get only top-level comments (no parent)
-    comments = DashboardComment.query.filter_by(
-        dashboard_id=dashboard_id, parent_id=None
-    ).all()
+    # Get query parameters for pagination
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    depth = max(0, min(request.args.get('depth', DEFAULT_REPLY_DEPTH, type=int), 10))
+    cursor = request.args.get('cursor')
+    
+    # A page of top-level threads with their first levels of replies
+    try:
+        threads, next_cursor = comment_threads(dashboard_id, limit=limit, cursor=cursor, depth=depth)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify([comment.to_dict() for comment in comments]), 200
+    return jsonify({
+        'data': threads,
+        'next_cursor': next_cursor
+    }), 200
+
+@dashboards_bp.route('/<dashboard_id>/comments/<comment_id>/replies', methods=['GET'])
+@jwt_required()
+def get_comment_replies(dashboard_id, comment_id):
+    comment = DashboardComment.query.filter_by(id=comment_id, dashboard_id=dashboard_id).first()
+    if not comment:
+        return jsonify({'message': 'Comment not found'}), 404
+    
+    depth = max(0, min(request.args.get('depth', DEFAULT_REPLY_DEPTH, type=int), 10))
+    
+    return jsonify({'data': comment_replies(comment, depth=depth)}), 200
 
 @dashboards_bp.route('/<dashboard_id>/filters', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=300, key_prefix=lambda: f'dashboard_filters_{request.view_args["dashboard_id"]}')
+@cached_view(timeout=300, objects={DASHBOARD: 'dashboard_id'})
 def get_dashboard_filters(dashboard_id):
     dashboard = Dashboard.query.get(dashboard_id)
     if not dashboard:
@@ -267,9 +302,8 @@ def apply_dashboard_filters(dashboard_id):
     dashboard_charts = DashboardChart.query.filter_by(dashboard_id=dashboard_id).all()
     chart_ids = [dc.chart_id for dc in dashboard_charts]
     
-    # For each chart, invalidate its data cache to force refreshing with new filters
-    for chart_id in chart_ids:
-        cache.delete(f'chart_data_{chart_id}')
+    # Chart data is cached per filter state, so nothing needs to be cleared:
+    # charts fetched with these filters get (or fill) their own entries
     
     return jsonify({
         'message': 'Filters applied successfully',
@@ -277,28 +311,65 @@ def apply_dashboard_filters(dashboard_id):
         'affected_charts': len(chart_ids)
     }), 200
 
+@dashboards_bp.route('/<dashboard_id>/data', methods=['GET'])
+@jwt_required()
+def get_dashboard_data_batch(dashboard_id):
+    dashboard = Dashboard.query.get(dashboard_id)
+    if not dashboard:
+        return jsonify({'message': 'Dashboard not found'}), 404
+    
+    # Apply filters from request if available
+    filters = request.args.get('filters', {})
+    if isinstance(filters, str):
+        import json
+        try:
+            filters = json.loads(filters)
+        except ValueError:
+            return jsonify({'message': 'Filters must be a JSON object'}), 400
+    if not isinstance(filters, dict):
+        return jsonify({'message': 'Filters must be a JSON object'}), 400
+    
+    mode = request.args.get('mode', 'exact')
+    if mode not in QUERY_MODES:
+        return jsonify({'message': f"mode must be one of: {', '.join(QUERY_MODES)}"}), 400
+    
+    # Every chart with its dataset and data source, in one query
+    charts = db.session.query(Chart, Dataset, DataSource).join(
+        DashboardChart, DashboardChart.chart_id == Chart.id
+    ).join(
+        Dataset, Dataset.id == Chart.dataset_id
+    ).join(
+        DataSource, DataSource.id == Dataset.source_id
+    ).filter(DashboardChart.dashboard_id == dashboard_id).all()
+    
+    # Charts sharing a dataset and filters are computed by shared queries
+    results, queries = get_dashboard_data(
+        current_app._get_current_object(),
+        charts,
+        filters=filters,
+        row_limit=current_app.config['CHART_DATA_ROW_LIMIT'],
+        timeout=current_app.config['CHART_QUERY_TIMEOUT'],
+        max_workers=current_app.config['DASHBOARD_QUERY_WORKERS'],
+        merge_max_rows=current_app.config['DASHBOARD_MERGE_MAX_ROWS'],
+        approximate=mode == 'approximate'
+    )
+    
+    return jsonify({
+        'dashboard_id': dashboard_id,
+        'charts': {str(chart_id): result for chart_id, result in results.items()},
+        'queries': queries
+    }), 200
+
 @dashboards_bp.route('/<dashboard_id>/export', methods=['GET'])
 @jwt_required()
 def export_dashboard(dashboard_id):
     format_type = request.args.get('format', 'json')
     
-    dashboard = Dashboard.query.get(dashboard_id)
+    dashboard = load_dashboard(dashboard_id)
     if not dashboard:
         return jsonify({'message': 'Dashboard not found'}), 404
     
     # Here we would implement export functionality based on format
-    # For now, return dashboard data in JSON format
-    dashboard_data = dashboard.to_dict()
-    
-    # Add charts with their positions
-    dashboard_charts = DashboardChart.query.filter_by(dashboard_id=dashboard_id).all()
-    charts_data = []
-    
-    for dc in dashboard_charts:
-        chart_data = dc.chart.to_dict() if dc.chart else {}
-        chart_data['position'] = dc.position
-        charts_data.append(chart_data)
-    
-    dashboard_data['charts'] = charts_data
-    
-    return jsonify(dashboard_data), 200
+    # For now, return dashboard data in JSON format, with charts and their
+    # positions
+    return jsonify(serialize_dashboard_export(dashboard)), 200
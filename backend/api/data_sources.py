@@ -1,12 +1,19 @@
 import os
+import traceback
 import pandas as pd
 from werkzeug.utils import secure_filename
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from backend.app import db, cache
+from backend.app import db
 from backend.models.user import User
 from backend.models.data import DataSource
-from backend.utils.data_ingestion import process_file, detect_column_types, detect_pii_columns
+from backend.utils.data_ingestion import ingest_file, ensure_parquet_copy, read_parquet_copy, parquet_path_for
+from backend.utils.engine_registry import engine_registry
+from backend.utils.duckdb_manager import duckdb_manager
+from backend.utils.cache_keys import cached_view, invalidate, bump_generation, SOURCE
+from backend.utils.pagination import paginate_query
+from backend.utils.response_formats import negotiate_format, table_response, json_response
+from backend.utils.json_provider import JSONRows
 
 data_sources_bp = Blueprint('data_sources', __name__)
 
@@ -17,30 +24,45 @@ def allowed_file(filename):
 
 @data_sources_bp.route('/', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix='data_sources')
+@cached_view(timeout=60, kinds=(SOURCE,))
 def get_data_sources():
-    # Get query parameters for pagination and filtering
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
-    
     # Query data sources
     query = DataSource.query
     
+    # Filter by creator and type if specified
+    created_by = request.args.get('created_by')
+    if created_by:
+        query = query.filter_by(created_by=created_by)
+    source_type = request.args.get('type')
+    if source_type:
+        query = query.filter_by(type=source_type)
+    
     # Apply pagination
-    pagination = query.paginate(page=page, per_page=per_page)
+    try:
+        pagination = paginate_query(query, (DataSource.created_at, DataSource.id), request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
     # Return paginated results
     return jsonify({
-        'data': [source.to_dict() for source in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'page': page,
-        'per_page': per_page
+        'data': [source.to_dict() for source in pagination.pop('items')],
+        **pagination
     }), 200
 
+@data_sources_bp.route('/pool-stats', methods=['GET'])
+@jwt_required()
+def get_pool_stats():
+    current_user = User.query.get(get_jwt_identity())
+    
+    # Only admin can inspect connection pools
+    if not current_user or current_user.role != 'admin':
+        return jsonify({'message': 'Permission denied'}), 403
+    
+    return jsonify(engine_registry.stats()), 200
+
 @data_sources_bp.route('/<source_id>', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix=lambda: f'data_source_{request.view_args["source_id"]}')
+@cached_view(timeout=60, objects={SOURCE: 'source_id'})
 def get_data_source(source_id):
     source = DataSource.query.get(source_id)
     
@@ -76,7 +98,7 @@ def create_data_source():
         db.session.commit()
         
         # Invalidate cache
-        cache.delete('data_sources')
+        bump_generation(SOURCE)
         
         return jsonify(new_source.to_dict()), 201
     
@@ -102,10 +124,13 @@ def create_data_source():
         name = request.form.get('name', file.filename)
         description = request.form.get('description', '')
         
-        # Process file and extract info
-        df = process_file(file_path)
-        column_types = detect_column_types(df)
-        pii_columns = detect_pii_columns(df)
+        # Stream the file into DuckDB, profiling it chunk by chunk
+        ingested = ingest_file(
+            file_path,
+            chunksize=current_app.config['INGEST_CHUNK_SIZE'],
+            pii_threshold=current_app.config['PII_MATCH_THRESHOLD'],
+            pii_executor=current_app.config['PII_SCAN_EXECUTOR']
+        )
         
         # Create data source
         new_source = DataSource(
@@ -115,8 +140,11 @@ def create_data_source():
             connection_params={
                 'file_path': file_path,
                 'file_type': filename.rsplit('.', 1)[1].lower(),
-                'rows': len(df),
-                'columns': len(df.columns)
+                'rows': ingested['row_count'],
+                'columns': len(ingested['columns']),
+                'duckdb_path': ingested['db_path'],
+                'parquet_path': ingested['parquet_path'],
+                'table_name': ingested['table_name']
             },
             created_by=current_user_id
         )
@@ -125,16 +153,17 @@ def create_data_source():
         db.session.commit()
         
         # Invalidate cache
-        cache.delete('data_sources')
+        bump_generation(SOURCE)
         
         # Return data source with file info
         result = new_source.to_dict()
         result['file_info'] = {
-            'rows': len(df),
-            'columns': len(df.columns),
-            'column_types': column_types,
-            'pii_columns': pii_columns,
-            'sample_data': df.head(5).to_dict(orient='records')
+            'rows': ingested['row_count'],
+            'columns': len(ingested['columns']),
+            'column_types': ingested['column_types'],
+            'pii_columns': ingested['pii_columns'],
+            'pii_report': ingested['pii_report'],
+            'sample_data': ingested['sample_data']
         }
         
         return jsonify(result), 201
@@ -166,9 +195,12 @@ def update_data_source(source_id):
     
     db.session.commit()
     
-    # Invalidate cache
-    cache.delete('data_sources')
-    cache.delete(f'data_source_{source_id}')
+    # Drop the pooled engine so the next query connects with the new params
+    if 'type' in data or 'connection_params' in data:
+        engine_registry.invalidate(source_id)
+    
+    # Invalidate cache, including everything built from this source
+    invalidate(SOURCE, source_id)
     
     return jsonify(source.to_dict()), 200
 
@@ -181,28 +213,38 @@ def delete_data_source(source_id):
     if not source:
         return jsonify({'message': 'Data source not found'}), 404
     
-    # Delete file if it's a file data source
-    if source.type == 'file' and source.connection_params and 'file_path' in source.connection_params:
-        try:
-            file_path = source.connection_params['file_path']
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception as e:
-            # Log error but continue with deletion
-            print(f"Error deleting file: {str(e)}")
+    # Delete the file and its DuckDB/Parquet copies if it's a file data source
+    if source.type == 'file' and source.connection_params:
+        paths = dict(source.connection_params)
+        if not paths.get('parquet_path') and paths.get('file_path'):
+            # A copy built lazily may not have been recorded
+            paths['parquet_path'] = parquet_path_for(paths['file_path'])
+        for key in ('file_path', 'duckdb_path', 'parquet_path'):
+            try:
+                file_path = paths.get(key)
+                if key == 'duckdb_path' and file_path:
+                    duckdb_manager.close(file_path)
+                if file_path and os.path.exists(file_path):
+                    os.remove(file_path)
+            except Exception as e:
+                # Log error but continue with deletion
+                print(f"Error deleting file: {str(e)}")
+    
+    # Invalidate cache while the dependent datasets can still be found
+    invalidate(SOURCE, source_id)
     
     db.session.delete(source)
     db.session.commit()
     
-    # Invalidate cache
-    cache.delete('data_sources')
-    cache.delete(f'data_source_{source_id}')
+    engine_registry.invalidate(source_id)
+    
+    bump_generation(SOURCE)
     
     return jsonify({'message': 'Data source deleted successfully'}), 200
 
 @data_sources_bp.route('/<source_id>/preview', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=300, key_prefix=lambda: f'data_source_preview_{request.view_args["source_id"]}')
+@cached_view(timeout=300, objects={SOURCE: 'source_id'})
 def preview_data_source(source_id):
     limit = min(request.args.get('limit', 100, type=int), 1000)
     
@@ -216,27 +258,26 @@ def preview_data_source(source_id):
             if not os.path.exists(file_path):
                 return jsonify({'message': 'File not found'}), 404
                 
-            file_type = source.connection_params.get('file_type', 'csv')
+            # Read only the first row groups of the columnar copy
+            parquet_path = ensure_parquet_copy(source)
+            total_rows = source.connection_params.get('rows')
+            
+            # Arrow and columnar JSON are encoded from the Arrow result as is
+            fmt = negotiate_format()
+            if fmt != 'json':
+                table = read_parquet_copy(parquet_path, limit=limit, arrow=True)
+                return table_response(table, fmt, {'total_rows': total_rows if total_rows is not None else table.num_rows})
+            
+            df = read_parquet_copy(parquet_path, limit=limit)
             
-            # Read appropriate number of rows
-            if file_type == 'csv':
-                df = pd.read_csv(file_path, nrows=limit)
-            elif file_type in ['xls', 'xlsx']:
-                df = pd.read_excel(file_path, nrows=limit)
-            elif file_type == 'json':
-                df = pd.read_json(file_path)
-                df = df.head(limit)
-            else:
-                return jsonify({'message': 'Unsupported file type'}), 400
-                
             # Convert to records
             data = {
                 'columns': df.columns.tolist(),
-                'rows': df.to_dict(orient='records'),
+                'rows': JSONRows(df, records=True),
                 'total_rows': source.connection_params.get('rows', len(df))
             }
             
-            return jsonify(data), 200
+            return json_response(data)
         else:
             return jsonify({'message': 'Preview not available for this data source type'}), 400
     except Exception as e:
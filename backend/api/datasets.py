@@ -2,47 +2,56 @@
 import pandas as pd
 import os
 import traceback
+import itertools
 import sqlparse
-from flask import Blueprint, request, jsonify, current_app
+import pyarrow as pa
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy.exc import SQLAlchemyError
-from backend.app import db, cache
+from backend.app import db
 from backend.models import User, Dataset, DataSource
 from backend.utils.data_processor import DataProcessor
+from backend.utils.streaming import STREAM_FORMATS, encode_stream
+from backend.utils.result_cache import result_cache
+from backend.utils.query_jobs import query_jobs, submit_job, cancel_job, COMPLETED
+from backend.utils.cache_keys import cached_view, invalidate, bump_generation, DATASET
+from backend.utils.pagination import paginate_query
+from backend.utils.response_formats import negotiate_format, table_response, json_response
+from backend.utils.json_provider import JSONRows
 
 datasets_bp = Blueprint('datasets', __name__)
 
 @datasets_bp.route('/', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix='datasets')
+@cached_view(timeout=60, kinds=(DATASET,))
 def get_datasets():
-    # Get query parameters for pagination and filtering
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
-    
     try:
-        # Get all datasets without using query.all()
-        # Using db.session.query instead which is more reliable
-        datasets = db.session.query(Dataset).all()
+        # Dataset.query is the dataset's query column, so go through the session
+        query = db.session.query(Dataset)
         
-        # Manual pagination
-        total = len(datasets)
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
+        # Filter by creator and data source if specified
+        created_by = request.args.get('created_by')
+        if created_by:
+            query = query.filter_by(created_by=created_by)
+        source_id = request.args.get('source_id')
+        if source_id:
+            query = query.filter_by(source_id=source_id)
         
-        # Slice the results
-        paginated_datasets = datasets[start_idx:end_idx]
+        # Datasets carrying all the given tags (JSONB containment, GIN-indexed)
+        tags = [tag.strip() for tag in request.args.get('tags', '').split(',') if tag.strip()]
+        if tags:
+            query = query.filter(Dataset.tags.contains(tags))
         
-        # Calculate total pages
-        total_pages = (total + per_page - 1) // per_page
+        # Page in the database rather than loading every dataset
+        try:
+            pagination = paginate_query(query, (Dataset.created_at, Dataset.id), request.args)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         
         # Return paginated results
         return jsonify({
-            'data': [dataset.to_dict() for dataset in paginated_datasets],
-            'total': total,
-            'pages': total_pages,
-            'page': page,
-            'per_page': per_page
+            'data': [dataset.to_dict() for dataset in pagination.pop('items')],
+            **pagination
         }), 200
     except Exception as e:
         current_app.logger.error(f"Error fetching datasets: {str(e)}")
@@ -50,10 +59,9 @@ def get_datasets():
 
 @datasets_bp.route('/<dataset_id>', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix=lambda: f'dataset_{request.view_args["dataset_id"]}')
+@cached_view(timeout=60, objects={DATASET: 'dataset_id'})
 def get_dataset(dataset_id):
-    # Using filter_by instead of get
-    dataset = Dataset.query.filter_by(id=dataset_id).first()
+    dataset = db.session.query(Dataset).filter_by(id=dataset_id).first()
     
     if not dataset:
         return jsonify({'message': 'Dataset not found'}), 404
@@ -107,7 +115,7 @@ def create_dataset():
     db.session.commit()
     
     # Invalidate cache
-    cache.delete('datasets')
+    bump_generation(DATASET)
     
     return jsonify(new_dataset.to_dict()), 201
 
@@ -117,7 +125,7 @@ def update_dataset(dataset_id):
     current_user_id = get_jwt_identity()
     data = request.json
     
-    dataset = Dataset.query.filter_by(id=dataset_id).first()
+    dataset = db.session.query(Dataset).filter_by(id=dataset_id).first()
     if not dataset:
         return jsonify({'message': 'Dataset not found'}), 404
     
@@ -154,9 +162,8 @@ def update_dataset(dataset_id):
     
     db.session.commit()
     
-    # Invalidate cache
-    cache.delete('datasets')
-    cache.delete(f'dataset_{dataset_id}')
+    # Invalidate cache, including everything built from this dataset
+    invalidate(DATASET, dataset_id)
     
     return jsonify(dataset.to_dict()), 200
 
@@ -165,28 +172,28 @@ def update_dataset(dataset_id):
 def delete_dataset(dataset_id):
     current_user_id = get_jwt_identity()
     
-    dataset = Dataset.query.filter_by(id=dataset_id).first()
+    dataset = db.session.query(Dataset).filter_by(id=dataset_id).first()
     if not dataset:
         return jsonify({'message': 'Dataset not found'}), 404
     
+    # Invalidate cache while the dependent charts can still be found
+    invalidate(DATASET, dataset_id)
+    
     db.session.delete(dataset)
     db.session.commit()
     
-    # Invalidate cache
-    cache.delete('datasets')
-    cache.delete(f'dataset_{dataset_id}')
+    bump_generation(DATASET)
     
     return jsonify({'message': 'Dataset deleted successfully'}), 200
 
 @datasets_bp.route('/<dataset_id>/preview', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=120, key_prefix=lambda: f'dataset_preview_{request.view_args["dataset_id"]}')
+@cached_view(timeout=120, objects={DATASET: 'dataset_id'})
 def preview_dataset(dataset_id):
     # Optional parameter for limiting rows
     limit = min(request.args.get('limit', 100, type=int), 1000)
     
-    # Using filter_by instead of get
-    dataset = Dataset.query.filter_by(id=dataset_id).first()
+    dataset = db.session.query(Dataset).filter_by(id=dataset_id).first()
     if not dataset:
         return jsonify({'message': 'Dataset not found'}), 404
     
@@ -202,34 +209,28 @@ def preview_dataset(dataset_id):
             if not os.path.exists(file_path):
                 return jsonify({'message': 'File not found'}), 404
             
-            file_type = source.connection_params.get('file_type', 'csv')
-            
-            # Read the file
-            if file_type == 'csv':
-                df = pd.read_csv(file_path)
-            elif file_type in ['xls', 'xlsx']:
-                df = pd.read_excel(file_path)
-            elif file_type == 'json':
-                df = pd.read_json(file_path)
-            else:
-                return jsonify({'message': 'Unsupported file type'}), 400
-            
-            # Apply query if present
-            if dataset.query:
-                processor = DataProcessor()
-                df = processor.process_query(df, dataset.query)
+            # Run the dataset's query (or a plain table scan) over the columnar copy
+            table_name = dataset.table_name or source.connection_params.get('table_name', 'data')
+            query = dataset.query or f'SELECT * FROM "{table_name}"'
+            processor = DataProcessor(data_source=source)
+            try:
+                table = processor.process_query(query, limit=limit)
+            finally:
+                processor.close()
             
-            # Apply limit
-            df = df.head(limit)
+            # Arrow and columnar JSON are encoded from the Arrow result as is
+            fmt = negotiate_format()
+            if fmt != 'json':
+                return table_response(table, fmt, {'total_rows': table.num_rows})
             
             # Return data
             data = {
-                'columns': df.columns.tolist(),
-                'rows': df.values.tolist(),
-                'total_rows': len(df)
+                'columns': table.column_names,
+                'rows': JSONRows(table),
+                'total_rows': table.num_rows
             }
             
-            return jsonify(data), 200
+            return json_response(data)
         else:
             return jsonify({'message': 'Preview not available for this data source type'}), 400
     
@@ -237,6 +238,115 @@ def preview_dataset(dataset_id):
         traceback.print_exc()
         return jsonify({'message': f'Error previewing dataset: {str(e)}'}), 500
 
+# Keywords (besides DML other than SELECT and DDL) of statements that write,
+# change settings or reach outside the database
+FORBIDDEN_KEYWORDS = {
+    'INTO', 'COPY', 'GRANT', 'REVOKE', 'SET', 'CALL', 'EXECUTE', 'ATTACH', 'DETACH',
+    'INSTALL', 'LOAD', 'PRAGMA', 'EXPORT', 'IMPORT', 'VACUUM', 'CHECKPOINT', 'LOCK'
+}
+
+def _validate_select(query):
+    """
+    Return an error message unless the query is a single SELECT statement
+    that doesn't modify anything (e.g. no data-modifying CTE).
+    """
+    statements = [statement for statement in sqlparse.parse(query) if statement.value.strip().rstrip(';').strip()]
+    if not statements:
+        return 'Invalid SQL query'
+    
+    if len(statements) > 1:
+        return 'Only a single statement is allowed'
+    
+    statement = statements[0]
+    if statement.get_type() != 'SELECT':
+        return 'Only SELECT queries are allowed'
+    
+    for token in statement.flatten():
+        if not token.is_keyword:
+            continue
+        if (
+            (token.ttype in sqlparse.tokens.DML and token.normalized != 'SELECT')
+            or token.ttype in sqlparse.tokens.DDL
+            or token.normalized in FORBIDDEN_KEYWORDS
+        ):
+            return f'Only SELECT queries are allowed ({token.normalized} is not)'
+    
+    return None
+
+def _stream_response(source, query, fmt, filename=None):
+    """
+    Stream a query's result as NDJSON or Arrow IPC, one record batch at a time.
+    
+    The first batch is fetched up front so that connection and query errors
+    still produce a regular JSON error response.
+    """
+    processor = DataProcessor(data_source=source)
+    try:
+        # Whatever the SQL does, it can't write to the source or read files
+        processor.open_user_query()
+    except Exception:
+        processor.close()
+        raise
+    
+    batches = processor.stream_query(query, batch_size=current_app.config['STREAM_BATCH_SIZE'])
+    try:
+        first = next(batches)
+    except Exception:
+        batches.close()
+        processor.close()
+        raise
+    
+    def generate():
+        try:
+            yield from encode_stream(itertools.chain([first], batches), fmt)
+        finally:
+            batches.close()
+            processor.close()
+    
+    # Keep reverse proxies from buffering the whole body before sending it
+    headers = {'X-Accel-Buffering': 'no'}
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[fmt], headers=headers)
+
+@datasets_bp.route('/<dataset_id>/export', methods=['GET'])
+@jwt_required()
+def export_dataset(dataset_id):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in STREAM_FORMATS:
+        return jsonify({'message': f'Format must be one of: {", ".join(STREAM_FORMATS)}'}), 400
+    
+    dataset = db.session.query(Dataset).filter_by(id=dataset_id).first()
+    if not dataset:
+        return jsonify({'message': 'Dataset not found'}), 404
+    
+    source = DataSource.query.filter_by(id=dataset.source_id).first()
+    if not source:
+        return jsonify({'message': 'Data source not found'}), 404
+    
+    try:
+        if source.type == 'file':
+            if not source.connection_params or not os.path.exists(source.connection_params.get('file_path', '')):
+                return jsonify({'message': 'File not found'}), 404
+        
+        table_name = dataset.table_name
+        if source.type == 'file':
+            table_name = table_name or source.connection_params.get('table_name', 'data')
+        
+        if dataset.query:
+            query = dataset.query
+        elif table_name:
+            query = f'SELECT * FROM "{table_name}"'
+        else:
+            return jsonify({'message': 'Dataset has neither a query nor a table'}), 400
+        
+        return _stream_response(source, query, fmt, filename=f'{dataset_id}.{fmt}')
+    
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'message': f'Error exporting dataset: {str(e)}'}), 500
+
 @datasets_bp.route('/execute-query', methods=['POST'])
 @jwt_required()
 def execute_query():
@@ -253,15 +363,10 @@ def execute_query():
         return jsonify({'message': 'Data source not found'}), 404
     
     try:
-        # Parse SQL to check syntax
-        parsed = sqlparse.parse(data.get('query'))
-        if not parsed:
-            return jsonify({'message': 'Invalid SQL query'}), 400
-            
-        # Check if it's a SELECT query
-        statement = parsed[0]
-        if statement.get_type() != 'SELECT':
-            return jsonify({'message': 'Only SELECT queries are allowed'}), 400
+        # Parse SQL and check it's a SELECT query
+        error = _validate_select(data.get('query'))
+        if error:
+            return jsonify({'message': error}), 400
         
         # Execute query
         if source.type == 'file' and source.connection_params and 'file_path' in source.connection_params:
@@ -269,21 +374,28 @@ def execute_query():
             if not os.path.exists(file_path):
                 return jsonify({'message': 'File not found'}), 404
             
-            file_type = source.connection_params.get('file_type', 'csv')
+            # Run the query over the columnar copy, fetching one row past the cap
+            # to tell whether the result was truncated
+            row_limit = current_app.config['QUERY_ROW_LIMIT']
+            processor = DataProcessor(data_source=source)
+            try:
+                processor.open_user_query()
+                result = processor.process_query(data.get('query'), limit=row_limit + 1)
+            finally:
+                processor.close()
+            
+            truncated = result.num_rows > row_limit
             
-            # Read the file
-            if file_type == 'csv':
-                df = pd.read_csv(file_path)
-            elif file_type in ['xls', 'xlsx']:
-                df = pd.read_excel(file_path)
-            elif file_type == 'json':
-                df = pd.read_json(file_path)
-            else:
-                return jsonify({'message': 'Unsupported file type'}), 400
+            fmt = negotiate_format()
+            if fmt != 'json':
+                table = result.slice(0, row_limit)
+                return table_response(table, fmt, {
+                    'total_rows': table.num_rows,
+                    'truncated': truncated,
+                    'schema': [{'name': field.name, 'type': str(field.type)} for field in table.schema]
+                })
             
-            # Apply query
-            processor = DataProcessor()
-            result_df = processor.process_query(df, data.get('query'))
+            result_df = result.slice(0, row_limit).to_pandas()
             
             # Generate schema
             schema = []
@@ -294,15 +406,153 @@ def execute_query():
                 })
             
             # Return result with schema
-            return jsonify({
+            return json_response({
                 'columns': result_df.columns.tolist(),
-                'rows': result_df.head(100).values.tolist(),
+                'rows': JSONRows(result_df),
                 'total_rows': len(result_df),
+                'truncated': truncated,
                 'schema': schema
-            }), 200
+            })
         else:
             return jsonify({'message': 'Query execution not available for this data source type'}), 400
     
     except Exception as e:
         traceback.print_exc()
         return jsonify({'message': f'Error executing query: {str(e)}'}), 500
+
+@datasets_bp.route('/execute-query/stream', methods=['POST'])
+@jwt_required()
+def stream_query():
+    data = request.json
+    
+    if not data.get('source_id'):
+        return jsonify({'message': 'Source ID is required'}), 400
+    
+    if not data.get('query'):
+        return jsonify({'message': 'Query is required'}), 400
+    
+    fmt = data.get('format', 'ndjson')
+    if fmt not in STREAM_FORMATS:
+        return jsonify({'message': f'Format must be one of: {", ".join(STREAM_FORMATS)}'}), 400
+    
+    source = DataSource.query.filter_by(id=data.get('source_id')).first()
+    if not source:
+        return jsonify({'message': 'Data source not found'}), 404
+    
+    try:
+        error = _validate_select(data.get('query'))
+        if error:
+            return jsonify({'message': error}), 400
+        
+        if source.type == 'file':
+            if not source.connection_params or not os.path.exists(source.connection_params.get('file_path', '')):
+                return jsonify({'message': 'File not found'}), 404
+        
+        # Unlike execute-query the result is not capped: rows are sent as
+        # they are fetched, in constant memory
+        return _stream_response(source, data.get('query'), fmt)
+    
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'message': f'Error executing query: {str(e)}'}), 500
+
+def _get_job(job_id):
+    """Load a query job visible to the current user, or an error response."""
+    job = query_jobs.get(job_id)
+    if not job:
+        return None, (jsonify({'message': 'Query job not found'}), 404)
+    
+    current_user_id = get_jwt_identity()
+    if job['submitted_by'] != current_user_id:
+        current_user = User.query.get(current_user_id)
+        if not current_user or current_user.role != 'admin':
+            return None, (jsonify({'message': 'Permission denied'}), 403)
+    
+    return job, None
+
+@datasets_bp.route('/query-jobs', methods=['POST'])
+@jwt_required()
+def submit_query_job():
+    data = request.json
+    
+    if not data.get('source_id'):
+        return jsonify({'message': 'Source ID is required'}), 400
+    
+    if not data.get('query'):
+        return jsonify({'message': 'Query is required'}), 400
+    
+    source = DataSource.query.filter_by(id=data.get('source_id')).first()
+    if not source:
+        return jsonify({'message': 'Data source not found'}), 404
+    
+    error = _validate_select(data.get('query'))
+    if error:
+        return jsonify({'message': error}), 400
+    
+    try:
+        job = submit_job(source, data.get('query'), params=data.get('params'), user_id=get_jwt_identity())
+        return jsonify(job), 202
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'message': f'Error submitting query job: {str(e)}'}), 503
+
+@datasets_bp.route('/query-jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_query_job(job_id):
+    job, error = _get_job(job_id)
+    if error:
+        return error
+    
+    return jsonify(job), 200
+
+@datasets_bp.route('/query-jobs/<job_id>/result', methods=['GET'])
+@jwt_required()
+def get_query_job_result(job_id):
+    job, error = _get_job(job_id)
+    if error:
+        return error
+    
+    if job['status'] != COMPLETED:
+        return jsonify({'message': f'Query job is {job["status"]}', 'status': job['status']}), 409
+    
+    # Results live in the shared result cache
+    df = result_cache.get(job['result_key'])
+    if df is None:
+        return jsonify({'message': 'Query result has expired, please resubmit the query'}), 410
+    
+    fmt = request.args.get('format')
+    if fmt:
+        if fmt not in STREAM_FORMATS:
+            return jsonify({'message': f'Format must be one of: {", ".join(STREAM_FORMATS)}'}), 400
+        
+        batches = pa.Table.from_pandas(df, preserve_index=False).to_batches(current_app.config['STREAM_BATCH_SIZE'])
+        return Response(encode_stream(batches, fmt), mimetype=STREAM_FORMATS[fmt])
+    
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    page = df.iloc[offset:offset + limit]
+    
+    fmt = negotiate_format()
+    if fmt != 'json':
+        table = pa.Table.from_pandas(page, preserve_index=False)
+        return table_response(table, fmt, {'offset': offset, 'total_rows': len(df)})
+    
+    return json_response({
+        'columns': page.columns.tolist(),
+        'rows': JSONRows(page),
+        'offset': offset,
+        'total_rows': len(df)
+    })
+
+@datasets_bp.route('/query-jobs/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_query_job(job_id):
+    job, error = _get_job(job_id)
+    if error:
+        return error
+    
+    try:
+        return jsonify(cancel_job(job_id)), 200
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'message': f'Error cancelling query job: {str(e)}'}), 500
@@ -1,14 +1,15 @@
 
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from backend.app import db, cache
+from backend.app import db
 from backend.models.user import User
+from backend.utils.cache_keys import cached_view, invalidate, USER
 
 users_bp = Blueprint('users', __name__)
 
 @users_bp.route('/', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=60, key_prefix='users')
+@cached_view(timeout=60, kinds=(USER,), per_user=True)
 def get_users():
     current_user_id = get_jwt_identity()
     current_user = User.query.get(current_user_id)
@@ -78,10 +79,7 @@ def update_user(user_id):
     db.session.commit()
     
     # Invalidate cache
-    cache.delete('users')
-    cache.delete(f'user_{user_id}')
-    if hasattr(user, 'username'):
-        cache.delete(f'user_{user.username}')
+    invalidate(USER, user_id)
     
     return jsonify(user.to_dict()), 200
 
@@ -107,10 +105,7 @@ def delete_user(user_id):
     db.session.commit()
     
     # Invalidate cache
-    cache.delete('users')
-    cache.delete(f'user_{user_id}')
-    if hasattr(user, 'username'):
-        cache.delete(f'user_{user.username}')
+    invalidate(USER, user_id)
     
     return jsonify({'message': 'User deleted successfully'}), 200
 
@@ -1,20 +1,46 @@
 
 import os
-from flask import Flask
+from flask import Flask, Request, current_app
 from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_caching import Cache
+from celery import Celery
 
 # Initialize core extensions
 db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 cache = Cache()
+celery = Celery(__name__)
+
+
+class UploadRequest(Request):
+    """
+    Request whose body limit is ``UPLOAD_MAX_CONTENT_LENGTH`` for file
+    uploads and ``MAX_CONTENT_LENGTH`` otherwise. Uploaded files are spooled
+    to disk and ingested in chunks, so they can be far larger than the
+    JSON bodies every other endpoint reads into memory.
+    """
+    upload_endpoints = ('data_sources.create_data_source',)
+
+    @property
+    def max_content_length(self):
+        if not current_app:
+            return None
+        if self.endpoint in self.upload_endpoints and self.mimetype == 'multipart/form-data':
+            return current_app.config['UPLOAD_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
 
 def create_app():
     app = Flask(__name__)
+    app.request_class = UploadRequest
+    
+    # Encode responses with orjson when it is installed
+    from backend.utils.json_provider import FastJSONProvider
+    app.json = FastJSONProvider(app)
     
     # Load configuration
     app.config.update(
@@ -26,7 +52,58 @@ def create_app():
         CACHE_TYPE='redis',
         CACHE_REDIS_URL=os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
         CACHE_DEFAULT_TIMEOUT=300,
-        MAX_CONTENT_LENGTH=16*1024*1024  # 16MB max upload size
+        CELERY_BROKER_URL=os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/1'),
+        CELERY_RESULT_BACKEND=os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/2'),
+        MAX_CONTENT_LENGTH=int(os.getenv('MAX_CONTENT_LENGTH', 16*1024*1024)),  # 16MB max request body by default
+        UPLOAD_MAX_CONTENT_LENGTH=int(os.getenv('UPLOAD_MAX_CONTENT_LENGTH', 10*1024*1024*1024)),  # 10GB max file upload by default
+        INGEST_CHUNK_SIZE=int(os.getenv('INGEST_CHUNK_SIZE', 100000)),  # Rows per chunk when streaming uploads
+        PII_MATCH_THRESHOLD=float(os.getenv('PII_MATCH_THRESHOLD', 0.0)),  # Fraction of sampled values that must match
+        PII_SCAN_EXECUTOR=os.getenv('PII_SCAN_EXECUTOR', 'inline'),  # 'inline', 'thread' or 'process'
+        QUERY_ROW_LIMIT=int(os.getenv('QUERY_ROW_LIMIT', 100)),  # Max rows returned by ad-hoc queries
+        STREAM_BATCH_SIZE=int(os.getenv('STREAM_BATCH_SIZE', 10000)),  # Rows per record batch in streamed results
+        CHART_DATA_ROW_LIMIT=int(os.getenv('CHART_DATA_ROW_LIMIT', 1000)),  # Max groups returned per chart
+        CHART_QUERY_TIMEOUT=int(os.getenv('CHART_QUERY_TIMEOUT', 30)),  # Seconds before a chart query is aborted (interrupted on DuckDB and file sources)
+        CHART_DATA_CACHE_TIMEOUT=int(os.getenv('CHART_DATA_CACHE_TIMEOUT', 300)),  # Seconds chart data stays cached per filter state
+        # In-process tier in front of Redis, and stampede protection
+        TIERED_CACHE_LOCAL_MAX_ENTRIES=int(os.getenv('TIERED_CACHE_LOCAL_MAX_ENTRIES', 1024)),  # Entries kept in each worker's memory
+        TIERED_CACHE_LOCAL_TTL=int(os.getenv('TIERED_CACHE_LOCAL_TTL', 30)),  # Max seconds an entry stays in memory
+        TIERED_CACHE_STALE_TTL=int(os.getenv('TIERED_CACHE_STALE_TTL', 60)),  # Seconds expired entries are served while recomputed
+        TIERED_CACHE_LOCK_TIMEOUT=int(os.getenv('TIERED_CACHE_LOCK_TIMEOUT', 60)),  # Max seconds a recompute lock is held
+        TIERED_CACHE_LOCK_WAIT=int(os.getenv('TIERED_CACHE_LOCK_WAIT', 10)),  # Max seconds to wait for another worker's recompute
+        TIERED_CACHE_EARLY_REFRESH_BETA=float(os.getenv('TIERED_CACHE_EARLY_REFRESH_BETA', 1.0)),  # 0 disables early refresh
+        DASHBOARD_QUERY_WORKERS=int(os.getenv('DASHBOARD_QUERY_WORKERS', 4)),  # Chart queries run concurrently per process
+        DASHBOARD_MERGE_MAX_ROWS=int(os.getenv('DASHBOARD_MERGE_MAX_ROWS', 100000)),  # Merged scans above this run per chart
+        # Pre-aggregated rollups of the dimensions charts group by
+        ROLLUPS_ENABLED=os.getenv('ROLLUPS_ENABLED', 'true').lower() == 'true',
+        ROLLUP_DIR=os.getenv('ROLLUP_DIR', os.path.join(app.root_path, 'rollups')),
+        ROLLUP_REFRESH_INTERVAL=int(os.getenv('ROLLUP_REFRESH_INTERVAL', 60*60)),  # Seconds between scheduled rebuilds
+        ROLLUP_MAX_ROWS=int(os.getenv('ROLLUP_MAX_ROWS', 1000000)),  # Larger rollups aren't kept
+        ROLLUP_MAX_PER_DATASET=int(os.getenv('ROLLUP_MAX_PER_DATASET', 5)),  # Most used dimension sets materialized per dataset
+        ROLLUP_MAX_AGE=int(os.getenv('ROLLUP_MAX_AGE', 2*60*60)),  # Seconds a rollup is used after it was built; 0 for no limit
+        # Random samples of large datasets for approximate chart data
+        SAMPLES_ENABLED=os.getenv('SAMPLES_ENABLED', 'true').lower() == 'true',
+        SAMPLE_DIR=os.getenv('SAMPLE_DIR', os.path.join(app.root_path, 'samples')),
+        SAMPLE_REFRESH_INTERVAL=int(os.getenv('SAMPLE_REFRESH_INTERVAL', 6*60*60)),  # Seconds between scheduled redraws
+        SAMPLE_ROWS=int(os.getenv('SAMPLE_ROWS', 1000000)),  # Rows drawn for a uniform sample
+        SAMPLE_STRATUM_ROWS=int(os.getenv('SAMPLE_STRATUM_ROWS', 10000)),  # Rows drawn per value in a stratified sample
+        SAMPLE_MAX_STRATA=int(os.getenv('SAMPLE_MAX_STRATA', 100)),  # Columns with more values aren't stratified over
+        SAMPLE_MIN_ROWS=int(os.getenv('SAMPLE_MIN_ROWS', 5000000)),  # Smaller datasets aren't sampled
+        SAMPLE_MAX_AGE=int(os.getenv('SAMPLE_MAX_AGE', 24*60*60)),  # Seconds a sample is used after it was drawn; 0 for no limit
+        # Query result cache shared by charts and dataset reads
+        RESULT_CACHE_BACKEND=os.getenv('RESULT_CACHE_BACKEND', 'redis'),  # 'redis', 'local' or 'none'
+        RESULT_CACHE_TTL=int(os.getenv('RESULT_CACHE_TTL', 600)),
+        RESULT_CACHE_MAX_BYTES=int(os.getenv('RESULT_CACHE_MAX_BYTES', 256*1024*1024)),  # Compressed bytes before LRU eviction
+        RESULT_CACHE_MAX_ENTRY_BYTES=int(os.getenv('RESULT_CACHE_MAX_ENTRY_BYTES', 32*1024*1024)),  # Larger results aren't cached
+        # Asynchronous query jobs
+        QUERY_JOB_TIMEOUT=int(os.getenv('QUERY_JOB_TIMEOUT', 300)),  # Seconds before a running query is aborted
+        QUERY_JOB_SOURCE_CONCURRENCY=int(os.getenv('QUERY_JOB_SOURCE_CONCURRENCY', 4)),  # Concurrent jobs per data source
+        QUERY_JOB_TTL=int(os.getenv('QUERY_JOB_TTL', 24*60*60)),  # Seconds job status is kept
+        # Connection pools for external (postgresql/mysql) data sources
+        SOURCE_POOL_SIZE=int(os.getenv('SOURCE_POOL_SIZE', 5)),
+        SOURCE_POOL_MAX_OVERFLOW=int(os.getenv('SOURCE_POOL_MAX_OVERFLOW', 10)),
+        SOURCE_POOL_TIMEOUT=int(os.getenv('SOURCE_POOL_TIMEOUT', 30)),
+        SOURCE_POOL_RECYCLE=int(os.getenv('SOURCE_POOL_RECYCLE', 1800)),
+        SOURCE_POOL_PRE_PING=os.getenv('SOURCE_POOL_PRE_PING', 'true').lower() == 'true'
     )
     
     # Enable CORS
@@ -34,9 +111,45 @@ def create_app():
     
     # Initialize extensions with app
     db.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(app, db, directory=os.path.join(os.path.dirname(__file__), 'migrations'))
     jwt.init_app(app)
     cache.init_app(app)
+    celery.conf.update(
+        broker_url=app.config['CELERY_BROKER_URL'],
+        result_backend=app.config['CELERY_RESULT_BACKEND'],
+        beat_schedule={
+            **({
+                'refresh-rollups': {
+                    'task': 'rollups.refresh',
+                    'schedule': app.config['ROLLUP_REFRESH_INTERVAL']
+                }
+            } if app.config['ROLLUPS_ENABLED'] else {}),
+            **({
+                'refresh-samples': {
+                    'task': 'samples.refresh',
+                    'schedule': app.config['SAMPLE_REFRESH_INTERVAL']
+                }
+            } if app.config['SAMPLES_ENABLED'] else {})
+        }
+    )
+    
+    from backend.utils.engine_registry import engine_registry
+    engine_registry.init_app(app)
+    
+    from backend.utils.result_cache import result_cache
+    result_cache.init_app(app)
+    
+    from backend.utils.query_jobs import query_jobs
+    query_jobs.init_app(app)
+    
+    from backend.utils.tiered_cache import tiered_cache
+    tiered_cache.init_app(app)
+    
+    from backend.utils.rollups import rollups
+    rollups.init_app(app)
+    
+    from backend.utils.sampling import samples
+    samples.init_app(app)
     
     # Register blueprints
     from backend.api.auth import auth_bp
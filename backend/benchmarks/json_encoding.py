@@ -0,0 +1,85 @@
+"""
+Benchmark encoding DataFrame rows as JSON with ``FastJSONProvider`` against
+Flask's default provider, on preview-sized and export-sized frames.
+
+Usage:
+    python -m backend.benchmarks.json_encoding [preview_rows] [export_rows] [repeat]
+"""
+import os
+import sys
+import time
+import json
+import numpy as np
+import pandas as pd
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.utils import json_provider
+from backend.utils.json_provider import FastJSONProvider, JSONRows
+
+
+def make_frame(rows, seed=0):
+    """A frame with the column kinds query results hold, NaN included."""
+    rng = np.random.default_rng(seed)
+    quantity = rng.integers(0, 10000, rows).astype(float)
+    quantity[rng.random(rows) < 0.05] = np.nan
+
+    return pd.DataFrame({
+        'id': np.arange(rows),
+        'quantity': quantity,
+        'price': rng.random(rows) * 1000,
+        'region': rng.choice(['north', 'south', 'east', 'west'], rows),
+        'product': rng.choice([f'product-{i}' for i in range(5000)], rows),
+        'is_member': rng.random(rows) < 0.5,
+        'shipped_at': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 10 ** 6, rows), unit='s'),
+    })
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(label, df, repeat):
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+
+    cases = {
+        'default provider, values.tolist()': lambda: default.dumps({'rows': df.values.tolist()}),
+        'fast provider, values.tolist()': lambda: fast.dumps({'rows': df.values.tolist()}),
+        'fast provider, JSONRows': lambda: fast.dumps({'rows': JSONRows(df)}),
+        'default provider, records': lambda: default.dumps({'rows': df.to_dict(orient='records')}),
+        'fast provider, JSONRows records': lambda: fast.dumps({'rows': JSONRows(df, records=True)}),
+    }
+
+    print(f"{label}: rows={len(df)} columns={len(df.columns)} repeat={repeat}")
+    baseline = None
+    for name, fn in cases.items():
+        seconds = timed(fn, repeat)
+        if name.startswith('default'):
+            baseline = seconds
+        print(f"  {name:<36} {seconds:.4f}s  {baseline / seconds:.1f}x")
+
+    # The direct path encodes the same rows, with null for NaN
+    expected = df.astype(object).where(df.notna(), None)
+    expected['shipped_at'] = df['shipped_at'].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    if json.loads(fast.dumps(JSONRows(df))) != expected.values.tolist():
+        print("  JSONRows output differs from the frame")
+
+
+def main(preview_rows=1000, export_rows=1000000, repeat=3):
+    print(f"encoder: {'orjson' if json_provider.orjson is not None else 'json'}")
+    run('preview', make_frame(preview_rows), max(repeat, 10))
+    run('export', make_frame(export_rows), repeat)
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    main(*args)
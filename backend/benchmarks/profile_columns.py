@@ -0,0 +1,131 @@
+"""
+Benchmark the vectorized column profiler against the previous per-value
+implementation of ``detect_column_types``.
+
+Usage:
+    python -m backend.benchmarks.profile_columns [rows] [repeat]
+"""
+import os
+import re
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.utils.data_ingestion import detect_column_types
+
+
+def legacy_detect_column_types(df):
+    """The per-value implementation that ``profile_columns`` replaced."""
+    schema = []
+
+    for column in df.columns:
+        col_data = df[column]
+        col_info = {
+            'name': column,
+            'original_type': str(col_data.dtype),
+            'nullable': col_data.isna().any()
+        }
+
+        non_null_values = col_data.dropna()
+
+        if len(non_null_values) == 0:
+            col_info['suggested_type'] = 'string'
+        elif pd.api.types.is_numeric_dtype(col_data):
+            if pd.api.types.is_integer_dtype(col_data) or all(v.is_integer() for v in non_null_values if not pd.isna(v)):
+                col_info['suggested_type'] = 'integer'
+            else:
+                col_info['suggested_type'] = 'float'
+        elif pd.api.types.is_datetime64_dtype(col_data):
+            col_info['suggested_type'] = 'timestamp'
+        elif _legacy_is_date(non_null_values):
+            col_info['suggested_type'] = 'date'
+        elif _legacy_is_boolean(non_null_values):
+            col_info['suggested_type'] = 'boolean'
+        else:
+            col_info['suggested_type'] = 'string'
+            if len(non_null_values.unique()) < min(10, len(non_null_values) * 0.1):
+                col_info['suggested_type'] = 'categorical'
+
+        schema.append(col_info)
+
+    return schema
+
+
+def _legacy_is_date(series):
+    sample = series.sample(min(100, len(series)))
+    date_patterns = [
+        r'^\d{4}-\d{2}-\d{2}$',
+        r'^\d{2}/\d{2}/\d{4}$',
+        r'^\d{2}-\d{2}-\d{4}$',
+        r'^\d{4}/\d{2}/\d{2}$',
+        r'^\d{1,2}\s+[A-Za-z]{3}\s+\d{4}$'
+    ]
+    match_count = 0
+    for value in sample:
+        if isinstance(value, str):
+            if any(re.match(pattern, value) for pattern in date_patterns):
+                match_count += 1
+    return match_count >= 0.9 * len(sample)
+
+
+def _legacy_is_boolean(series):
+    str_values = [str(v).lower() for v in series]
+    true_values = ['true', 't', 'yes', 'y', '1']
+    false_values = ['false', 'f', 'no', 'n', '0']
+    return all(v in true_values + false_values for v in str_values)
+
+
+def make_frame(rows, seed=0):
+    """A wide frame mixing the column kinds seen in typical uploads."""
+    rng = np.random.default_rng(seed)
+    whole_floats = rng.integers(0, 10000, rows).astype(float)
+    whole_floats[rng.random(rows) < 0.05] = np.nan
+
+    return pd.DataFrame({
+        'id': np.arange(rows),
+        'quantity': whole_floats,
+        'price': rng.random(rows) * 1000,
+        'discount': rng.random(rows),
+        'order_date': pd.Series(pd.date_range('2020-01-01', periods=365).strftime('%Y-%m-%d')).sample(rows, replace=True, random_state=seed).to_numpy(),
+        'shipped_at': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 10 ** 6, rows), unit='s'),
+        'is_member': rng.choice(['yes', 'no'], rows),
+        'region': rng.choice(['north', 'south', 'east', 'west'], rows),
+        'product': rng.choice([f'product-{i}' for i in range(5000)], rows),
+        'notes': rng.choice(['', 'gift', 'fragile', 'express', 'returned'], rows),
+    })
+
+
+def timed(fn, df, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(rows=1000000, repeat=3):
+    df = make_frame(rows)
+
+    legacy = timed(legacy_detect_column_types, df, repeat)
+    vectorized = timed(detect_column_types, df, repeat)
+
+    legacy_types = {c['name']: c['suggested_type'] for c in legacy_detect_column_types(df)}
+    new_types = {c['name']: c['suggested_type'] for c in detect_column_types(df)}
+
+    print(f"rows={rows} columns={len(df.columns)} repeat={repeat}")
+    print(f"legacy detect_column_types: {legacy:.3f}s")
+    print(f"vectorized profiler:        {vectorized:.3f}s")
+    print(f"speedup:                    {legacy / vectorized:.1f}x")
+
+    mismatches = {k: (legacy_types[k], new_types[k]) for k in legacy_types if legacy_types[k] != new_types[k]}
+    if mismatches:
+        print(f"suggested_type differences: {mismatches}")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
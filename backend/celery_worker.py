@@ -1,15 +1,9 @@
 
-from celery import Celery
-from backend.app import create_app
+from backend.app import create_app, celery
 
 def make_celery(app):
-    celery = Celery(
-        app.import_name,
-        backend=app.config['CELERY_RESULT_BACKEND'],
-        broker=app.config['CELERY_BROKER_URL']
-    )
-    celery.conf.update(app.config)
-    
+    # The broker and result backend are configured by create_app, which the
+    # web processes share so they can queue tasks
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
             with app.app_context():
@@ -20,3 +14,6 @@ def make_celery(app):
 
 app = create_app()
 celery = make_celery(app)
+
+# Register the tasks once every task runs inside the app context
+import backend.tasks  # noqa: E402,F401
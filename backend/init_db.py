@@ -7,6 +7,7 @@ from datetime import datetime
 # Add the parent directory to sys.path to make backend imports work
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from flask_migrate import stamp
 from backend.app import create_app, db
 from backend.models import User, DataSource, Dataset, Chart, Dashboard
 
@@ -18,6 +19,9 @@ def init_db():
         # Create tables
         db.create_all()
         
+        # The tables already have every index; mark migrations as applied
+        stamp()
+        
         # Create admin user if it doesn't exist
         admin = User.query.filter_by(username='admin').first()
         
@@ -0,0 +1,52 @@
+"""add indexes for list pagination and filtering
+
+Revision ID: 3f9c2a7d41b8
+Revises:
+Create Date: 2026-10-17 02:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b8'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_data_sources_created_at_id', 'data_sources', ['created_at', 'id']),
+    ('ix_data_sources_created_by', 'data_sources', ['created_by']),
+    ('ix_data_sources_type', 'data_sources', ['type']),
+    ('ix_datasets_created_at_id', 'datasets', ['created_at', 'id']),
+    ('ix_datasets_created_by', 'datasets', ['created_by']),
+    ('ix_datasets_source_id', 'datasets', ['source_id']),
+    ('ix_charts_created_at_id', 'charts', ['created_at', 'id']),
+    ('ix_charts_created_by', 'charts', ['created_by']),
+    ('ix_charts_dataset_id', 'charts', ['dataset_id']),
+    ('ix_dashboards_created_at_id', 'dashboards', ['created_at', 'id']),
+    ('ix_dashboards_created_by', 'dashboards', ['created_by']),
+    ('ix_dashboard_charts_dashboard_id', 'dashboard_charts', ['dashboard_id']),
+    ('ix_dashboard_charts_chart_id', 'dashboard_charts', ['chart_id']),
+    ('ix_dashboard_comments_threads', 'dashboard_comments', ['dashboard_id', 'parent_id', 'created_at', 'id']),
+    ('ix_dashboard_comments_parent_id', 'dashboard_comments', ['parent_id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+    op.create_index(
+        'ix_datasets_tags', 'datasets', ['tags'], unique=False,
+        postgresql_using='gin', postgresql_ops={'tags': 'jsonb_path_ops'}
+    )
+
+
+def downgrade():
+    op.drop_index('ix_datasets_tags', table_name='datasets')
+
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,39 @@
+"""add rollups catalog
+
+Revision ID: 8d1e4b6f2a93
+Revises: 3f9c2a7d41b8
+Create Date: 2026-10-17 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8d1e4b6f2a93'
+down_revision = '3f9c2a7d41b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'rollups',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('dataset_id', sa.String(length=36), nullable=False),
+        sa.Column('key', sa.String(length=16), nullable=False),
+        sa.Column('dimensions', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('measures', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('path', sa.String(length=512), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=True),
+        sa.Column('source_version', sa.String(length=16), nullable=True),
+        sa.Column('built_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['dataset_id'], ['datasets.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('dataset_id', 'key', name='uq_rollups_dataset_id_key')
+    )
+
+
+def downgrade():
+    op.drop_table('rollups')
@@ -0,0 +1,38 @@
+"""add samples catalog
+
+Revision ID: c5a7e2d90b14
+Revises: 8d1e4b6f2a93
+Create Date: 2026-10-17 11:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a7e2d90b14'
+down_revision = '8d1e4b6f2a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'samples',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('dataset_id', sa.String(length=36), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('strata', sa.String(length=255), nullable=True),
+        sa.Column('path', sa.String(length=512), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=True),
+        sa.Column('base_row_count', sa.BigInteger(), nullable=True),
+        sa.Column('source_version', sa.String(length=16), nullable=True),
+        sa.Column('built_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['dataset_id'], ['datasets.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('dataset_id', 'kind', name='uq_samples_dataset_id_kind')
+    )
+
+
+def downgrade():
+    op.drop_table('samples')
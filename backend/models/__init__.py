@@ -1,4 +1,4 @@
 
 from backend.models.user import User
-from backend.models.data import DataSource, Dataset
+from backend.models.data import DataSource, Dataset, Rollup, Sample
 from backend.models.visualization import Chart, Dashboard, DashboardChart, DashboardComment
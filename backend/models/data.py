@@ -6,6 +6,11 @@ from backend.app import db
 
 class DataSource(db.Model):
     __tablename__ = 'data_sources'
+    __table_args__ = (
+        db.Index('ix_data_sources_created_at_id', 'created_at', 'id'),
+        db.Index('ix_data_sources_created_by', 'created_by'),
+        db.Index('ix_data_sources_type', 'type'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(64), nullable=False)
@@ -32,6 +37,13 @@ class DataSource(db.Model):
 
 class Dataset(db.Model):
     __tablename__ = 'datasets'
+    __table_args__ = (
+        db.Index('ix_datasets_created_at_id', 'created_at', 'id'),
+        db.Index('ix_datasets_created_by', 'created_by'),
+        db.Index('ix_datasets_source_id', 'source_id'),
+        # Serves tag containment filters (tags @> '["sales"]')
+        db.Index('ix_datasets_tags', 'tags', postgresql_using='gin', postgresql_ops={'tags': 'jsonb_path_ops'}),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(64), nullable=False)
@@ -63,3 +75,60 @@ class Dataset(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+
+
+class Rollup(db.Model):
+    """A dataset pre-aggregated over some of its columns, stored as Parquet."""
+    __tablename__ = 'rollups'
+    __table_args__ = (
+        db.UniqueConstraint('dataset_id', 'key', name='uq_rollups_dataset_id_key'),
+    )
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    dataset_id = db.Column(db.String(36), db.ForeignKey('datasets.id', ondelete='CASCADE'), nullable=False)
+    key = db.Column(db.String(16), nullable=False)  # Hash of the dimensions
+    dimensions = db.Column(JSONB)  # Columns grouped by
+    measures = db.Column(JSONB)  # Stored parts (sum, count, min, max) per column
+    path = db.Column(db.String(512), nullable=False)
+    row_count = db.Column(db.Integer)
+    source_version = db.Column(db.String(16))  # Version of the source data it was built from
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'dataset_id': self.dataset_id,
+            'dimensions': self.dimensions,
+            'measures': self.measures,
+            'row_count': self.row_count,
+            'built_at': self.built_at.isoformat() if self.built_at else None
+        }
+
+
+class Sample(db.Model):
+    """A random sample of a dataset's rows, stored as Parquet with a weight per row."""
+    __tablename__ = 'samples'
+    __table_args__ = (
+        db.UniqueConstraint('dataset_id', 'kind', name='uq_samples_dataset_id_kind'),
+    )
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    dataset_id = db.Column(db.String(36), db.ForeignKey('datasets.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # uniform or stratified
+    strata = db.Column(db.String(255))  # Column a stratified sample is drawn per value of
+    path = db.Column(db.String(512), nullable=False)
+    row_count = db.Column(db.Integer)
+    base_row_count = db.Column(db.BigInteger)
+    source_version = db.Column(db.String(16))  # Version of the source data it was drawn from
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'dataset_id': self.dataset_id,
+            'kind': self.kind,
+            'strata': self.strata,
+            'row_count': self.row_count,
+            'base_row_count': self.base_row_count,
+            'built_at': self.built_at.isoformat() if self.built_at else None
+        }
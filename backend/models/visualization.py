@@ -6,6 +6,11 @@ from backend.app import db
 
 class Chart(db.Model):
     __tablename__ = 'charts'
+    __table_args__ = (
+        db.Index('ix_charts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_charts_created_by', 'created_by'),
+        db.Index('ix_charts_dataset_id', 'dataset_id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(64), nullable=False)
@@ -20,7 +25,16 @@ class Chart(db.Model):
     
     dashboard_charts = db.relationship('DashboardChart', backref='chart', lazy='dynamic', cascade='all, delete-orphan')
     
-    def to_dict(self):
+    def to_dict(self, summary=False):
+        if summary:
+            # Enough to list and place the chart, without its configuration
+            return {
+                'id': self.id,
+                'name': self.name,
+                'dataset_id': self.dataset_id,
+                'chart_type': self.chart_type
+            }
+        
         return {
             'id': self.id,
             'name': self.name,
@@ -37,6 +51,10 @@ class Chart(db.Model):
 
 class Dashboard(db.Model):
     __tablename__ = 'dashboards'
+    __table_args__ = (
+        db.Index('ix_dashboards_created_at_id', 'created_at', 'id'),
+        db.Index('ix_dashboards_created_by', 'created_by'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(64), nullable=False)
@@ -49,10 +67,10 @@ class Dashboard(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    charts = db.relationship('DashboardChart', backref='dashboard', lazy='dynamic', cascade='all, delete-orphan')
+    charts = db.relationship('DashboardChart', backref='dashboard', lazy='select', cascade='all, delete-orphan')
     comments = db.relationship('DashboardComment', backref='dashboard', lazy='dynamic', cascade='all, delete-orphan')
     
-    def to_dict(self):
+    def to_dict(self, summary=False):
         return {
             'id': self.id,
             'name': self.name,
@@ -64,12 +82,16 @@ class Dashboard(db.Model):
             'created_by': self.created_by,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'charts': [chart.to_dict() for chart in self.charts]
+            'charts': [chart.to_dict(summary=summary) for chart in self.charts]
         }
 
 
 class DashboardChart(db.Model):
     __tablename__ = 'dashboard_charts'
+    __table_args__ = (
+        db.Index('ix_dashboard_charts_dashboard_id', 'dashboard_id'),
+        db.Index('ix_dashboard_charts_chart_id', 'chart_id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     dashboard_id = db.Column(db.String(36), db.ForeignKey('dashboards.id'), nullable=False)
@@ -78,18 +100,23 @@ class DashboardChart(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
+    def to_dict(self, summary=False):
         return {
             'id': self.id,
             'dashboard_id': self.dashboard_id,
             'chart_id': self.chart_id,
             'position': self.position,
-            'chart': self.chart.to_dict() if self.chart else None
+            'chart': self.chart.to_dict(summary=summary) if self.chart else None
         }
 
 
 class DashboardComment(db.Model):
     __tablename__ = 'dashboard_comments'
+    __table_args__ = (
+        # Serves pages of a dashboard's threads, ordered by creation
+        db.Index('ix_dashboard_comments_threads', 'dashboard_id', 'parent_id', 'created_at', 'id'),
+        db.Index('ix_dashboard_comments_parent_id', 'parent_id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     dashboard_id = db.Column(db.String(36), db.ForeignKey('dashboards.id'), nullable=False)
@@ -103,8 +130,8 @@ class DashboardComment(db.Model):
     user = db.relationship('User')
     replies = db.relationship('DashboardComment', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
     
-    def to_dict(self):
-        return {
+    def to_dict(self, include_replies=True):
+        data = {
             'id': self.id,
             'dashboard_id': self.dashboard_id,
             'user': self.user.to_dict(),
@@ -112,6 +139,8 @@ class DashboardComment(db.Model):
             'position': self.position,
             'parent_id': self.parent_id,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'replies': [reply.to_dict() for reply in self.replies]
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_replies:
+            data['replies'] = [reply.to_dict() for reply in self.replies]
+        return data
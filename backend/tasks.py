@@ -0,0 +1,36 @@
+from backend.app import celery, cache
+from backend.utils.query_jobs import run_job, SourceBusyError, SOURCE_BUSY_RETRY_DELAY
+from backend.utils.rollups import rollups
+from backend.utils.sampling import samples
+
+# Longest a rollup or sample refresh may keep others from starting
+ROLLUP_REFRESH_LOCK_TIMEOUT = 60 * 60
+SAMPLE_REFRESH_LOCK_TIMEOUT = 6 * 60 * 60
+
+@celery.task(bind=True, name='query_jobs.run', max_retries=None)
+def run_query_job(self, job_id):
+    """Run an asynchronous query job, waiting for a free slot on its source."""
+    try:
+        run_job(job_id)
+    except SourceBusyError as e:
+        raise self.retry(exc=e, countdown=SOURCE_BUSY_RETRY_DELAY)
+
+@celery.task(name='rollups.refresh')
+def refresh_rollups():
+    """Rebuild rollups on the beat schedule; skipped while a refresh is running."""
+    if not cache.add('lock:rollups.refresh', 1, timeout=ROLLUP_REFRESH_LOCK_TIMEOUT):
+        return None
+    try:
+        return rollups.refresh()
+    finally:
+        cache.delete('lock:rollups.refresh')
+
+@celery.task(name='samples.refresh')
+def refresh_samples():
+    """Redraw dataset samples on the beat schedule; skipped while a refresh is running."""
+    if not cache.add('lock:samples.refresh', 1, timeout=SAMPLE_REFRESH_LOCK_TIMEOUT):
+        return None
+    try:
+        return samples.refresh()
+    finally:
+        cache.delete('lock:samples.refresh')
@@ -0,0 +1,52 @@
+import os
+import sys
+import pytest
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.ext.compiler import compiles
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+
+# The models' PostgreSQL column types, stored as JSON on SQLite
+@compiles(JSONB, 'sqlite')
+@compiles(ARRAY, 'sqlite')
+def _compile_json(type_, compiler, **kw):
+    return 'JSON'
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setenv('RESULT_CACHE_BACKEND', 'none')
+
+    from backend.app import create_app, db, cache
+    app = create_app()
+    app.config['CACHE_TYPE'] = 'NullCache'
+    cache.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def user_id(app):
+    from backend.app import db
+    from backend.models import User
+
+    user = User(username='owner', email='owner@example.com')
+    user.password = 'password'
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+@pytest.fixture
+def client(app, user_id):
+    from flask_jwt_extended import create_access_token
+
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {create_access_token(identity=user_id)}'
+    return client
@@ -0,0 +1,100 @@
+"""
+The dashboard list, detail and export endpoints load dashboards with their
+charts in a fixed number of queries, however many charts there are.
+"""
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture
+def make_dashboards(app, user_id):
+    from backend.app import db
+    from backend.models import DataSource, Dataset, Dashboard, Chart, DashboardChart
+
+    source = DataSource(name='source', type='file', connection_params={}, created_by=user_id)
+    db.session.add(source)
+    db.session.commit()
+
+    dataset = Dataset(name='dataset', source_id=source.id, created_by=user_id)
+    db.session.add(dataset)
+    db.session.commit()
+    dataset_id = dataset.id
+
+    def make(count, charts):
+        dashboards = []
+        for i in range(count):
+            dashboard = Dashboard(name=f'dashboard {i}', created_by=user_id)
+            db.session.add(dashboard)
+            db.session.flush()
+            for j in range(charts):
+                chart = Chart(
+                    name=f'chart {i}.{j}', dataset_id=dataset_id, chart_type='bar',
+                    configuration={'xAxis': 'x', 'yAxis': 'y'}, created_by=user_id
+                )
+                db.session.add(chart)
+                db.session.flush()
+                db.session.add(DashboardChart(dashboard_id=dashboard.id, chart_id=chart.id, position={'x': j}))
+            dashboards.append(dashboard)
+        db.session.commit()
+        return [dashboard.id for dashboard in dashboards]
+
+    return make
+
+
+@contextmanager
+def count_queries():
+    """Count the statements run on the database inside the block."""
+    from backend.app import db
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def queries_for(client, url):
+    from backend.app import db
+    from backend.utils.tiered_cache import tiered_cache
+
+    # Nothing the request needs should come from a cache or the session's
+    # identity map
+    tiered_cache.local.clear()
+    db.session.expunge_all()
+    with count_queries() as statements:
+        response = client.get(url)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return len(statements)
+
+
+@pytest.mark.parametrize('view', ['full', 'summary'])
+def test_dashboard_list_queries(client, make_dashboards, view):
+    make_dashboards(5, charts=1)
+    few = queries_for(client, f'/api/dashboards/?per_page=100&view={view}')
+
+    make_dashboards(95, charts=5)
+    many = queries_for(client, f'/api/dashboards/?per_page=100&view={view}')
+
+    # Page count, the dashboards, and their charts in one IN query
+    assert few == many == 3
+
+
+def test_dashboard_detail_queries(client, make_dashboards):
+    few, many = make_dashboards(1, charts=1) + make_dashboards(1, charts=50)
+
+    assert queries_for(client, f'/api/dashboards/{few}') == 2
+    assert queries_for(client, f'/api/dashboards/{many}') == 2
+
+
+def test_dashboard_export_queries(client, make_dashboards):
+    few, many = make_dashboards(1, charts=1) + make_dashboards(1, charts=50)
+
+    assert queries_for(client, f'/api/dashboards/{few}/export') == 2
+    assert queries_for(client, f'/api/dashboards/{many}/export') == 2
@@ -0,0 +1,35 @@
+"""
+Filters pushed into a file source's Arrow scan keep every row the same
+filters keep in DuckDB SQL.
+"""
+import duckdb
+import pyarrow as pa
+import pyarrow.dataset as pa_ds
+import pytest
+from backend.utils.filters import compile_where, filter_dataset
+
+VALUES = ['a\\x', 'a%', 'a\\%', 'a_b', 'a\\_b', 'a\\b', 'ab', 'a\\\\b', None]
+
+
+def sql_rows(table, filters):
+    where, params = compile_where(filters, 'duckdb')
+    conn = duckdb.connect()
+    try:
+        conn.register('data', table)
+        return sorted(row[0] for row in conn.execute(f'SELECT name FROM data {where}', params).fetchall())
+    finally:
+        conn.close()
+
+
+def pushdown_rows(table, filters):
+    dataset = filter_dataset(pa_ds.dataset(table), filters)
+    return sorted(value for value in dataset.to_table()['name'].to_pylist() if value is not None)
+
+
+@pytest.mark.parametrize('op', ['like', 'not like'])
+@pytest.mark.parametrize('pattern', ['a\\%', 'a\\_b', 'a\\b', 'a\\\\b', 'a%', 'a_b', '%\\%'])
+def test_like_pushdown_matches_sql(op, pattern):
+    table = pa.table({'name': VALUES})
+    filters = [('name', op, pattern)]
+
+    assert pushdown_rows(table, filters) == sql_rows(table, filters)
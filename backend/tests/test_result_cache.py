@@ -0,0 +1,31 @@
+"""
+Queries differing only in spelling share a result cache entry; queries
+that can return different rows never do.
+"""
+import pytest
+from backend.models import DataSource
+from backend.utils.result_cache import ResultCache, fingerprint
+
+
+@pytest.mark.parametrize('a, b', [
+    ("SELECT a FROM t WHERE a = 'x  y'", "SELECT a FROM t WHERE a = 'x y'"),
+    ("SELECT a FROM t WHERE a = 'x\ny'", "SELECT a FROM t WHERE a = 'x y'"),
+    ('SELECT "a  b" FROM t', 'SELECT "a b" FROM t'),
+    ("SELECT a FROM t WHERE a = 'select'", "SELECT a FROM t WHERE a = 'SELECT'"),
+    ('SELECT 1; SELECT 2', 'SELECT 1'),
+])
+def test_different_queries_get_different_keys(a, b):
+    source = DataSource(id='source', type='duckdb', connection_params={'path': 'source.duckdb'})
+    cache = ResultCache()
+
+    assert fingerprint(a) != fingerprint(b)
+    assert cache.key_for(source, a) != cache.key_for(source, b)
+
+
+@pytest.mark.parametrize('a, b', [
+    ('select a\n  from t', 'SELECT a FROM t'),
+    ('SELECT a FROM t -- latest\n', 'SELECT a FROM t;'),
+    ('SELECT a /* all */ FROM t', 'SELECT a FROM t'),
+])
+def test_spellings_of_one_query_share_a_key(a, b):
+    assert fingerprint(a) == fingerprint(b)
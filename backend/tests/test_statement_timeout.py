@@ -0,0 +1,36 @@
+"""
+Chart queries on DuckDB-backed sources, which have no server-side statement
+timeout, are interrupted once they run for ``statement_timeout`` seconds.
+"""
+import time
+import duckdb
+import pytest
+
+
+@pytest.fixture
+def source(app, tmp_path):
+    from backend.models import DataSource
+
+    path = str(tmp_path / 'source.duckdb')
+    with duckdb.connect(path) as conn:
+        conn.execute("CREATE TABLE numbers AS SELECT range AS n FROM range(10)")
+    yield DataSource(id='source', type='duckdb', connection_params={'path': path})
+
+    from backend.utils.duckdb_manager import duckdb_manager
+    duckdb_manager.close(path)
+
+
+def test_slow_duckdb_query_is_interrupted(source):
+    from backend.utils.data_processor import DataProcessor
+
+    processor = DataProcessor(data_source=source, statement_timeout=0.5)
+    try:
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            processor.direct_query("SELECT SUM(hash(range)) FROM range(100000000000)")
+        assert time.monotonic() - started < 10
+
+        # The connection stays usable for the next query
+        assert processor.direct_query("SELECT COUNT(*) AS c FROM numbers")['c'][0] == 10
+    finally:
+        processor.close()
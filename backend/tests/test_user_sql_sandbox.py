@@ -0,0 +1,81 @@
+"""
+User SQL over DuckDB sources runs in a sandbox: it reads the source's own
+tables, but can't read other files on the server.
+"""
+import json
+import duckdb
+import pytest
+
+
+@pytest.fixture
+def duckdb_source(app, user_id, tmp_path):
+    from backend.app import db
+    from backend.models import DataSource
+
+    path = str(tmp_path / 'source.duckdb')
+    with duckdb.connect(path) as conn:
+        conn.execute("CREATE TABLE sales AS SELECT range AS id, range * 2 AS amount FROM range(5)")
+
+    source = DataSource(name='source', type='duckdb', connection_params={'path': path}, created_by=user_id)
+    db.session.add(source)
+    db.session.commit()
+    yield source.id
+
+    from backend.utils.duckdb_manager import duckdb_manager
+    duckdb_manager.close(path)
+
+
+@pytest.fixture
+def secret_file(tmp_path):
+    path = tmp_path / 'secret.csv'
+    path.write_text('secret\nhunter2\n')
+    return str(path)
+
+
+def stream(client, source_id, query):
+    return client.post('/api/datasets/execute-query/stream', json={'source_id': source_id, 'query': query})
+
+
+def test_stream_reads_source_tables(client, duckdb_source):
+    response = stream(client, duckdb_source, 'SELECT id, amount FROM sales ORDER BY id')
+
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['amount'] for row in rows] == [0, 2, 4, 6, 8]
+
+
+@pytest.mark.parametrize('reader', ['read_csv_auto', 'read_csv', 'read_parquet'])
+def test_stream_refuses_server_files(client, duckdb_source, secret_file, reader):
+    response = stream(client, duckdb_source, f"SELECT * FROM {reader}('{secret_file}')")
+
+    assert response.status_code == 500
+    assert 'Permission Error' in response.json['message']
+    assert 'hunter2' not in response.get_data(as_text=True)
+
+
+def test_query_jobs_run_sandboxed(app, duckdb_source, secret_file):
+    # Query jobs run their SQL on a processor opened like this one
+    from backend.models import DataSource
+    from backend.utils.data_processor import DataProcessor
+
+    processor = DataProcessor(data_source=DataSource.query.get(duckdb_source))
+    try:
+        processor.open_user_query()
+        assert processor.execute_query('SELECT COUNT(*) AS n FROM sales')['n'][0] == 5
+        with pytest.raises(duckdb.PermissionException):
+            processor.execute_query(f"SELECT * FROM read_csv_auto('{secret_file}')")
+    finally:
+        processor.close()
+
+
+def test_user_queries_refuse_unsandboxed_connections(app, duckdb_source):
+    from backend.models import DataSource
+    from backend.utils.data_processor import DataProcessor
+
+    processor = DataProcessor(data_source=DataSource.query.get(duckdb_source))
+    processor.connection = duckdb.connect()
+    try:
+        with pytest.raises(PermissionError):
+            processor.open_user_query()
+    finally:
+        processor.connection.close()
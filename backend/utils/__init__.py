@@ -3,8 +3,19 @@ from backend.utils.data_ingestion import (
     detect_column_types,
     detect_pii_columns,
     process_file,
-    save_to_duckdb,
+    ingest_file,
+    iter_file_chunks,
+    StreamingProfile,
     save_to_s3,
     clean_column_names
 )
+from backend.utils.profiler import ColumnProfiler, profile_columns
+from backend.utils.pii_scanner import scan_pii
+from backend.utils.duckdb_manager import duckdb_manager
+from backend.utils.engine_registry import engine_registry
+from backend.utils.result_cache import result_cache
 from backend.utils.data_processor import DataProcessor
+from backend.utils.query_jobs import query_jobs
+from backend.utils.tiered_cache import tiered_cache
+from backend.utils.rollups import rollups
+from backend.utils.sampling import samples
@@ -0,0 +1,210 @@
+import functools
+import hashlib
+import json
+import time
+from urllib.parse import urlencode
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+from backend.app import db, cache
+from backend.models import Dataset, Chart, DashboardChart
+from backend.utils.chart_data import normalize_filters
+from backend.utils.tiered_cache import tiered_cache
+from backend.utils.response_formats import negotiate_format
+
+# Object kinds in dependency order: each depends on the one before it
+SOURCE = 'source'
+DATASET = 'dataset'
+CHART = 'chart'
+DASHBOARD = 'dashboard'
+
+# Kinds nothing else is derived from; comment versions are keyed by dashboard
+USER = 'user'
+COMMENT = 'comment'
+
+# Response headers not replayed from cached views: the length is set from the
+# cached body, cookies belong to the request that set them
+UNCACHED_HEADERS = {'content-length', 'set-cookie'}
+
+
+def _version_key(kind, object_id):
+    return f'version:{kind}:{object_id}'
+
+
+def _generation_key(kind):
+    return f'generation:{kind}'
+
+
+def _seed():
+    # Counters start from the clock, so one that is lost (evicted or flushed)
+    # never restarts at a value older cache entries were stored under
+    return int(time.time() * 1000)
+
+
+def _current(keys):
+    """Values of counters, fetched in one round trip; missing ones are seeded."""
+    if not keys:
+        return []
+
+    values = cache.get_many(*keys)
+    for i, (key, value) in enumerate(zip(keys, values)):
+        if value is None:
+            # Concurrent seeds add up, which still yields a fresh value
+            values[i] = cache.cache.inc(key, _seed())
+    return [int(value) for value in values]
+
+
+def _bump(keys):
+    for key in keys:
+        if cache.cache.inc(key) == 1:
+            cache.cache.inc(key, _seed())
+
+
+def get_versions(*objects):
+    """Current versions of (kind, id) pairs."""
+    return _current([_version_key(kind, object_id) for kind, object_id in objects])
+
+
+def get_generations(*kinds):
+    """Current generations of object kinds, which change with any object of the kind."""
+    return _current([_generation_key(kind) for kind in kinds])
+
+
+def bump_generation(*kinds):
+    """
+    Make every cached entry derived from these kinds as a whole (e.g. list
+    pages) unreachable; call after creating objects.
+    """
+    _bump([_generation_key(kind) for kind in kinds])
+
+
+def dependents(kind, object_id):
+    """
+    Every object whose cached data derives from the given one, including
+    itself, following source -> dataset -> chart -> dashboard.
+    """
+    found = [(kind, object_id)]
+
+    dataset_ids = [object_id] if kind == DATASET else []
+    if kind == SOURCE:
+        dataset_ids = [row.id for row in db.session.query(Dataset.id).filter_by(source_id=object_id)]
+        found += [(DATASET, dataset_id) for dataset_id in dataset_ids]
+
+    chart_ids = [object_id] if kind == CHART else []
+    if dataset_ids:
+        chart_ids = [row.id for row in db.session.query(Chart.id).filter(Chart.dataset_id.in_(dataset_ids))]
+        found += [(CHART, chart_id) for chart_id in chart_ids]
+
+    if chart_ids:
+        dashboard_ids = {
+            row.dashboard_id for row in
+            db.session.query(DashboardChart.dashboard_id).filter(DashboardChart.chart_id.in_(chart_ids))
+        }
+        found += [(DASHBOARD, dashboard_id) for dashboard_id in dashboard_ids]
+
+    return found
+
+
+def invalidate(kind, object_id):
+    """
+    Bump the version of an object and everything downstream of it, and the
+    generations of their kinds, so cached entries built from their old state
+    are no longer addressed. Call after committing an update, or before
+    deleting (while dependents can still be looked up).
+    """
+    objects = dependents(kind, object_id)
+
+    _bump([_version_key(dependent_kind, dependent_id) for dependent_kind, dependent_id in objects])
+    bump_generation(*dict.fromkeys(dependent_kind for dependent_kind, _ in objects))
+
+    return objects
+
+
+def filters_hash(filters):
+    """
+    Canonical hash of merged filters: equivalent filters (different key or
+    list order) hash alike.
+    """
+    canonical = []
+    for column, operator, value in normalize_filters(filters):
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(value, key=lambda v: json.dumps(v, sort_keys=True, default=str))
+        canonical.append([str(column), str(operator).lower(), value])
+
+    canonical.sort(key=lambda f: json.dumps(f, sort_keys=True, default=str))
+    payload = json.dumps(canonical, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def chart_data_key(chart, dataset, source, filters=None, approximate=False):
+    """
+    Cache key of a chart's data under a filter state, exact or approximate.
+    Changing the chart, its dataset or its data source yields a new key.
+    """
+    chart_version, dataset_version, source_version = get_versions(
+        (CHART, chart.id), (DATASET, dataset.id), (SOURCE, source.id)
+    )
+    return (
+        f'chart_data:{chart.id}:c{chart_version}:d{dataset_version}:s{source_version}:'
+        f'{filters_hash(filters)}' + (':approx' if approximate else '')
+    )
+
+
+def view_cache_key(kinds=(), objects=None, per_user=False):
+    """
+    Cache key of the current request's response: the endpoint, its view and
+    query arguments, the JWT identity if ``per_user``, the negotiated
+    response format, and the current generations of ``kinds`` and versions
+    of ``objects`` (kind -> name of the view argument holding the object's
+    id).
+    """
+    view_args = request.view_args or {}
+    parts = [request.endpoint]
+    parts += [f'{name}={value}' for name, value in sorted(view_args.items())]
+
+    args = sorted((name, value) for name, values in request.args.lists() for value in values)
+    if args:
+        parts.append(hashlib.sha256(urlencode(args).encode('utf-8')).hexdigest()[:16])
+
+    if per_user:
+        parts.append(f'user={get_jwt_identity()}')
+
+    # Responses negotiated in another format than JSON are cached apart
+    fmt = negotiate_format()
+    if fmt != 'json':
+        parts.append(f'format={fmt}')
+
+    counters = [_generation_key(kind) for kind in kinds]
+    counters += [_version_key(kind, view_args[arg]) for kind, arg in (objects or {}).items()]
+    parts.append('v' + '.'.join(str(value) for value in _current(counters)))
+
+    return 'response:' + ':'.join(parts)
+
+
+def cached_view(timeout, kinds=(), objects=None, per_user=False):
+    """
+    Cache successful responses of a view, headers (Content-Type, Vary, ...)
+    included, under ``view_cache_key``. Entries are never deleted: bumping a
+    generation or version they were built under makes them unreachable, and
+    they expire after ``timeout``. That makes them safe to keep in each
+    worker's memory tier as well.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            key = view_cache_key(kinds, objects, per_user)
+
+            cached = tiered_cache.get(key)
+            if cached is not None:
+                data, status, headers = cached
+                return current_app.response_class(data, status=status, headers=headers)
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                headers = [
+                    (name, value) for name, value in response.headers
+                    if name.lower() not in UNCACHED_HEADERS
+                ]
+                tiered_cache.set(key, (response.get_data(), response.status_code, headers), timeout=timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,370 @@
+import pandas as pd
+import pyarrow as pa
+from backend.utils.data_processor import (
+    DataProcessor,
+    AGGREGATE_FUNCTIONS,
+    QUANTILE_FUNCTIONS,
+    TIME_GRAINS,
+    DEFAULT_TIME_POINTS
+)
+from backend.utils.filters import parse_filters
+from backend.utils.downsampling import downsample, DOWNSAMPLING_METHODS, DEFAULT_METHOD, DEFAULT_SOURCE_ROWS
+
+# Most rows (groups) a chart query returns
+DEFAULT_ROW_LIMIT = 1000
+
+# Chart types drawn along an ordered x axis
+ORDERED_CHART_TYPES = ('line', 'area')
+
+# How chart data is computed; approximate data comes with margins of error
+QUERY_MODES = ('exact', 'approximate')
+
+
+def normalize_filters(filters):
+    """
+    Turn chart and dashboard filters into (column, operator, value) tuples.
+
+    Accepts the tuple list itself, or a dict keyed by column whose values are
+    a scalar (equality), a list (membership), a ``{"min": .., "max": ..}``
+    range, ``{"values": [..]}`` or ``{"operator": .., "value": ..}``. Filter
+    definitions without a selected value (e.g. dashboard select options) are
+    skipped.
+    """
+    if not filters:
+        return []
+
+    if isinstance(filters, (list, tuple)):
+        return [tuple(f) for f in filters]
+
+    normalized = []
+    for column, value in filters.items():
+        if value is None or value == '':
+            continue
+
+        if isinstance(value, (list, tuple)):
+            normalized.append((column, 'in', list(value)))
+        elif isinstance(value, dict):
+            if value.get('min') is not None:
+                normalized.append((column, '>=', value['min']))
+            if value.get('max') is not None:
+                normalized.append((column, '<=', value['max']))
+            if value.get('values') is not None:
+                normalized.append((column, 'in', list(value['values'])))
+            if value.get('value') is not None:
+                normalized.append((column, value.get('operator', '='), value['value']))
+        else:
+            normalized.append((column, '=', value))
+
+    return normalized
+
+
+def _metric_specs(config):
+    """(column, aggregation) pairs of a chart's y axis configuration."""
+    if config.get('metrics'):
+        return [
+            (metric['column'], metric.get('aggregation', 'sum'))
+            for metric in config['metrics']
+        ]
+
+    y_axis = config.get('yAxis')
+    if not y_axis:
+        # Without a measure, bars and slices count rows
+        return [('*', 'count')]
+
+    columns = y_axis if isinstance(y_axis, list) else [y_axis]
+    return [(column, config.get('aggregation', 'sum')) for column in columns]
+
+
+def _sort_specs(sort, spec):
+    """ORDER BY pairs from ``{"by": .., "order": ..}`` entries."""
+    if isinstance(sort, dict):
+        sort = [sort]
+
+    pairs = []
+    for entry in sort:
+        by = entry.get('by', 'y')
+        if by == 'x':
+            by = spec['x']
+        elif by == 'y':
+            by = spec['metrics'][0]['name'] if spec['metrics'] else spec['y']
+        pairs.append((by, entry.get('order', 'asc')))
+    return pairs
+
+
+def build_chart_spec(chart, filters=None, row_limit=DEFAULT_ROW_LIMIT):
+    """
+    Translate a chart's configuration into the dimensions, metrics, filters,
+    sort and limit of a single aggregation query.
+
+    Configuration keys: ``xAxis`` (dimension), ``yAxis`` (column or list of
+    columns) with ``aggregation`` or an explicit ``metrics`` list, an optional
+    ``series`` column splitting the data into one dataset per value, ``sort``
+    and ``limit``. ``sort`` and ``limit`` may be overridden in ``query_params``.
+
+    A ``timeGrain`` (``minute`` to ``month``, or ``auto``) buckets the x axis
+    by time instead, aligned to ``timezone`` (UTC by default), with ``points``
+    buckets at most when the grain is picked automatically. These may be
+    overridden in ``query_params`` as well.
+
+    Line, area and scatter charts may declare a point budget, ``maxPoints``
+    (at most ``row_limit``), with a ``downsample`` method (``lttb``,
+    ``minmax`` or ``reservoir``). Up to ``limit`` rows (a million by
+    default) are then read and reduced to the budget.
+    """
+    config = chart.configuration or {}
+    query_params = chart.query_params or {}
+
+    x = config.get('xAxis') or config.get('dimension')
+    if not x:
+        raise ValueError("Chart configuration has no xAxis")
+
+    spec = {
+        'chart_type': chart.chart_type,
+        'x': x,
+        'y': config.get('yAxis'),
+        'series': config.get('series'),
+        'metrics': [],
+        'filters': normalize_filters(filters)
+    }
+
+    # Reject malformed filters up front rather than when the query runs
+    parse_filters(spec['filters'])
+
+    if chart.chart_type == 'scatter':
+        # Points are plotted as they are; identical points are merged
+        if not spec['y'] or isinstance(spec['y'], list):
+            raise ValueError("Scatter charts need a single yAxis column")
+        spec['dimensions'] = [x, spec['y']] + ([spec['series']] if spec['series'] else [])
+    else:
+        spec['dimensions'] = [x] + ([spec['series']] if spec['series'] else [])
+        for column, aggregation in _metric_specs(config):
+            aggregation = str(aggregation).lower()
+            if aggregation not in AGGREGATE_FUNCTIONS and aggregation not in QUANTILE_FUNCTIONS:
+                raise ValueError(f"Unsupported aggregation: {aggregation}")
+            if any(metric['column'] == column for metric in spec['metrics']):
+                raise ValueError(f"Column {column} is aggregated more than once")
+            spec['metrics'].append({
+                'column': column,
+                'aggregation': aggregation,
+                'name': 'count' if column == '*' else f'{column}_{aggregation}'
+            })
+
+    sort = query_params.get('sort', config.get('sort'))
+    if sort:
+        spec['sort'] = _sort_specs(sort, spec)
+    elif chart.chart_type in ORDERED_CHART_TYPES or chart.chart_type == 'scatter' or spec['series'] or not spec['metrics']:
+        spec['sort'] = [(dimension, 'asc') for dimension in spec['dimensions']]
+    else:
+        # Largest categories first, so a limit keeps the top ones
+        spec['sort'] = [(spec['metrics'][0]['name'], 'desc')]
+
+    limit = query_params.get('limit', config.get('limit'))
+    spec['limit'] = min(int(limit), row_limit) if limit else row_limit
+
+    max_points = query_params.get('maxPoints', config.get('maxPoints'))
+    if max_points:
+        if chart.chart_type not in ORDERED_CHART_TYPES and chart.chart_type != 'scatter':
+            raise ValueError("Only line, area and scatter charts can be downsampled")
+        method = query_params.get('downsample', config.get('downsample', DEFAULT_METHOD))
+        if method not in DOWNSAMPLING_METHODS:
+            raise ValueError(f"Unsupported downsampling method: {method}")
+        spec['downsample'] = {'method': method, 'points': min(int(max_points), row_limit)}
+        # The budget bounds the response; the query may read past it
+        spec['limit'] = min(int(limit), DEFAULT_SOURCE_ROWS) if limit else DEFAULT_SOURCE_ROWS
+
+    grain = query_params.get('timeGrain', config.get('timeGrain'))
+    if grain:
+        if chart.chart_type in ('scatter', 'pie'):
+            raise ValueError(f"{chart.chart_type.capitalize()} charts can't be bucketed by time")
+        if grain != 'auto' and grain not in TIME_GRAINS:
+            raise ValueError(f"Unsupported time grain: {grain}")
+        spec['time'] = {
+            'grain': grain,
+            'timezone': query_params.get('timezone', config.get('timezone', 'UTC')),
+            'points': int(query_params.get('points', config.get('points', DEFAULT_TIME_POINTS)))
+        }
+
+    return spec
+
+
+def _json_values(values):
+    """A Series as a JSON-ready list: timestamps as ISO strings, nulls as None."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        values = values.dt.strftime('%Y-%m-%dT%H:%M:%S')
+    elif values.dtype == object:
+        # Decimals from SQL sources and other non-native numbers
+        numeric = pd.to_numeric(values, errors='coerce')
+        if numeric.notna().sum() == values.notna().sum():
+            values = numeric
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def shape_chart_data(df, spec):
+    """
+    Shape an aggregated result into the labels/datasets structure the chart
+    renderer expects, with whole-column pandas operations. Estimated results
+    give each dataset a ``margin`` list: the +/- margin of error of each
+    value, null where it isn't known.
+    """
+    chart_type = spec['chart_type']
+    x = spec['x']
+    series = spec['series']
+
+    if chart_type == 'scatter':
+        groups = [(spec['y'], df)] if not series else df.groupby(series, sort=False)
+        datasets = []
+        for label, group in groups:
+            points = pd.DataFrame({
+                'x': _json_values(group[x]),
+                'y': _json_values(group[spec['y']])
+            })
+            datasets.append({'label': str(label), 'data': points.to_dict('records')})
+        return {'datasets': datasets}
+
+    metric_names = [metric['name'] for metric in spec['metrics']]
+
+    def dataset(label, values, margins=None):
+        entry = {'label': label, 'data': _json_values(values)}
+        if margins is not None:
+            entry['margin'] = _json_values(margins)
+        return entry
+
+    def margins(name):
+        return df[f'{name}__margin'] if f'{name}__margin' in df else None
+
+    if chart_type == 'pie':
+        return {
+            'labels': _json_values(df[x]),
+            'datasets': [dataset(metric_names[0], df[metric_names[0]], margins(metric_names[0]))]
+        }
+
+    if series:
+        # One dataset per series value, aligned on the x labels in query order
+        def widen(values):
+            wide = df.pivot(index=x, columns=series, values=values)
+            return wide.reindex(index=pd.unique(df[x]), columns=pd.unique(df[series]))
+
+        wide = widen(metric_names[0])
+        wide_margins = widen(f'{metric_names[0]}__margin') if margins(metric_names[0]) is not None else None
+        return {
+            'labels': _json_values(wide.index.to_series()),
+            'datasets': [
+                dataset(str(label), wide[label], wide_margins[label] if wide_margins is not None else None)
+                for label in wide.columns
+            ]
+        }
+
+    return {
+        'labels': _json_values(df[x]),
+        'datasets': [dataset(name, df[name], margins(name)) for name in metric_names]
+    }
+
+
+def chart_data_table(data):
+    """
+    A chart's data as an Arrow table and the metadata that goes with it
+    (e.g. ``time`` or ``approximate``). Labelled charts get a ``labels``
+    column, then a column per dataset and its ``__margin`` column, if any.
+    Scatter charts get ``series``, ``x`` and ``y`` columns.
+    """
+    metadata = {key: value for key, value in data.items() if key not in ('labels', 'datasets')}
+
+    if 'labels' not in data:
+        points = [(dataset['label'], point) for dataset in data['datasets'] for point in dataset['data']]
+        return pa.table({
+            'series': [label for label, _ in points],
+            'x': [point['x'] for _, point in points],
+            'y': [point['y'] for _, point in points]
+        }), metadata
+
+    columns = {'labels': data['labels']}
+    for dataset in data['datasets']:
+        columns[dataset['label']] = dataset['data']
+        if 'margin' in dataset:
+            columns[f"{dataset['label']}__margin"] = dataset['margin']
+    return pa.table(columns), metadata
+
+
+def downsample_chart_data(df, spec):
+    """
+    Reduce a result to a chart's point budget. Each series is downsampled
+    on its own to an equal share of the points, so the whole chart stays
+    within the budget however many series it has.
+    """
+    x = spec['x']
+    y = spec['y'] if spec['chart_type'] == 'scatter' else spec['metrics'][0]['name']
+    reduced = downsample(df, x, y, spec['downsample']['points'], spec['downsample']['method'], by=spec['series'])
+    return reduced.reset_index(drop=True)
+
+
+def merge_filters(chart, filters=None):
+    """Request filters, completed with the chart's own ``query_params`` filters."""
+    merged = dict(filters or {})
+    if chart.query_params and 'filters' in chart.query_params:
+        for key, value in chart.query_params['filters'].items():
+            if key not in merged:
+                merged[key] = value
+    return merged
+
+
+def run_chart_spec(spec, dataset, source, timeout=None, approximate=False):
+    """
+    Run a chart spec as one aggregation query and shape the result. With
+    ``approximate``, the data also tells how it was estimated (``method``
+    ``exact`` when it couldn't be). Time-bucketed charts are always exact
+    and tell the grain and time zone of their buckets. Downsampled charts
+    tell how many of how many rows they kept.
+    """
+    processor = DataProcessor(data_source=source, statement_timeout=timeout)
+    try:
+        if spec.get('time'):
+            # Buckets come back in time order, every one of them
+            df = processor.get_time_series_data(
+                dataset,
+                time_column=spec['x'],
+                grain=spec['time']['grain'],
+                metrics={metric['column']: metric['aggregation'] for metric in spec['metrics']},
+                series=spec['series'],
+                filters=spec['filters'],
+                timezone=spec['time']['timezone'],
+                points=spec['time']['points']
+            )
+            time = df.attrs['time']
+        else:
+            time = None
+            df = processor.get_aggregated_data(
+                dataset,
+                dimensions=spec['dimensions'],
+                metrics={metric['column']: metric['aggregation'] for metric in spec['metrics']},
+                filters=spec['filters'],
+                sort=spec['sort'],
+                limit=spec['limit'],
+                approximate=approximate
+            )
+    finally:
+        processor.close()
+
+    downsampled = None
+    if spec.get('downsample'):
+        rows = len(df)
+        df = downsample_chart_data(df, spec)
+        downsampled = dict(spec['downsample'], rows=rows, points=len(df))
+
+    data = shape_chart_data(df, spec)
+    if time:
+        data['time'] = time
+    elif approximate:
+        data['approximate'] = df.attrs.get('approximate', {'method': 'exact'})
+    if downsampled:
+        data['downsampled'] = downsampled
+    return data
+
+
+def get_chart_data(chart, dataset, source, filters=None, row_limit=DEFAULT_ROW_LIMIT, timeout=None,
+                   approximate=False):
+    """
+    Compute a chart's data with one aggregation query pushed down to its
+    data source, or estimate it with ``approximate``.
+    """
+    spec = build_chart_spec(chart, filters, row_limit=row_limit)
+    return run_chart_spec(spec, dataset, source, timeout=timeout, approximate=approximate)
@@ -0,0 +1,223 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from backend.app import db
+from backend.models import Dataset, DataSource
+from backend.utils.data_processor import DataProcessor
+from backend.utils.chart_data import build_chart_spec, merge_filters, run_chart_spec, shape_chart_data, DEFAULT_ROW_LIMIT
+from backend.utils.cache_keys import chart_data_key, filters_hash
+from backend.utils.tiered_cache import tiered_cache
+
+# Threads shared by all dashboard requests for running chart queries
+DEFAULT_MAX_WORKERS = 4
+
+# Merged scans returning more groups than this fall back to one query per chart
+DEFAULT_MERGE_MAX_ROWS = 100000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(max_workers):
+    """Lazily created, process-wide pool bounding concurrent chart queries."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dashboard-data')
+        return _executor
+
+
+def grouping_mask(dimensions, grouping_set):
+    """``GROUPING()`` bitmask of a grouping set over all dimensions."""
+    mask = 0
+    for dim in dimensions:
+        mask = (mask << 1) | (0 if dim in grouping_set else 1)
+    return mask
+
+
+def plan_queries(entries):
+    """
+    Split chart entries into units that each run as one query.
+
+    Charts on the same dataset with the same filters share a unit: one
+    GROUP BY when their dimensions match, GROUPING SETS otherwise (except on
+    MySQL, which has none). Scatter charts plot raw points, time-bucketed
+    charts fill their gaps and downsampled charts read past the row limit, so
+    these always run on their own.
+    """
+    units = []
+    shared = {}
+
+    for entry in entries:
+        spec = entry['spec']
+        if spec['chart_type'] == 'scatter' or spec.get('time') or spec.get('downsample'):
+            units.append([entry])
+            continue
+
+        key = (entry['dataset_id'], filters_hash(spec['filters']))
+        if entry['source_type'] == 'mysql':
+            key += (frozenset(spec['dimensions']),)
+        shared.setdefault(key, []).append(entry)
+
+    return units + list(shared.values())
+
+
+def _sorted_and_limited(df, spec):
+    """Apply a chart's sort and limit to its share of a merged result."""
+    if spec['sort']:
+        df = df.sort_values(
+            by=[column for column, _ in spec['sort']],
+            ascending=[str(direction).lower() == 'asc' for _, direction in spec['sort']],
+            kind='mergesort',
+            na_position='last'
+        )
+    return df.head(spec['limit']).reset_index(drop=True)
+
+
+def _load_unit(unit):
+    """
+    A unit's entries with their dataset and source loaded in the calling
+    thread's session; those of the request's session are not safe to use
+    (or commit changes to) from another thread.
+    """
+    loaded = []
+    for entry in unit:
+        dataset = db.session.get(Dataset, entry['dataset_id'])
+        source = db.session.get(DataSource, entry['source_id'])
+        if dataset is None or source is None:
+            raise ValueError('Dataset or data source not found')
+        loaded.append(dict(entry, dataset=dataset, source=source))
+    return loaded
+
+
+def _run_single(entry, timeout, approximate=False):
+    return {entry['chart_id']: run_chart_spec(
+        entry['spec'], entry['dataset'], entry['source'], timeout=timeout, approximate=approximate
+    )}
+
+
+def _run_unit(unit, timeout, merge_max_rows, approximate=False):
+    """Run a unit of charts; returns chart id -> data (or exception)."""
+    if len(unit) == 1:
+        return _run_single(unit[0], timeout, approximate), 1
+
+    first = unit[0]
+
+    # Distinct dimension sets, in chart order
+    grouping_sets = []
+    for entry in unit:
+        if not any(set(existing) == set(entry['spec']['dimensions']) for existing in grouping_sets):
+            grouping_sets.append(entry['spec']['dimensions'])
+    dimensions = list(dict.fromkeys(dim for grouping_set in grouping_sets for dim in grouping_set))
+
+    metrics = list(dict.fromkeys(
+        (metric['column'], metric['aggregation'])
+        for entry in unit
+        for metric in entry['spec']['metrics']
+    ))
+
+    processor = DataProcessor(data_source=first['source'], statement_timeout=timeout)
+    try:
+        df = processor.get_grouped_data(
+            first['dataset'],
+            grouping_sets=grouping_sets,
+            metrics=metrics,
+            filters=first['spec']['filters'],
+            limit=merge_max_rows + 1
+        )
+    finally:
+        processor.close()
+
+    if len(df) > merge_max_rows:
+        # Too many groups to split in memory; let each chart push its own
+        # sort and limit down instead
+        results = {}
+        for entry in unit:
+            results.update(_run_safely(_run_single, entry, timeout))
+        return results, 1 + len(unit)
+
+    results = {}
+    for entry in unit:
+        spec = entry['spec']
+        try:
+            rows = df
+            if len(grouping_sets) > 1:
+                rows = df[df['__grouping'] == grouping_mask(dimensions, spec['dimensions'])]
+            rows = rows[spec['dimensions'] + [metric['name'] for metric in spec['metrics']]]
+            results[entry['chart_id']] = shape_chart_data(_sorted_and_limited(rows, spec), spec)
+        except Exception as e:
+            results[entry['chart_id']] = e
+
+    return results, 1
+
+
+def _run_safely(fn, entry, *args):
+    try:
+        return fn(entry, *args)
+    except Exception as e:
+        return {entry['chart_id']: e}
+
+
+def get_dashboard_data(app, charts, filters=None, row_limit=DEFAULT_ROW_LIMIT, timeout=None,
+                       max_workers=DEFAULT_MAX_WORKERS, merge_max_rows=DEFAULT_MERGE_MAX_ROWS, approximate=False):
+    """
+    Compute the data of every chart on a dashboard.
+
+    ``charts`` is a list of (chart, dataset, source) tuples, which are
+    only read on the calling thread: the pool threads load their own copies
+    of datasets and sources. Charts with
+    cached data for this filter state are served from the chart data cache;
+    the rest are planned into merged queries that run concurrently on a
+    bounded thread pool. Approximate data is estimated per chart instead,
+    from samples that make each query cheap. Returns chart id ->
+    ``{"data": ..}`` or ``{"error": ..}`` and the number of queries run.
+    """
+    results = {}
+    entries = []
+
+    for chart, dataset, source in charts:
+        chart_filters = merge_filters(chart, filters)
+        try:
+            spec = build_chart_spec(chart, chart_filters, row_limit=row_limit)
+        except ValueError as e:
+            results[chart.id] = {'error': f'Invalid chart configuration: {str(e)}'}
+            continue
+        entries.append({
+            'chart_id': chart.id,
+            'dataset_id': dataset.id,
+            'source_id': source.id,
+            'source_type': source.type,
+            'spec': spec,
+            'cache_key': chart_data_key(chart, dataset, source, chart_filters, approximate)
+        })
+
+    # Serve what's cached in one round trip
+    cached = tiered_cache.get_many(*[entry['cache_key'] for entry in entries]) if entries else []
+    misses = []
+    for entry, data in zip(entries, cached):
+        if data is not None:
+            results[entry['chart_id']] = {'data': data}
+        else:
+            misses.append(entry)
+
+    def run(unit):
+        with app.app_context():
+            try:
+                return _run_unit(_load_unit(unit), timeout, merge_max_rows, approximate)
+            except Exception as e:
+                return {entry['chart_id']: e for entry in unit}, 1
+
+    units = [[entry] for entry in misses] if approximate else plan_queries(misses)
+    executor = _get_executor(max_workers)
+    queries = 0
+
+    by_chart = {entry['chart_id']: entry for entry in misses}
+    for unit_results, unit_queries in executor.map(run, units):
+        queries += unit_queries
+        for chart_id, data in unit_results.items():
+            if isinstance(data, Exception):
+                results[chart_id] = {'error': f'Error getting chart data: {str(data)}'}
+            else:
+                results[chart_id] = {'data': data}
+                tiered_cache.set(by_chart[chart_id]['cache_key'], data, timeout=app.config['CHART_DATA_CACHE_TIMEOUT'])
+
+    return results, queries
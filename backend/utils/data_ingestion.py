@@ -1,135 +1,358 @@
+import logging
 import pandas as pd
 import numpy as np
 import re
 import duckdb
-from datetime import datetime
+import pyarrow.dataset as pa_ds
 import tempfile
 import os
 import boto3
 from werkzeug.utils import secure_filename
 from io import StringIO, BytesIO
+from backend.app import db
+from backend.utils.profiler import ColumnProfiler, profile_columns, DEFAULT_SAMPLE_SIZE
+from backend.utils.duckdb_manager import duckdb_manager
+from backend.utils.pii_scanner import (
+    scan_pii, merge_pii_reports, pii_columns_from_reports, DEFAULT_MATCH_THRESHOLD, DEFAULT_EXECUTOR
+)
 
-def detect_column_types(df):
+logger = logging.getLogger(__name__)
+
+# Number of rows read per chunk when streaming files into DuckDB
+DEFAULT_CHUNK_SIZE = 100000
+
+# Rows per Parquet row group; scans are parallelised and skipped per row group
+PARQUET_ROW_GROUP_SIZE = 122880
+
+def detect_column_types(df, sample_size=DEFAULT_SAMPLE_SIZE):
     """
     Analyze DataFrame columns and detect appropriate data types.
+    
+    Besides the suggested type, each column reports its null count, an
+    estimate of its distinct values and its min/max.
+    """
+    return profile_columns(df, sample_size=sample_size)
+
+def detect_pii_columns(df, threshold=DEFAULT_MATCH_THRESHOLD):
+    """
+    Detect potential PII columns based on column names and pattern matching.
+    More sophisticated detection could use NLP/ML techniques.
+    
+    See ``scan_pii`` for the per-column match ratios behind the result.
+    """
+    return pii_columns_from_reports(scan_pii(df, threshold=threshold))
+
+class StreamingProfile:
+    """
+    Fold column types, PII columns and row counts over a stream of DataFrame
+    chunks so the whole file never has to be held in memory.
     """
-    schema = []
-    
-    for column in df.columns:
-        col_data = df[column]
-        col_info = {
-            'name': column,
-            'original_type': str(col_data.dtype),
-            'nullable': col_data.isna().any()
-        }
+    
+    def __init__(self, sample_size=5, pii_threshold=DEFAULT_MATCH_THRESHOLD, pii_executor=DEFAULT_EXECUTOR):
+        self.sample_size = sample_size
+        self.pii_threshold = pii_threshold
+        self.pii_executor = pii_executor
+        self.row_count = 0
+        self.columns = []
+        self.sample_data = []
+        self._profiler = ColumnProfiler()
+        self.pii_report = {}
+    
+    def update(self, chunk):
+        """Fold a single chunk into the running profile."""
+        if not self.columns:
+            self.columns = chunk.columns.tolist()
         
-        # Try to infer more precise types
-        non_null_values = col_data.dropna()
+        self.row_count += len(chunk)
         
-        if len(non_null_values) == 0:
-            col_info['suggested_type'] = 'string'
-        elif pd.api.types.is_numeric_dtype(col_data):
-            if pd.api.types.is_integer_dtype(col_data) or all(v.is_integer() for v in non_null_values if not pd.isna(v)):
-                col_info['suggested_type'] = 'integer'
-            else:
-                col_info['suggested_type'] = 'float'
-        elif pd.api.types.is_datetime64_dtype(col_data):
-            col_info['suggested_type'] = 'timestamp'
-        elif _is_date(non_null_values):
-            col_info['suggested_type'] = 'date'
-        elif _is_boolean(non_null_values):
-            col_info['suggested_type'] = 'boolean'
-        else:
-            col_info['suggested_type'] = 'string'
-            
-            # Check if it's a categorical column
-            if len(non_null_values.unique()) < min(10, len(non_null_values) * 0.1):
-                col_info['suggested_type'] = 'categorical'
+        # Keep the first few rows as a sample
+        if len(self.sample_data) < self.sample_size:
+            remaining = self.sample_size - len(self.sample_data)
+            self.sample_data.extend(chunk.head(remaining).to_dict(orient='records'))
+        
+        self._profiler.update(chunk)
         
-        schema.append(col_info)
+        chunk_report = scan_pii(chunk, threshold=self.pii_threshold, executor=self.pii_executor)
+        self.pii_report = merge_pii_reports(self.pii_report, chunk_report, threshold=self.pii_threshold)
+    
+    @property
+    def column_types(self):
+        """Column schema in the same shape as ``detect_column_types``."""
+        return self._profiler.result()
     
-    return schema
+    @property
+    def pii_columns(self):
+        return pii_columns_from_reports(self.pii_report)
 
-def _is_date(series):
-    """Check if a series contains date-like strings."""
-    if len(series) == 0:
-        return False
-    
-    # Sample up to 100 values
-    sample = series.sample(min(100, len(series)))
-    
-    # Common date patterns
-    date_patterns = [
-        r'^\d{4}-\d{2}-\d{2}$',  # YYYY-MM-DD
-        r'^\d{2}/\d{2}/\d{4}$',  # MM/DD/YYYY
-        r'^\d{2}-\d{2}-\d{4}$',  # DD-MM-YYYY
-        r'^\d{4}/\d{2}/\d{2}$',  # YYYY/MM/DD
-        r'^\d{1,2}\s+[A-Za-z]{3}\s+\d{4}$'  # 1 Jan 2020
-    ]
-    
-    # Check if most values match a date pattern
-    match_count = 0
-    for value in sample:
-        if isinstance(value, str):
-            if any(re.match(pattern, value) for pattern in date_patterns):
-                match_count += 1
-    
-    # Return True if at least 90% of samples match a date pattern
-    return match_count >= 0.9 * len(sample)
+def _detect_file_type(filename):
+    """Map a file name to one of the supported file types."""
+    filename = filename.lower()
+    if filename.endswith('.csv'):
+        return 'csv'
+    elif filename.endswith(('.xls', '.xlsx')):
+        return 'excel'
+    elif filename.endswith('.json'):
+        return 'json'
+    elif filename.endswith('.parquet'):
+        return 'parquet'
+    raise ValueError(f"Unsupported file type: {filename}")
+
+def _detect_delimiter(file_path):
+    """Guess the delimiter of a CSV file from its first few kilobytes."""
+    with open(file_path, 'rb') as f:
+        sample = f.read(4096)
+    
+    if b'\t' in sample:
+        return '\t'
+    elif b';' in sample:
+        return ';'
+    return ','
 
-def _is_boolean(series):
-    """Check if a series contains boolean-like values."""
-    if len(series) == 0:
-        return False
+def iter_file_chunks(file_path, chunksize=DEFAULT_CHUNK_SIZE, encoding=None):
+    """
+    Yield the contents of a file as DataFrames of at most ``chunksize`` rows.
+    
+    CSV and Parquet files are streamed. Excel and JSON files cannot be read
+    incrementally and are yielded as a single frame.
+    """
+    file_type = _detect_file_type(os.path.basename(file_path))
     
-    # Convert to lowercase strings for checking
-    str_values = [str(v).lower() for v in series]
+    if file_type == 'csv':
+        reader = pd.read_csv(
+            file_path,
+            delimiter=_detect_delimiter(file_path),
+            encoding=encoding,
+            chunksize=chunksize
+        )
+        with reader:
+            for chunk in reader:
+                yield chunk
+    
+    elif file_type == 'parquet':
+        import pyarrow.parquet as pq
+        
+        parquet_file = pq.ParquetFile(file_path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
     
-    # Common boolean representations
-    true_values = ['true', 't', 'yes', 'y', '1']
-    false_values = ['false', 'f', 'no', 'n', '0']
+    elif file_type == 'excel':
+        yield pd.read_excel(file_path)
     
-    # Check if all values are typical boolean representations
-    return all(v in true_values + false_values for v in str_values)
+    elif file_type == 'json':
+        yield pd.read_json(file_path)
 
-def detect_pii_columns(df):
+def _quote_identifier(name):
+    """Quote an identifier for use in DuckDB SQL."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _quote_literal(value):
+    """Quote a string literal for use in DuckDB SQL."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _duckdb_type(dtype):
+    """DuckDB column type that a pandas dtype is stored as."""
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    elif pd.api.types.is_integer_dtype(dtype):
+        return 'BIGINT'
+    elif pd.api.types.is_float_dtype(dtype):
+        return 'DOUBLE'
+    elif pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    return 'VARCHAR'
+
+def _widen_columns(conn, table_name, chunk):
     """
-    Detect potential PII columns based on column names and pattern matching.
-    More sophisticated detection could use NLP/ML techniques.
+    Widen table columns whose type can't hold the values of an incoming chunk,
+    e.g. an integer column that turns out to contain decimals further down.
     """
-    pii_columns = []
-    
-    # Common PII indicators in column names
-    pii_keywords = [
-        'name', 'email', 'phone', 'address', 'zip', 'postal', 'ssn', 'social',
-        'birth', 'dob', 'credit', 'card', 'passport', 'license', 'gender',
-        'nationality', 'account', 'password', 'username', 'ip', 'location'
-    ]
+    existing = {
+        row[1]: row[2]
+        for row in conn.execute(f"PRAGMA table_info({_quote_identifier(table_name)})").fetchall()
+    }
     
-    for column in df.columns:
-        column_lower = column.lower()
+    for column in chunk.columns:
+        current = existing.get(column)
+        incoming = _duckdb_type(chunk[column].dtype)
         
-        # Check if column name contains PII keywords
-        if any(keyword in column_lower for keyword in pii_keywords):
-            pii_columns.append(column)
+        if current is None or current in (incoming, 'VARCHAR') or chunk[column].isna().all():
+            continue
+        if current == 'DOUBLE' and incoming == 'BIGINT':
             continue
         
-        # Sample data to check for patterns
-        sample = df[column].dropna().astype(str).head(100)
+        target = 'DOUBLE' if {current, incoming} == {'BIGINT', 'DOUBLE'} else 'VARCHAR'
+        conn.execute(
+            f"ALTER TABLE {_quote_identifier(table_name)} "
+            f"ALTER {_quote_identifier(column)} TYPE {target}"
+        )
+
+def _append_chunk(conn, table_name, chunk, create=False):
+    """Create the table from the first chunk, or append a chunk to it."""
+    conn.register('chunk_view', chunk)
+    try:
+        if create:
+            conn.execute(f"CREATE TABLE {_quote_identifier(table_name)} AS SELECT * FROM chunk_view")
+        else:
+            _widen_columns(conn, table_name, chunk)
+            conn.execute(f"INSERT INTO {_quote_identifier(table_name)} SELECT * FROM chunk_view")
+    finally:
+        conn.unregister('chunk_view')
+
+def _ingest_chunks(file_path, db_path, parquet_path, table_name, chunksize, encoding, profile_options):
+    """Stream one file into a fresh DuckDB database using a single encoding."""
+    # Release any shared handle on a database we are about to replace
+    duckdb_manager.close(db_path)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    
+    profile = StreamingProfile(**profile_options)
+    conn = duckdb.connect(database=db_path, read_only=False)
+    created = False
+    
+    try:
+        for chunk in iter_file_chunks(file_path, chunksize=chunksize, encoding=encoding):
+            _append_chunk(conn, table_name, chunk, create=not created)
+            created = True
+            profile.update(chunk)
         
-        # Check for email pattern
-        if column_lower.find('email') >= 0 or any('@' in str(val) and '.' in str(val).split('@')[-1] for val in sample):
-            pii_columns.append(column)
+        if not created:
+            raise ValueError("File contains no data")
         
-        # Check for phone number pattern
-        elif any(re.search(r'\d{3}[- .]?\d{3}[- .]?\d{4}', str(val)) for val in sample):
-            pii_columns.append(column)
+        result = conn.execute(f"PRAGMA table_info({_quote_identifier(table_name)})").fetchall()
+        columns = [{'name': r[1], 'type': r[2], 'nullable': not r[3]} for r in result]
+        
+        write_parquet_copy(conn, table_name, parquet_path)
+    finally:
+        conn.close()
+    
+    return {
+        'db_path': db_path,
+        'parquet_path': parquet_path,
+        'table_name': table_name,
+        'columns': columns,
+        'row_count': profile.row_count,
+        'column_types': profile.column_types,
+        'pii_columns': profile.pii_columns,
+        'pii_report': profile.pii_report,
+        'sample_data': profile.sample_data
+    }
+
+def ingest_file(file_path, db_path=None, parquet_path=None, table_name='data',
+                chunksize=DEFAULT_CHUNK_SIZE, **profile_options):
+    """
+    Stream a file into a persistent DuckDB table in bounded chunks.
+    
+    Type detection, PII detection and row counts are folded over the chunks,
+    so peak memory depends on ``chunksize`` rather than on the file size.
+    The table is also exported as a Parquet copy that read paths use instead
+    of re-parsing the original file. Both are written next to the file unless
+    ``db_path``/``parquet_path`` are given. Extra keyword arguments are passed
+    on to ``StreamingProfile``.
+    """
+    if db_path is None:
+        db_path = os.path.splitext(file_path)[0] + '.duckdb'
+    if parquet_path is None:
+        parquet_path = parquet_path_for(file_path)
+    
+    encodings = ['utf-8', 'latin1']
+    for attempt, encoding in enumerate(encodings):
+        try:
+            return _ingest_chunks(file_path, db_path, parquet_path, table_name, chunksize, encoding, profile_options)
+        except UnicodeDecodeError:
+            # Start over with a different encoding
+            if attempt == len(encodings) - 1:
+                raise
+
+def parquet_path_for(file_path):
+    """Where the Parquet copy of an uploaded file lives."""
+    return file_path + '.parquet'
+
+def write_parquet_copy(conn, table_name, parquet_path):
+    """
+    Export a DuckDB table as a typed, ZSTD-compressed Parquet file.
+    
+    The file is written under a temporary name of its own and moved into
+    place, so readers never see a partially written copy and concurrent
+    writers don't write over each other.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(parquet_path)), suffix='.parquet.tmp')
+    os.close(fd)
+    try:
+        conn.execute(
+            f"COPY {_quote_identifier(table_name)} TO {_quote_literal(tmp_path)} "
+            f"(FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE {PARQUET_ROW_GROUP_SIZE})"
+        )
+        os.replace(tmp_path, parquet_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _record_parquet_path(source, parquet_path):
+    """Save the path of a Parquet copy on its data source, so it is deleted with it."""
+    try:
+        source.connection_params = dict(source.connection_params, parquet_path=parquet_path)
+        db.session.commit()
+    except Exception as e:
+        # The copy is still usable; deleting the source looks for it too
+        db.session.rollback()
+        logger.warning(f"Could not record the Parquet copy of data source {source.id}: {str(e)}")
+
+def ensure_parquet_copy(source, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Return the path of a file data source's Parquet copy, building it first
+    for sources uploaded before copies were written at ingestion time.
+    """
+    connection_params = source.connection_params
+    file_path = connection_params['file_path']
+    parquet_path = connection_params.get('parquet_path') or parquet_path_for(file_path)
+    
+    if not os.path.exists(parquet_path):
+        db_path = connection_params.get('duckdb_path')
+        table_name = connection_params.get('table_name', 'data')
         
-        # Check for SSN pattern
-        elif any(re.search(r'\d{3}[- ]?\d{2}[- ]?\d{4}', str(val)) for val in sample):
-            pii_columns.append(column)
+        if db_path and os.path.exists(db_path):
+            try:
+                write_parquet_copy(duckdb_manager.cursor(db_path, read_only=True), table_name, parquet_path)
+            finally:
+                duckdb_manager.release(db_path)
+        else:
+            # Ingest into a private scratch database, so concurrent builds
+            # don't write to the same one
+            fd, scratch_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix='.duckdb')
+            os.close(fd)
+            try:
+                ingest_file(file_path, db_path=scratch_path, parquet_path=parquet_path, table_name=table_name, chunksize=chunksize)
+            finally:
+                for path in (scratch_path, scratch_path + '.wal'):
+                    if os.path.exists(path):
+                        os.remove(path)
+    
+    if connection_params.get('parquet_path') != parquet_path:
+        _record_parquet_path(source, parquet_path)
     
-    return pii_columns
+    return parquet_path
+
+def read_parquet_copy(parquet_path, columns=None, limit=None, arrow=False):
+    """
+    Read a Parquet copy into a DataFrame, or an Arrow table with ``arrow``.
+    
+    Only the requested columns and the row groups needed to satisfy
+    ``limit`` are read.
+    """
+    select = ', '.join(_quote_identifier(c) for c in columns) if columns else '*'
+    query = f"SELECT {select} FROM parquet_copy"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    
+    # The shared in-memory database has external access disabled, so the
+    # file is scanned as a registered Arrow dataset
+    cursor = duckdb_manager.connection(':memory:').cursor()
+    try:
+        cursor.register('parquet_copy', pa_ds.dataset(parquet_path, format='parquet'))
+        result = cursor.execute(query)
+        return result.arrow() if arrow else result.fetchdf()
+    finally:
+        cursor.close()
 
 def process_file(file_path):
     """
@@ -195,36 +418,6 @@ def process_file(file_path):
     
     return df
 
-def save_to_duckdb(df, db_path=None, table_name=None):
-    """
-    Save a DataFrame to DuckDB, either in-memory or to a file.
-    """
-    if db_path is None:
-        # Use in-memory database
-        conn = duckdb.connect(database=':memory:')
-    else:
-        conn = duckdb.connect(database=db_path, read_only=False)
-    
-    if table_name is None:
-        table_name = f"table_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    
-    # Register DataFrame as a table
-    conn.register('df_view', df)
-    conn.execute(f"CREATE TABLE {table_name} AS SELECT * FROM df_view")
-    
-    # Return metadata about the table
-    result = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
-    columns = [{'name': r[1], 'type': r[2], 'nullable': not r[3]} for r in result]
-    
-    row_count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-    
-    return {
-        'table_name': table_name,
-        'columns': columns,
-        'row_count': row_count,
-        'connection': conn  # Return connection for further queries
-    }
-
 def save_to_s3(df, bucket, key, format='parquet'):
     """
     Save DataFrame to S3 in specified format.
@@ -1,16 +1,88 @@
 
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+import os
+import re
+import threading
+import zoneinfo
 import duckdb
+import pyarrow as pa
+import pyarrow.dataset as pa_ds
+from backend.app import db
 from backend.models import Dataset, DataSource
+from backend.utils.data_ingestion import ensure_parquet_copy
+from backend.utils.engine_registry import engine_registry
+from backend.utils.duckdb_manager import duckdb_manager, sandbox_path, USER_SQL_DATABASE
+from backend.utils.result_cache import result_cache
+from backend.utils.filters import parse_filters, compile_where, dialect_for, filter_dataset, quote_identifier
+from backend.utils.rollups import rollups, component_column
+from backend.utils.sampling import (
+    samples,
+    WEIGHT_COLUMN,
+    SAMPLE_AGGREGATIONS,
+    CONFIDENCE,
+    CONFIDENCE_Z,
+    HLL_RELATIVE_ERROR
+)
+
+# Aggregations available to charts, as SQL templates over a quoted column
+AGGREGATE_FUNCTIONS = {
+    'sum': 'SUM({})',
+    'avg': 'AVG({})',
+    'min': 'MIN({})',
+    'max': 'MAX({})',
+    'count': 'COUNT({})',
+    'count_distinct': 'COUNT(DISTINCT {})'
+}
+
+# Percentile aggregations and the fraction of values below them
+QUANTILE_FUNCTIONS = {
+    'median': 0.5,
+    'p90': 0.9,
+    'p95': 0.95,
+    'p99': 0.99
+}
+
+# Time bucket widths: their approximate length in seconds and the pandas
+# frequency of their gap-filling series (weeks start on Monday, as in SQL)
+TIME_GRAINS = {
+    'minute': (60, 'T'),
+    'hour': (60 * 60, 'H'),
+    'day': (24 * 60 * 60, 'D'),
+    'week': (7 * 24 * 60 * 60, 'W-MON'),
+    'month': (30.436875 * 24 * 60 * 60, 'MS')
+}
+
+# Buckets an automatically picked grain aims to stay under
+DEFAULT_TIME_POINTS = 200
+
+# Most buckets a time series may have
+MAX_TIME_BUCKETS = 10000
+
+# Aggregations whose empty buckets are zero rather than unknown
+ADDITIVE_AGGREGATIONS = ('sum', 'count', 'count_distinct')
+
+# Re-aggregation of the parts stored in a rollup, per requested aggregation
+ROLLUP_AGGREGATES = {
+    'sum': 'SUM({sum})',
+    'avg': 'SUM({sum}) / NULLIF(SUM({count}), 0)',
+    'count': 'CAST(COALESCE(SUM({count}), 0) AS BIGINT)',
+    'min': 'MIN({min})',
+    'max': 'MAX({max})'
+}
 
 class DataProcessor:
-    def __init__(self, dataset_id=None, data_source=None):
+    def __init__(self, dataset_id=None, data_source=None, statement_timeout=None):
         self.dataset_id = dataset_id
         self.data_source = data_source
+        self.statement_timeout = statement_timeout
         self.connection = None
         self.engine = None
+        self._file_dataset = None
+        self._duckdb_path = None
+        self._session_timeout = False
+        self._timer_timeout = False
     
     def connect_to_source(self, data_source=None):
         """Connect to the specified data source."""
@@ -25,23 +97,86 @@ class DataProcessor:
         
         if source_type == 'postgresql':
             connection_string = f"postgresql://{conn_params.get('user')}:{conn_params.get('password')}@{conn_params.get('host')}:{conn_params.get('port', 5432)}/{conn_params.get('database')}"
-            self.engine = create_engine(connection_string)
+            self.engine = engine_registry.get_engine(self.data_source, connection_string)
             self.connection = self.engine.connect()
+            
+            # Timestamps without a time zone are read as UTC, as on DuckDB,
+            # rather than in the server's TimeZone. Scoped to the current
+            # transaction, which ends when the connection goes back to the pool
+            self.connection.execute(text("SET LOCAL TimeZone = 'UTC'"))
         
         elif source_type == 'mysql':
             connection_string = f"mysql+pymysql://{conn_params.get('user')}:{conn_params.get('password')}@{conn_params.get('host')}:{conn_params.get('port', 3306)}/{conn_params.get('database')}"
-            self.engine = create_engine(connection_string)
+            self.engine = engine_registry.get_engine(self.data_source, connection_string)
             self.connection = self.engine.connect()
         
         elif source_type == 'duckdb':
-            db_path = conn_params.get('path', ':memory:')
-            self.connection = duckdb.connect(database=db_path)
+            # Queries (user SQL included) run in the file's sandbox, which
+            # attaches it read-only and can't read other files on the server
+            db_path = sandbox_path(conn_params.get('path', ':memory:'))
+            self.connection = duckdb_manager.cursor(db_path)
+            self._duckdb_path = db_path
+            
+            # Timestamps without a time zone are read as UTC
+            self.connection.execute("SET TimeZone='UTC'")
+        
+        elif source_type == 'file':
+            # Scan the columnar copy in place; DuckDB pushes projections and
+            # filters down into the Arrow dataset scan
+            self._file_dataset = pa_ds.dataset(ensure_parquet_copy(self.data_source), format='parquet')
+            
+            # A private cursor on the in-memory database for user SQL (which
+            # can't read files on the server) keeps these registrations from
+            # clashing with other processors on this thread
+            self.connection = duckdb_manager.connection(USER_SQL_DATABASE).cursor()
+            self._register_file_views()
+            
+            self.connection.execute("SET TimeZone='UTC'")
         
         else:
             raise ValueError(f"Unsupported data source type: {source_type}")
         
         return self.connection
     
+    @staticmethod
+    def _file_view_names(conn_params):
+        """
+        Names a file source can be queried by: its table name (``data`` by
+        default) and the SQL-friendly stem of the uploaded file.
+        """
+        names = [conn_params.get('table_name', 'data')]
+        stem = os.path.splitext(os.path.basename(conn_params['file_path']))[0]
+        stem = re.sub(r'[^a-zA-Z0-9]', '_', stem).lower()
+        if stem and stem not in names:
+            names.append(stem)
+        return names
+    
+    def _register_file_views(self, pushdown=None):
+        """
+        (Re-)register a file source's views over its Parquet copy, restricted
+        by the ``pushdown`` filters Arrow can evaluate, so row groups and rows
+        they rule out are skipped while scanning rather than filtered after.
+        """
+        dataset = filter_dataset(self._file_dataset, pushdown)
+        for view_name in self._file_view_names(self.data_source.connection_params):
+            self.connection.register(view_name, dataset)
+    
+    def _pushdown(self, filters):
+        """
+        Filters to push into a file source's scan: those of datasets reading
+        a table as it is. Those of dataset queries apply to the query's
+        output, not to the file.
+        """
+        if not filters or self.data_source.type != 'file' or self.dataset.query:
+            return None
+        return parse_filters(filters)
+    
+    def _default_table(self):
+        """Table to read when a dataset has neither a query nor a table name."""
+        if self.data_source.type == 'file':
+            return (self.data_source.connection_params or {}).get('table_name', 'data')
+        return None
+    
     def execute_query(self, query, params=None):
         """Execute a query against the connected data source."""
         if not self.connection:
@@ -62,11 +197,249 @@ class DataProcessor:
         
         return result
     
+    def cached_query(self, query, params=None, pushdown=None):
+        """
+        Execute a query through the result cache.
+        
+        Results are shared by every caller issuing the same query against the
+        same version of the source's data. The source is only connected to on
+        a cache miss. ``pushdown`` filters must also be in the query; they
+        only narrow the scan of file sources.
+        """
+        if not self.data_source:
+            raise ValueError("No data source specified")
+        
+        key = result_cache.key_for(self.data_source, query, params)
+        df = result_cache.get(key)
+        if df is not None:
+            return df
+        
+        df = self.direct_query(query, params, pushdown)
+        result_cache.set(key, df)
+        return df
+    
+    def direct_query(self, query, params=None, pushdown=None):
+        """
+        Execute a query on the source itself, bypassing the result cache.
+        Where the database can't enforce ``statement_timeout`` itself
+        (DuckDB), the statement is interrupted once it runs that long.
+        """
+        if not self.connection:
+            self.connect_to_source()
+            if self.statement_timeout:
+                self._timer_timeout = not self.set_statement_timeout(self.statement_timeout)
+        
+        if self._file_dataset is not None:
+            self._register_file_views(pushdown)
+        
+        if not self._timer_timeout:
+            return self.execute_query(query, params)
+        
+        timer = threading.Timer(self.statement_timeout, self.interrupt)
+        timer.daemon = True
+        timer.start()
+        try:
+            return self.execute_query(query, params)
+        except duckdb.InterruptException as e:
+            raise TimeoutError(f"Query exceeded the {self.statement_timeout}s timeout") from e
+        finally:
+            timer.cancel()
+    
+    def process_query(self, query, data_source=None, limit=None):
+        """
+        Run a SELECT against a file or DuckDB data source and return the
+        result as an Arrow table.
+        
+        The query runs in DuckDB directly over the source's columnar copy, so
+        only the columns and row groups it needs are read. With ``limit`` at
+        most that many rows are materialised, however large the file is.
+        """
+        if data_source:
+            self.data_source = data_source
+        
+        if not self.connection:
+            self.connect_to_source()
+        
+        if not isinstance(self.connection, duckdb.DuckDBPyConnection):
+            raise ValueError("Queries over files are only supported for file and DuckDB data sources")
+        
+        query = query.strip().rstrip(';')
+        if limit is not None:
+            query = f"SELECT * FROM ({query}) AS q LIMIT {int(limit)}"
+        
+        return self.connection.execute(query).arrow()
+    
+    def stream_query(self, query, params=None, batch_size=10000):
+        """
+        Execute a query and yield the result as Arrow record batches.
+        
+        DuckDB results are pulled with ``fetch_record_batch`` and SQLAlchemy
+        sources through a server-side cursor (``stream_results``), so only one
+        batch is held in memory at a time. At least one batch is yielded, so
+        consumers always see the result schema.
+        """
+        if not self.connection:
+            self.connect_to_source()
+        
+        query = query.strip().rstrip(';')
+        
+        if isinstance(self.connection, duckdb.DuckDBPyConnection):
+            if params:
+                result = self.connection.execute(query, params)
+            else:
+                result = self.connection.execute(query)
+            
+            reader = result.fetch_record_batch(batch_size)
+            empty = True
+            for batch in reader:
+                empty = False
+                yield batch
+            if empty:
+                yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+            return
+        
+        result = self.connection.execution_options(
+            stream_results=True, max_row_buffer=batch_size
+        ).execute(text(query), params or {})
+        
+        columns = list(result.keys())
+        schema = None
+        
+        try:
+            for rows in result.partitions(batch_size):
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(values) for values in zip(*rows)],
+                    names=columns
+                )
+                
+                # Batches of one stream share a schema; columns that were all
+                # null in the first batch are carried as strings
+                if schema is None:
+                    schema = pa.schema([
+                        field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                        for field in batch.schema
+                    ])
+                yield pa.Table.from_batches([batch]).cast(schema).to_batches()[0]
+            
+            if schema is None:
+                yield pa.RecordBatch.from_pylist([], schema=pa.schema([(name, pa.string()) for name in columns]))
+        finally:
+            result.close()
+    
+    def set_statement_timeout(self, seconds):
+        """
+        Have the database abort statements on this connection that run longer
+        than ``seconds``. Returns False where the database has no such limit
+        (DuckDB); callers then ``interrupt`` the statement themselves.
+        """
+        if not self.connection:
+            self.connect_to_source()
+        
+        milliseconds = int(seconds * 1000)
+        source_type = self.data_source.type
+        
+        if source_type == 'postgresql':
+            # Scoped to the current transaction, which ends when the
+            # connection goes back to the pool
+            self.connection.execute(text(f"SET LOCAL statement_timeout = {milliseconds}"))
+            return True
+        
+        if source_type == 'mysql':
+            # Session-scoped; reset in close() before the connection is reused
+            self.connection.execute(text(f"SET SESSION max_execution_time = {milliseconds}"))
+            self._session_timeout = True
+            return True
+        
+        return False
+    
+    def set_read_only(self):
+        """
+        Make the connection's current transaction read-only, so that nothing
+        a query does can modify the source. Returns False for DuckDB and file
+        sources, whose handles are read-only or sandboxed already.
+        """
+        if not self.connection:
+            self.connect_to_source()
+        
+        source_type = self.data_source.type
+        
+        if source_type == 'postgresql':
+            self.connection.execute(text("SET TRANSACTION READ ONLY"))
+            return True
+        
+        if source_type == 'mysql':
+            self.connection.execute(text("START TRANSACTION READ ONLY"))
+            return True
+        
+        return False
+    
+    def open_user_query(self):
+        """
+        Connect for running user-supplied SQL: file and DuckDB sources in
+        their sandbox, database sources in a read-only transaction. Raises
+        PermissionError rather than run on a DuckDB connection that can read
+        files on the server.
+        """
+        if not self.connection:
+            self.connect_to_source()
+        
+        if isinstance(self.connection, duckdb.DuckDBPyConnection):
+            external = self.connection.execute("SELECT current_setting('enable_external_access')").fetchone()[0]
+            if external:
+                raise PermissionError("User SQL must run in a sandboxed DuckDB database")
+            return
+        
+        self.set_read_only()
+    
+    def interrupt(self):
+        """
+        Cancel the statement running on this processor's connection. Meant to
+        be called from another thread than the one executing the query.
+        Returns False if the statement can't be interrupted.
+        """
+        connection = self.connection
+        if connection is None:
+            return False
+        
+        if isinstance(connection, duckdb.DuckDBPyConnection):
+            # Interrupts the statement running on this cursor only
+            connection.interrupt()
+            return True
+        
+        dbapi_connection = connection.connection.dbapi_connection
+        
+        if self.data_source.type == 'postgresql':
+            dbapi_connection.cancel()
+            return True
+        
+        if self.data_source.type == 'mysql':
+            # MySQL statements are killed from a second connection
+            thread_id = int(dbapi_connection.thread_id())
+            with self.engine.connect() as killer:
+                killer.execute(text(f"KILL QUERY {thread_id}"))
+            return True
+        
+        return False
+    
     def close(self):
         """Close the connection."""
         if self.connection and not isinstance(self.connection, duckdb.DuckDBPyConnection):
+            if self._session_timeout:
+                self.connection.rollback()
+                self.connection.execute(text("SET SESSION max_execution_time = DEFAULT"))
+                self._session_timeout = False
+            
+            # Return the connection to the pool; the engine is shared
+            self.connection.close()
+            self.connection = None
+        elif self.connection and self.data_source and self.data_source.type == 'file':
+            # File sources get a private cursor per processor; DuckDB source
+            # cursors belong to the connection manager
             self.connection.close()
-            self.engine.dispose()
+            self.connection = None
+        elif self.connection and self._duckdb_path:
+            duckdb_manager.release(self._duckdb_path)
+            self.connection = None
     
     def get_dataset_data(self, dataset=None, limit=1000, filters=None):
         """
@@ -76,134 +449,76 @@ class DataProcessor:
             self.dataset = dataset
         elif self.dataset_id:
             # Fetch dataset from database
-            self.dataset = Dataset.query.get(self.dataset_id)
+            self.dataset = db.session.query(Dataset).filter_by(id=self.dataset_id).first()
         
         if not self.dataset:
             raise ValueError("No dataset specified")
         
-        # Connect to the data source if not already connected
+        # Resolve the data source; connecting is left to cache misses
         if not self.data_source:
             self.data_source = DataSource.query.get(self.dataset.source_id)
         
-        if not self.connection:
-            self.connect_to_source()
-        
         # Build query from dataset definition
         if self.dataset.query:
-            base_query = self.dataset.query
-            
             # Wrap in a subquery to apply limit and filters
-            query = f"SELECT * FROM ({base_query}) as subq"
-            
-            # Add filters
-            if filters:
-                where_clauses = []
-                params = {}
-                
-                for idx, (column, operator, value) in enumerate(filters):
-                    param_name = f"param_{idx}"
-                    
-                    if operator == '=':
-                        where_clauses.append(f"{column} = :{param_name}")
-                    elif operator == '!=':
-                        where_clauses.append(f"{column} != :{param_name}")
-                    elif operator == '>':
-                        where_clauses.append(f"{column} > :{param_name}")
-                    elif operator == '<':
-                        where_clauses.append(f"{column} < :{param_name}")
-                    elif operator == 'in':
-                        where_clauses.append(f"{column} IN :{param_name}")
-                    elif operator == 'like':
-                        where_clauses.append(f"{column} LIKE :{param_name}")
-                    
-                    params[param_name] = value
-                
-                if where_clauses:
-                    query += " WHERE " + " AND ".join(where_clauses)
-            
-            # Add limit
-            query += f" LIMIT {limit}"
-            
-            # Execute query
-            if filters:
-                df = self.execute_query(query, params)
-            else:
-                df = self.execute_query(query)
-            
-        elif self.dataset.table_name:
+            query = f"SELECT * FROM ({self.dataset.query}) as subq"
+        elif self.dataset.table_name or self._default_table():
             # Direct table query
-            query = f"SELECT * FROM {self.dataset.table_name}"
-            
-            # Add filters
-            if filters:
-                where_clauses = []
-                params = {}
-                
-                for idx, (column, operator, value) in enumerate(filters):
-                    param_name = f"param_{idx}"
-                    
-                    if operator == '=':
-                        where_clauses.append(f"{column} = :{param_name}")
-                    elif operator == '!=':
-                        where_clauses.append(f"{column} != :{param_name}")
-                    elif operator == '>':
-                        where_clauses.append(f"{column} > :{param_name}")
-                    elif operator == '<':
-                        where_clauses.append(f"{column} < :{param_name}")
-                    elif operator == 'in':
-                        where_clauses.append(f"{column} IN :{param_name}")
-                    elif operator == 'like':
-                        where_clauses.append(f"{column} LIKE :{param_name}")
-                    
-                    params[param_name] = value
-                
-                if where_clauses:
-                    query += " WHERE " + " AND ".join(where_clauses)
-            
-            # Add limit
-            query += f" LIMIT {limit}"
-            
-            # Execute query
-            if filters:
-                df = self.execute_query(query, params)
-            else:
-                df = self.execute_query(query)
-            
+            query = f"SELECT * FROM {self.dataset.table_name or self._default_table()}"
         else:
             raise ValueError("Dataset has no query or table definition")
         
-        return df
+        # Add filters
+        where_clause, params = self._build_where(filters)
+        if where_clause:
+            query += f" {where_clause}"
+        
+        # Add limit
+        query += f" LIMIT {int(limit)}"
+        
+        # Execute query
+        return self.cached_query(query, params or None, self._pushdown(filters))
     
-    def get_aggregated_data(self, dataset=None, dimensions=None, metrics=None, filters=None):
+    def get_aggregated_data(self, dataset=None, dimensions=None, metrics=None, filters=None, sort=None, limit=None,
+                            approximate=False):
         """
         Get aggregated data for charts.
         
         Parameters:
         - dimensions: List of columns to group by
         - metrics: Dictionary mapping column names to aggregation functions
+          (sum, avg, min, max, count, count_distinct, median, p90, p95, p99);
+          ``*`` counts rows. Results are named ``<column>_<function>``
+          (``count`` for ``*``)
         - filters: List of tuples (column, operator, value)
+        - sort: List of (column or metric name, 'asc' or 'desc') tuples
+        - limit: Maximum number of rows (groups) returned
+        - approximate: Estimate the result from a sample of the dataset, or
+          with sketches for distinct counts and percentiles, where possible.
+          Estimates come with ``<metric>__margin`` columns, and
+          ``df.attrs['approximate']`` tells how they were made
+        
+        Queries a rollup covers are re-aggregated from it instead of scanning
+        the dataset.
         """
         if dataset:
             self.dataset = dataset
         elif self.dataset_id:
             # Fetch dataset from database
-            self.dataset = Dataset.query.get(self.dataset_id)
+            self.dataset = db.session.query(Dataset).filter_by(id=self.dataset_id).first()
         
         if not self.dataset:
             raise ValueError("No dataset specified")
         
-        # Connect to the data source if not already connected
+        # Resolve the data source; connecting is left to cache misses
         if not self.data_source:
             self.data_source = DataSource.query.get(self.dataset.source_id)
         
-        if not self.connection:
-            self.connect_to_source()
-        
         # Build query with aggregations
         if self.dataset.query:
             base_query = f"({self.dataset.query}) as subq"
-        elif self.dataset.table_name:
-            base_query = self.dataset.table_name
+        elif self.dataset.table_name or self._default_table():
+            base_query = self.dataset.table_name or self._default_table()
         else:
             raise ValueError("Dataset has no query or table definition")
         
@@ -213,53 +528,55 @@ class DataProcessor:
         # Add dimensions to SELECT
         if dimensions:
             for dim in dimensions:
-                select_parts.append(dim)
+                select_parts.append(self._quote_identifier(dim))
         
         # Add metrics with aggregations to SELECT
         if metrics:
             for col, agg_func in metrics.items():
-                select_parts.append(f"{agg_func}({col}) as {col}_{agg_func}")
+                select_parts.append(self._aggregate_expression(col, agg_func))
         
         if not select_parts:
             raise ValueError("No dimensions or metrics specified")
         
+        metric_pairs = list((metrics or {}).items())
+        rollup = rollups.find(self.dataset, self.data_source, dimensions or [], metric_pairs, filters)
+        if rollup is not None:
+            return self._query_rollup(rollup, [dimensions or []], metric_pairs, filters, sort, limit)
+        
+        sketches = False
+        if approximate:
+            sample = self._sample_for(dimensions or [], metric_pairs)
+            if sample is not None:
+                return self._query_sample(sample, dimensions or [], metric_pairs, filters, sort, limit)
+            
+            sketches = self._sketches_apply(metric_pairs)
+            if sketches:
+                select_parts = [self._quote_identifier(dim) for dim in dimensions or []] + [
+                    self._aggregate_expression(col, agg_func, approximate=True) for col, agg_func in metric_pairs
+                ]
+        
         select_clause = ", ".join(select_parts)
         
         # Construct FROM clause
         from_clause = base_query
         
         # Construct WHERE clause
-        where_clause = ""
-        params = {}
-        
-        if filters:
-            where_parts = []
-            
-            for idx, (column, operator, value) in enumerate(filters):
-                param_name = f"param_{idx}"
-                
-                if operator == '=':
-                    where_parts.append(f"{column} = :{param_name}")
-                elif operator == '!=':
-                    where_parts.append(f"{column} != :{param_name}")
-                elif operator == '>':
-                    where_parts.append(f"{column} > :{param_name}")
-                elif operator == '<':
-                    where_parts.append(f"{column} < :{param_name}")
-                elif operator == 'in':
-                    where_parts.append(f"{column} IN :{param_name}")
-                elif operator == 'like':
-                    where_parts.append(f"{column} LIKE :{param_name}")
-                
-                params[param_name] = value
-            
-            if where_parts:
-                where_clause = "WHERE " + " AND ".join(where_parts)
+        where_clause, params = self._build_where(filters)
         
         # Construct GROUP BY clause
         group_by_clause = ""
         if dimensions:
-            group_by_clause = "GROUP BY " + ", ".join(dimensions)
+            group_by_clause = "GROUP BY " + ", ".join(self._quote_identifier(dim) for dim in dimensions)
+        
+        # Construct ORDER BY clause
+        order_by_clause = ""
+        if sort:
+            order_parts = []
+            for column, direction in sort:
+                if str(direction).lower() not in ('asc', 'desc'):
+                    raise ValueError(f"Invalid sort direction: {direction}")
+                order_parts.append(f"{self._quote_identifier(column)} {direction.upper()}")
+            order_by_clause = "ORDER BY " + ", ".join(order_parts)
         
         # Assemble the full query
         query_parts = ["SELECT", select_clause, "FROM", from_clause]
@@ -270,12 +587,513 @@ class DataProcessor:
         if group_by_clause:
             query_parts.append(group_by_clause)
         
+        if order_by_clause:
+            query_parts.append(order_by_clause)
+        
+        if limit is not None:
+            query_parts.append(f"LIMIT {int(limit)}")
+        
         query = " ".join(query_parts)
         
         # Execute query
-        if filters:
-            df = self.execute_query(query, params)
+        df = self.cached_query(query, params or None, self._pushdown(filters))
+        if sketches:
+            df = self._with_sketch_margins(df, metric_pairs)
+        return df
+    
+    def _sample_for(self, dimensions, metrics):
+        """The sample an approximate aggregation can be estimated from, if any."""
+        if not all(str(agg_func).lower() in SAMPLE_AGGREGATIONS for _, agg_func in metrics):
+            return None
+        return samples.find(self.dataset, self.data_source, dimensions)
+    
+    def _sketches_apply(self, metrics):
+        """Whether an approximate aggregation is sped up by DuckDB's sketches."""
+        return self.data_source.type in ('file', 'duckdb') and any(
+            str(agg_func).lower() == 'count_distinct' or str(agg_func).lower() in QUANTILE_FUNCTIONS
+            for _, agg_func in metrics
+        )
+    
+    def _with_sketch_margins(self, df, metrics):
+        """
+        Add the margins of error of a sketched aggregation: relative to the
+        estimate for distinct counts, unknown for percentiles and none for
+        the metrics computed exactly.
+        """
+        df = df.copy()
+        for column, agg_func in metrics:
+            agg_func = str(agg_func).lower()
+            name = 'count' if column == '*' else f"{column}_{agg_func}"
+            if agg_func == 'count_distinct':
+                df[f"{name}__margin"] = df[name] * (CONFIDENCE_Z * HLL_RELATIVE_ERROR)
+            elif agg_func in QUANTILE_FUNCTIONS:
+                df[f"{name}__margin"] = np.nan
+            else:
+                df[f"{name}__margin"] = 0.0
+        df.attrs['approximate'] = {'method': 'sketch', 'confidence': CONFIDENCE}
+        return df
+    
+    def _query_sample(self, sample, dimensions, metrics, filters=None, sort=None, limit=None):
+        """
+        Estimate an aggregation from a weighted sample in DuckDB.
+        
+        Counts and sums are Horvitz-Thompson estimates (each row counted
+        ``__weight`` times) and averages their ratio. Their variances are
+        those of Bernoulli sampling, from which ``<metric>__margin`` columns
+        give the half-width of a ``CONFIDENCE`` interval. Minimums and
+        maximums are those of the sample, without a margin.
+        """
+        quote = lambda name: self._quote_identifier(name, rollup=True)
+        weight = quote(WEIGHT_COLUMN)
+        
+        inner_parts = [quote(dim) for dim in dimensions]
+        outer_parts = [quote(dim) for dim in dimensions]
+        
+        for i, (column, agg_func) in enumerate(metrics):
+            agg_func = str(agg_func).lower()
+            if column == '*' and agg_func != 'count':
+                raise ValueError("Only count can be applied to *")
+            
+            def part(label, expression):
+                alias = quote(f"__{i}_{label}")
+                inner_parts.append(f"{expression} AS {alias}")
+                return alias
+            
+            value = quote(column) if column != '*' else None
+            # Weight of the rows the metric counts, and its variance term
+            counted = weight if column == '*' else f"CASE WHEN {value} IS NOT NULL THEN {weight} ELSE 0 END"
+            spread = f"{counted} * ({weight} - 1)"
+            
+            variance = None
+            if agg_func in ('min', 'max'):
+                estimate = part('v', f"{agg_func.upper()}({value})")
+            elif agg_func == 'count':
+                estimate = f"COALESCE({part('n', f'SUM({counted})')}, 0)"
+                variance = f"COALESCE({part('v', f'SUM({spread})')}, 0)"
+            elif agg_func == 'sum':
+                estimate = part('s', f"SUM({weight} * {value})")
+                variance = part('v', f"SUM({weight} * ({weight} - 1) * {value} * {value})")
+            else:
+                # Ratio of the estimated sum to the estimated count, with the
+                # variance of its linearization
+                n = part('n', f"SUM({counted})")
+                total = part('s', f"SUM({weight} * {value})")
+                s0 = part('s0', f"SUM({spread})")
+                s1 = part('s1', f"SUM({weight} * ({weight} - 1) * {value})")
+                s2 = part('s2', f"SUM({weight} * ({weight} - 1) * {value} * {value})")
+                estimate = f"({total} / NULLIF({n}, 0))"
+                variance = f"({s2} - 2 * {estimate} * {s1} + {estimate} * {estimate} * {s0}) / NULLIF({n} * {n}, 0)"
+            
+            name = 'count' if column == '*' else f"{column}_{agg_func}"
+            margin = f"{CONFIDENCE_Z} * SQRT(GREATEST({variance}, 0))" if variance else "CAST(NULL AS DOUBLE)"
+            outer_parts.append(f"{estimate} AS {quote(name)}")
+            outer_parts.append(f"{margin} AS {quote(name + '__margin')}")
+        
+        where_clause, params = self._build_where(filters, rollup=True)
+        
+        inner_parts = ["SELECT", ", ".join(inner_parts), "FROM sample"]
+        if where_clause:
+            inner_parts.append(where_clause)
+        if dimensions:
+            inner_parts.append("GROUP BY " + ", ".join(quote(dim) for dim in dimensions))
+        
+        query_parts = ["SELECT", ", ".join(outer_parts), "FROM (" + " ".join(inner_parts) + ") AS estimates"]
+        
+        if sort:
+            order_parts = []
+            for column, direction in sort:
+                if str(direction).lower() not in ('asc', 'desc'):
+                    raise ValueError(f"Invalid sort direction: {direction}")
+                order_parts.append(f"{quote(column)} {direction.upper()}")
+            query_parts.append("ORDER BY " + ", ".join(order_parts))
+        
+        if limit is not None:
+            query_parts.append(f"LIMIT {int(limit)}")
+        
+        cursor = duckdb_manager.connection(':memory:').cursor()
+        try:
+            cursor.register('sample', filter_dataset(pa_ds.dataset(sample.path, format='parquet'), filters))
+            df = cursor.execute(" ".join(query_parts), params or []).fetchdf()
+        finally:
+            cursor.close()
+        
+        df.attrs['approximate'] = {
+            'method': 'sample',
+            'sample': sample.kind,
+            'sample_rows': sample.row_count,
+            'rows': sample.base_row_count,
+            'confidence': CONFIDENCE
+        }
+        return df
+    
+    def get_sample(self, dataset, fraction=None, strata=None, stratum_rows=None):
+        """
+        Draw a random sample of a dataset from the source itself, bypassing
+        the result cache.
+        
+        Rows are drawn independently with probability ``fraction`` or, with
+        ``strata``, up to ``stratum_rows`` at random per value of that
+        column. A ``__weight`` column holds the number of dataset rows each
+        sampled row stands for.
+        """
+        self.dataset = dataset
+        
+        if not self.data_source:
+            self.data_source = DataSource.query.get(self.dataset.source_id)
+        
+        if self.dataset.query:
+            from_clause = f"({self.dataset.query}) as subq"
+        elif self.dataset.table_name or self._default_table():
+            from_clause = self.dataset.table_name or self._default_table()
+        else:
+            raise ValueError("Dataset has no query or table definition")
+        
+        random = "RAND()" if self.data_source.type == 'mysql' else "random()"
+        
+        if strata is None:
+            df = self.direct_query(f"SELECT * FROM {from_clause} WHERE {random} < {float(fraction)}")
+            df[WEIGHT_COLUMN] = 1.0 / fraction
+            return df
+        
+        column = self._quote_identifier(strata)
+        df = self.direct_query(
+            f"SELECT * FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY {column} ORDER BY {random}) AS __rn, "
+            f"COUNT(*) OVER (PARTITION BY {column}) AS __n FROM {from_clause}) AS strata "
+            f"WHERE __rn <= {int(stratum_rows)}"
+        )
+        df[WEIGHT_COLUMN] = df['__n'] / np.minimum(df['__n'], int(stratum_rows))
+        return df.drop(columns=['__rn', '__n'])
+    
+    def get_grouped_data(self, dataset=None, grouping_sets=None, metrics=None, filters=None, limit=None, direct=False):
+        """
+        Aggregate the same metrics over several groupings in a single scan.
+        
+        Parameters:
+        - grouping_sets: List of dimension lists; a single set is a plain
+          GROUP BY, several become GROUP BY GROUPING SETS
+        - metrics: List of (column, aggregation) pairs, named like in
+          ``get_aggregated_data``
+        - filters: List of tuples (column, operator, value)
+        - limit: Maximum number of rows returned over all sets
+        - direct: Scan the source itself, bypassing rollups and the result
+          cache (e.g. to build a rollup)
+        
+        With several sets, a ``__grouping`` column holds the bitmask of
+        ``GROUPING()`` over all dimensions (first dimension most significant),
+        telling which set each row belongs to.
+        """
+        if dataset:
+            self.dataset = dataset
+        
+        if not self.dataset:
+            raise ValueError("No dataset specified")
+        
+        if not self.data_source:
+            self.data_source = DataSource.query.get(self.dataset.source_id)
+        
+        if not grouping_sets:
+            raise ValueError("No grouping sets specified")
+        
+        # Every dimension of any set, in first-seen order
+        dimensions = list(dict.fromkeys(dim for grouping_set in grouping_sets for dim in grouping_set))
+        
+        if not direct:
+            rollup = rollups.find(self.dataset, self.data_source, dimensions, metrics or [], filters)
+            if rollup is not None:
+                return self._query_rollup(rollup, grouping_sets, metrics or [], filters, limit=limit)
+        
+        if self.dataset.query:
+            from_clause = f"({self.dataset.query}) as subq"
+        elif self.dataset.table_name or self._default_table():
+            from_clause = self.dataset.table_name or self._default_table()
+        else:
+            raise ValueError("Dataset has no query or table definition")
+        
+        quoted = [self._quote_identifier(dim) for dim in dimensions]
+        
+        select_parts = quoted + [self._aggregate_expression(col, agg_func) for col, agg_func in metrics or []]
+        
+        if len(grouping_sets) == 1:
+            group_by_clause = "GROUP BY " + ", ".join(quoted) if quoted else ""
+        else:
+            if self.data_source.type == 'mysql':
+                raise ValueError("GROUPING SETS are not supported for MySQL data sources")
+            select_parts.append(f"GROUPING({', '.join(quoted)}) AS {self._quote_identifier('__grouping')}")
+            sets = ", ".join(
+                "(" + ", ".join(self._quote_identifier(dim) for dim in grouping_set) + ")"
+                for grouping_set in grouping_sets
+            )
+            group_by_clause = f"GROUP BY GROUPING SETS ({sets})"
+        
+        where_clause, params = self._build_where(filters)
+        
+        query_parts = ["SELECT", ", ".join(select_parts), "FROM", from_clause]
+        
+        if where_clause:
+            query_parts.append(where_clause)
+        
+        if group_by_clause:
+            query_parts.append(group_by_clause)
+        
+        if limit is not None:
+            query_parts.append(f"LIMIT {int(limit)}")
+        
+        if direct:
+            return self.direct_query(" ".join(query_parts), params or None, self._pushdown(filters))
+        return self.cached_query(" ".join(query_parts), params or None, self._pushdown(filters))
+    
+    def get_time_series_data(self, dataset=None, time_column=None, grain='auto', metrics=None, series=None,
+                             filters=None, timezone='UTC', points=DEFAULT_TIME_POINTS):
+        """
+        Aggregate metrics per time bucket, with the buckets computed in the
+        database and empty ones filled in.
+        
+        Parameters:
+        - time_column: Timestamp column bucketed with ``date_trunc``
+        - grain: ``minute``, ``hour``, ``day``, ``week`` or ``month``, or
+          ``auto`` for the finest one giving at most ``points`` buckets over
+          the range
+        - metrics: Dictionary mapping column names to aggregation functions,
+          named like in ``get_aggregated_data``
+        - series: Optional column splitting each bucket into one row per value
+        - filters: List of tuples (column, operator, value); ``>``/``>=`` and
+          ``<``/``<=`` bounds on the time column set the range to fill
+        - timezone: IANA time zone the buckets are aligned to and labelled in;
+          timestamps without a time zone are read as UTC
+        
+        The time column of the result holds the start of each bucket, in
+        order. Buckets without rows are filled with 0 for sums and counts and
+        left null for the other aggregations. ``df.attrs['time']`` tells the
+        grain and time zone used.
+        """
+        if dataset:
+            self.dataset = dataset
+        
+        if not self.dataset:
+            raise ValueError("No dataset specified")
+        
+        if not self.data_source:
+            self.data_source = DataSource.query.get(self.dataset.source_id)
+        
+        if grain != 'auto' and grain not in TIME_GRAINS:
+            raise ValueError(f"Unsupported time grain: {grain}")
+        
+        try:
+            zone = zoneinfo.ZoneInfo(timezone)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown time zone: {timezone}")
+        
+        if self.dataset.query:
+            from_clause = f"({self.dataset.query}) as subq"
+        elif self.dataset.table_name or self._default_table():
+            from_clause = self.dataset.table_name or self._default_table()
+        else:
+            raise ValueError("Dataset has no query or table definition")
+        
+        where_clause, params = self._build_where(filters)
+        pushdown = self._pushdown(filters)
+        column = self._quote_identifier(time_column)
+        
+        # Range to bucket and fill: the filter bounds or, where there are
+        # none, the first and last timestamps
+        start, end = None, None
+        for filter_column, operator, value in filters or []:
+            operator = str(operator).lower()
+            if filter_column == time_column and operator in ('>', '>='):
+                start = self._local_time(value, zone)
+            elif filter_column == time_column and operator in ('<', '<='):
+                end = self._local_time(value, zone)
+        
+        if start is None or end is None:
+            bounds = self.cached_query(
+                f"SELECT MIN({column}) AS first_time, MAX({column}) AS last_time FROM {from_clause} {where_clause}",
+                params or None,
+                pushdown
+            )
+            if start is None:
+                start = self._local_time(bounds['first_time'].iloc[0], zone)
+            if end is None:
+                end = self._local_time(bounds['last_time'].iloc[0], zone)
+        
+        if grain == 'auto':
+            span = (end - start).total_seconds() if start is not None and end is not None else 0
+            grain = next(
+                (name for name, (seconds, _) in TIME_GRAINS.items() if span / seconds <= points),
+                'month'
+            )
+        
+        seconds, frequency = TIME_GRAINS[grain]
+        if start is not None and end is not None and (end - start).total_seconds() / seconds > MAX_TIME_BUCKETS:
+            raise ValueError(f"More than {MAX_TIME_BUCKETS} {grain} buckets; use a coarser time grain")
+        
+        # Zone names are validated above and can't carry quotes
+        if self.data_source.type in ('file', 'duckdb'):
+            bucket = f"CAST(date_trunc('{grain}', timezone('{zone.key}', CAST({column} AS TIMESTAMPTZ))) AS TIMESTAMP)"
+        elif self.data_source.type == 'postgresql':
+            bucket = f"date_trunc('{grain}', CAST({column} AS TIMESTAMPTZ) AT TIME ZONE '{zone.key}')"
         else:
-            df = self.execute_query(query)
+            raise ValueError(f"Time bucketing is not supported for {self.data_source.type} data sources")
         
+        dimensions = [series] if series else []
+        select_parts = [f"{bucket} AS {column}"] + [self._quote_identifier(dim) for dim in dimensions]
+        select_parts += [self._aggregate_expression(col, agg_func) for col, agg_func in (metrics or {}).items()]
+        group_parts = [bucket] + [self._quote_identifier(dim) for dim in dimensions]
+        
+        query_parts = ["SELECT", ", ".join(select_parts), "FROM", from_clause]
+        if where_clause:
+            query_parts.append(where_clause)
+        query_parts.append("GROUP BY " + ", ".join(group_parts))
+        
+        df = self.cached_query(" ".join(query_parts), params or None, pushdown)
+        df[time_column] = pd.to_datetime(df[time_column])
+        
+        if start is not None and end is not None:
+            df = self._fill_time_buckets(df, time_column, grain, start, end, series, metrics or {})
+        
+        df.attrs['time'] = {'grain': grain, 'timezone': zone.key}
         return df
+    
+    @staticmethod
+    def _local_time(value, zone):
+        """A timestamp (or its text) as a naive wall-clock time in ``zone``, or None."""
+        if value is None or pd.isna(value):
+            return None
+        timestamp = pd.Timestamp(value)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize('UTC')
+        return timestamp.tz_convert(zone).tz_localize(None)
+    
+    @staticmethod
+    def _fill_time_buckets(df, time_column, grain, start, end, series, metrics):
+        """
+        Complete a bucketed result with the buckets from ``start`` to ``end``
+        (per series value) that had no rows, in order.
+        """
+        if grain == 'week':
+            first = start.normalize() - pd.Timedelta(days=start.weekday())
+        elif grain == 'month':
+            first = start.normalize().replace(day=1)
+        else:
+            first = start.floor(TIME_GRAINS[grain][1])
+        buckets = pd.date_range(first, end, freq=TIME_GRAINS[grain][1], name=time_column)
+        dtypes = df.dtypes
+        
+        if series:
+            index = pd.MultiIndex.from_product([buckets, pd.unique(df[series])], names=[time_column, series])
+            df = df.set_index([time_column, series]).reindex(index)
+        else:
+            df = df.set_index(time_column).reindex(buckets)
+        
+        for col, agg_func in metrics.items():
+            name = 'count' if col == '*' else f"{col}_{str(agg_func).lower()}"
+            if str(agg_func).lower() in ADDITIVE_AGGREGATIONS:
+                df[name] = df[name].fillna(0).astype(dtypes[name])
+        
+        return df.reset_index()
+    
+    def _query_rollup(self, rollup, grouping_sets, metrics, filters=None, sort=None, limit=None):
+        """
+        Answer an aggregation from a rollup file in DuckDB, re-aggregating its
+        stored parts. Results have the columns the dataset query would have.
+        """
+        quote = lambda name: self._quote_identifier(name, rollup=True)
+        
+        dimensions = list(dict.fromkeys(dim for grouping_set in grouping_sets for dim in grouping_set))
+        select_parts = [quote(dim) for dim in dimensions]
+        
+        for column, agg_func in metrics:
+            agg_func = str(agg_func).lower()
+            parts = {
+                component: quote(component_column(column, component))
+                for component in ('sum', 'count', 'min', 'max')
+            }
+            alias = 'count' if column == '*' else f"{column}_{agg_func}"
+            select_parts.append(f"{ROLLUP_AGGREGATES[agg_func].format(**parts)} AS {quote(alias)}")
+        
+        group_by_clause = ""
+        if len(grouping_sets) > 1:
+            select_parts.append(f"GROUPING({', '.join(quote(dim) for dim in dimensions)}) AS {quote('__grouping')}")
+            sets = ", ".join(
+                "(" + ", ".join(quote(dim) for dim in grouping_set) + ")"
+                for grouping_set in grouping_sets
+            )
+            group_by_clause = f"GROUP BY GROUPING SETS ({sets})"
+        elif dimensions:
+            group_by_clause = "GROUP BY " + ", ".join(quote(dim) for dim in dimensions)
+        
+        where_clause, params = self._build_where(filters, rollup=True)
+        
+        query_parts = ["SELECT", ", ".join(select_parts), "FROM rollup"]
+        
+        if where_clause:
+            query_parts.append(where_clause)
+        
+        if group_by_clause:
+            query_parts.append(group_by_clause)
+        
+        if sort:
+            order_parts = []
+            for column, direction in sort:
+                if str(direction).lower() not in ('asc', 'desc'):
+                    raise ValueError(f"Invalid sort direction: {direction}")
+                order_parts.append(f"{quote(column)} {direction.upper()}")
+            query_parts.append("ORDER BY " + ", ".join(order_parts))
+        
+        if limit is not None:
+            query_parts.append(f"LIMIT {int(limit)}")
+        
+        cursor = duckdb_manager.connection(':memory:').cursor()
+        try:
+            cursor.register('rollup', filter_dataset(pa_ds.dataset(rollup.path, format='parquet'), filters))
+            return cursor.execute(" ".join(query_parts), params or []).fetchdf()
+        finally:
+            cursor.close()
+    
+    def _quote_identifier(self, name, rollup=False):
+        """Quote a column name for the connected database (or for rollups, in DuckDB)."""
+        if rollup or not self.data_source:
+            return quote_identifier(name, 'duckdb')
+        return quote_identifier(name, dialect_for(self.data_source.type))
+    
+    def _aggregate_expression(self, column, agg_func, approximate=False):
+        """
+        SELECT expression of one metric, aliased ``<column>_<function>``.
+        With ``approximate``, distinct counts and percentiles use DuckDB's
+        sketches (HyperLogLog and t-digest).
+        """
+        agg_func = str(agg_func).lower()
+        if agg_func not in AGGREGATE_FUNCTIONS and agg_func not in QUANTILE_FUNCTIONS:
+            raise ValueError(f"Unsupported aggregation: {agg_func}")
+        
+        if column == '*':
+            if agg_func != 'count':
+                raise ValueError("Only count can be applied to *")
+            return f"COUNT(*) AS {self._quote_identifier('count')}"
+        
+        alias = self._quote_identifier(f"{column}_{agg_func}")
+        quoted = self._quote_identifier(column)
+        
+        if agg_func in QUANTILE_FUNCTIONS:
+            fraction = QUANTILE_FUNCTIONS[agg_func]
+            if approximate:
+                expression = f"approx_quantile({quoted}, {fraction})"
+            elif self.data_source.type == 'postgresql':
+                expression = f"PERCENTILE_CONT({fraction}) WITHIN GROUP (ORDER BY {quoted})"
+            elif self.data_source.type == 'mysql':
+                raise ValueError("Percentiles are not supported for MySQL data sources")
+            else:
+                expression = f"quantile_cont({quoted}, {fraction})"
+        elif approximate and agg_func == 'count_distinct':
+            expression = f"approx_count_distinct({quoted})"
+        else:
+            expression = AGGREGATE_FUNCTIONS[agg_func].format(quoted)
+        
+        return f"{expression} AS {alias}"
+    
+    def _build_where(self, filters, rollup=False):
+        """
+        Compile (column, operator, value) filters into a WHERE clause and its
+        bound parameters for the connected database (or for rollups and
+        samples, DuckDB).
+        """
+        return compile_where(filters, 'duckdb' if rollup else dialect_for(self.data_source.type))
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+# Ways of picking the points to draw out of a long series
+DOWNSAMPLING_METHODS = ('lttb', 'minmax', 'reservoir')
+DEFAULT_METHOD = 'lttb'
+
+# Most rows read to downsample a series from
+DEFAULT_SOURCE_ROWS = 1000000
+
+# Points kept per series, however small the budget; a line needs its ends
+# and something in between
+MIN_POINTS = 3
+
+# Reservoir samples are seeded, so the same data gives the same points
+RESERVOIR_SEED = 0
+
+
+def _as_numeric(values):
+    """
+    X values as floats: timestamps as nanoseconds, numbers as they are and
+    anything else (e.g. category labels) by position.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype('int64').to_numpy(dtype=float)
+    if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+    return np.arange(len(values), dtype=float)
+
+
+def lttb(x, y, points):
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps out of
+    x-sorted ``x``/``y``: the first and last points, and from each of
+    ``points - 2`` equal buckets in between the point forming the largest
+    triangle with the point kept before it and the mean of the next bucket.
+    """
+    n = len(x)
+    if n <= points:
+        return np.arange(n)
+    if points < MIN_POINTS:
+        return np.array([0, n - 1])
+
+    # Bucket i holds points edges[i]..edges[i + 1] - 1
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    counts = np.diff(edges)
+
+    # Mean of every bucket, and the last point as the bucket after the last
+    mean_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts, y[-1])
+
+    kept = np.empty(points, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        # Twice the triangle areas; the factor doesn't change the largest
+        areas = np.abs(
+            (x[a] - mean_x[i + 1]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (mean_y[i + 1] - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+
+    return kept
+
+
+def minmax(x, y, points):
+    """
+    Indices of the lowest and highest point in each of ``points // 2`` equal
+    buckets of x-sorted ``x``/``y``, in order: the envelope of the series,
+    keeping every spike.
+    """
+    n = len(x)
+    if n <= points:
+        return np.arange(n)
+
+    buckets = max(points // 2, 1)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    counts = np.diff(edges)
+    ids = np.repeat(np.arange(buckets), counts)
+
+    def first_where(extremes):
+        # First position in each bucket holding its extreme value
+        hits = np.flatnonzero(y == np.repeat(extremes, counts))
+        _, first = np.unique(ids[hits], return_index=True)
+        return hits[first]
+
+    lowest = first_where(np.minimum.reduceat(y, edges[:-1]))
+    highest = first_where(np.maximum.reduceat(y, edges[:-1]))
+    return np.unique(np.concatenate([lowest, highest]))
+
+
+def reservoir(n, points, seed=RESERVOIR_SEED):
+    """Indices of ``points`` of ``n`` points drawn uniformly at random, in order."""
+    if n <= points:
+        return np.arange(n)
+    return np.sort(np.random.default_rng(seed).choice(n, size=points, replace=False))
+
+
+def _select(df, x, y, points, method):
+    """Positions in ``df`` of the rows a method keeps."""
+    xs = _as_numeric(df[x])
+    ys = df[y].to_numpy(dtype=float, na_value=np.nan)
+
+    # Only points that can be drawn take part
+    plottable = np.flatnonzero(np.isfinite(xs) & np.isfinite(ys))
+    order = plottable[np.argsort(xs[plottable], kind='stable')]
+
+    if method == 'reservoir':
+        kept = reservoir(len(order), points)
+    elif method == 'minmax':
+        kept = minmax(xs[order], ys[order], points)
+    else:
+        kept = lttb(xs[order], ys[order], points)
+
+    return np.sort(order[kept])
+
+
+def downsample(df, x, y, points, method=DEFAULT_METHOD, by=None):
+    """
+    Reduce a series to at most ``points`` rows (``MIN_POINTS`` per group at
+    least), keeping the row order.
+
+    ``x`` and ``y`` are the columns picking the points; other columns
+    follow their rows. With ``by``, each group of rows (e.g. a chart
+    series) gets an equal share of the points. Rows without a drawable x or
+    y value are dropped.
+    """
+    if method not in DOWNSAMPLING_METHODS:
+        raise ValueError(f"Unsupported downsampling method: {method}")
+
+    if by is None:
+        return df.iloc[_select(df, x, y, max(int(points), MIN_POINTS), method)]
+
+    groups = df.groupby(by, sort=False, dropna=False).indices
+    share = max(int(points) // max(len(groups), 1), MIN_POINTS)
+    positions = [
+        rows[_select(df.iloc[rows], x, y, share, method)]
+        for rows in groups.values()
+    ]
+    if not positions:
+        return df
+    return df.iloc[np.sort(np.concatenate(positions))]
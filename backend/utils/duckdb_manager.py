@@ -0,0 +1,178 @@
+import atexit
+import os
+import threading
+from collections import Counter
+import duckdb
+
+# In-memory database user SQL over file sources runs in. It has external
+# access disabled, which can't be undone, so it is kept apart from the
+# default in-memory database that reads rollup and sample files
+USER_SQL_DATABASE = ':memory:user-sql'
+
+# Catalog a DuckDB source's file is attached as in its sandbox database
+SANDBOX_CATALOG = 'source'
+
+# Longest a writable connection waits for the readers of a read-only one
+UPGRADE_TIMEOUT = 60
+
+
+def sandbox_path(db_path):
+    """
+    Name of the sandbox database for user SQL over a DuckDB file: an
+    in-memory database with external access disabled, the file attached
+    read-only as its default catalog.
+    """
+    return f'{USER_SQL_DATABASE}:{db_path}'
+
+
+def _sandboxed_file(db_path):
+    """The DuckDB file attached to a sandbox database, if any."""
+    prefix = f'{USER_SQL_DATABASE}:'
+    return db_path[len(prefix):] if db_path.startswith(prefix) else None
+
+
+class DuckDBManager:
+    """
+    Keeps one long-lived DuckDB connection per database file and hands each
+    thread its own cursor on it.
+
+    Opening a database is expensive (file locks, catalog load), while cursors
+    are cheap views onto an already open database. Query paths open databases
+    read-only; a writable connection serves readers as well. A read-only
+    connection is only replaced by a writable one once no other thread holds
+    a cursor on it (see ``release``). Connections are closed when the
+    process exits and are never reused across a fork.
+
+    Paths starting with ``:memory:`` name separate in-memory databases;
+    ``sandbox_path`` ones have a DuckDB file attached.
+    """
+
+    def __init__(self):
+        self._connections = {}
+        self._generations = {}
+        self._holders = {}
+        self._lock = threading.RLock()
+        self._released = threading.Condition(self._lock)
+        self._local = threading.local()
+        self._pid = os.getpid()
+        atexit.register(self.shutdown)
+
+    def _check_fork(self):
+        # Handles inherited from a parent process (e.g. gunicorn --preload)
+        # belong to the parent; start over instead of sharing them
+        if os.getpid() != self._pid:
+            self._connections = {}
+            self._generations = {}
+            self._holders = {}
+            self._local = threading.local()
+            self._pid = os.getpid()
+
+    def connection(self, db_path=':memory:', read_only=False):
+        """Return the shared connection to a database, opening it if needed."""
+        in_memory = db_path.startswith(':memory:')
+        # In-memory databases can't be opened read-only
+        read_only = read_only and not in_memory
+
+        with self._lock:
+            self._check_fork()
+
+            entry = self._connections.get(db_path)
+            if entry:
+                conn, entry_read_only = entry
+                if read_only or not entry_read_only:
+                    return conn
+
+                # DuckDB can't mix read-only and writable handles on one
+                # file, so the read-only one is closed once its cursors are
+                # no longer in use
+                self._wait_for_readers(db_path)
+                entry = self._connections.get(db_path)
+                if entry and entry[0] is conn:
+                    self._connections.pop(db_path)
+                    self._holders.pop(db_path, None)
+                    conn.close()
+                elif entry and not entry[1]:
+                    # Another thread upgraded it meanwhile
+                    return entry[0]
+
+            conn = duckdb.connect(database=':memory:' if in_memory else db_path, read_only=read_only)
+            attached = _sandboxed_file(db_path)
+            if attached:
+                # Attaching reads a file, so it has to come first
+                quoted = attached.replace("'", "''")
+                conn.execute(f"ATTACH '{quoted}' AS {SANDBOX_CATALOG} (READ_ONLY)")
+            if db_path == USER_SQL_DATABASE or attached:
+                # User queries must not be able to read other files on the server
+                conn.execute("SET enable_external_access=false")
+            self._connections[db_path] = (conn, read_only)
+            self._generations[db_path] = self._generations.get(db_path, 0) + 1
+            return conn
+
+    def _wait_for_readers(self, db_path):
+        """Wait (holding the lock) until only the calling thread holds cursors on a database."""
+        me = threading.get_ident()
+        if not self._released.wait_for(
+            lambda: not any(holder != me for holder in self._holders.get(db_path, ())),
+            timeout=UPGRADE_TIMEOUT
+        ):
+            raise TimeoutError(f"DuckDB database {db_path} is still being read")
+
+    def cursor(self, db_path=':memory:', read_only=False):
+        """
+        Return the calling thread's cursor on a shared database. Callers
+        ``release`` it once they are done with it.
+        """
+        with self._lock:
+            conn = self.connection(db_path, read_only)
+            generation = self._generations[db_path]
+            self._holders.setdefault(db_path, Counter())[threading.get_ident()] += 1
+
+        cursors = getattr(self._local, 'cursors', None)
+        if cursors is None:
+            cursors = self._local.cursors = {}
+
+        cached = cursors.get(db_path)
+        if cached and cached[0] == generation:
+            return cached[1]
+
+        cursor = conn.cursor()
+        if _sandboxed_file(db_path):
+            # Each cursor starts out in the (empty) in-memory catalog
+            cursor.execute(f"USE {SANDBOX_CATALOG}")
+        cursors[db_path] = (generation, cursor)
+        return cursor
+
+    def release(self, db_path):
+        """Mark the calling thread as done with its cursor on a database."""
+        with self._lock:
+            holders = self._holders.get(db_path)
+            me = threading.get_ident()
+            if holders and holders[me]:
+                holders[me] -= 1
+                if not holders[me]:
+                    del holders[me]
+                self._released.notify_all()
+
+    def close(self, db_path):
+        """
+        Close a database, e.g. before its file is replaced or deleted, along
+        with the sandbox it is attached to.
+        """
+        with self._lock:
+            for path in (db_path, sandbox_path(db_path)):
+                entry = self._connections.pop(path, None)
+                self._holders.pop(path, None)
+                if entry:
+                    self._generations[path] = self._generations.get(path, 0) + 1
+                    entry[0].close()
+
+    def shutdown(self):
+        """Close every open database."""
+        with self._lock:
+            if os.getpid() != self._pid:
+                return
+            for db_path in list(self._connections):
+                self.close(db_path)
+
+
+duckdb_manager = DuckDBManager()
@@ -0,0 +1,108 @@
+import atexit
+import hashlib
+import json
+import threading
+from sqlalchemy import create_engine
+
+
+def _params_hash(data_source):
+    """Stable hash of everything that determines where a source connects to."""
+    payload = json.dumps(
+        {'type': data_source.type, 'params': data_source.connection_params or {}},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class EngineRegistry:
+    """
+    Process-wide registry of pooled SQLAlchemy engines for external data
+    sources.
+
+    One engine is kept per data source, keyed by the source id and a hash of
+    its connection params, so requests reuse pooled connections instead of
+    paying a TCP and auth handshake each time. Changing a source's params
+    yields a new key; the stale engine is disposed when it is replaced or
+    explicitly invalidated.
+    """
+
+    def __init__(self, app=None):
+        self._engines = {}
+        self._lock = threading.Lock()
+        self.pool_options = {
+            'pool_size': 5,
+            'max_overflow': 10,
+            'pool_timeout': 30,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.pool_options = {
+            'pool_size': app.config['SOURCE_POOL_SIZE'],
+            'max_overflow': app.config['SOURCE_POOL_MAX_OVERFLOW'],
+            'pool_timeout': app.config['SOURCE_POOL_TIMEOUT'],
+            'pool_recycle': app.config['SOURCE_POOL_RECYCLE'],
+            'pool_pre_ping': app.config['SOURCE_POOL_PRE_PING']
+        }
+        atexit.register(self.dispose_all)
+
+    def get_engine(self, data_source, connection_string):
+        """Return the pooled engine for a data source, creating it if needed."""
+        key = (data_source.id, _params_hash(data_source))
+
+        with self._lock:
+            entry = self._engines.get(data_source.id)
+            if entry and entry[0] == key:
+                return entry[1]
+
+            engine = create_engine(connection_string, **self.pool_options)
+            self._engines[data_source.id] = (key, engine)
+
+        # Connection params changed since the old engine was created
+        if entry:
+            entry[1].dispose()
+
+        return engine
+
+    def invalidate(self, source_id):
+        """Dispose the pooled engine of a data source, if any."""
+        with self._lock:
+            entry = self._engines.pop(source_id, None)
+
+        if entry:
+            entry[1].dispose()
+
+    def dispose_all(self):
+        """Dispose every pooled engine, e.g. when a worker shuts down."""
+        with self._lock:
+            entries = list(self._engines.values())
+            self._engines.clear()
+
+        for _, engine in entries:
+            engine.dispose()
+
+    def stats(self):
+        """Pool statistics per data source for monitoring."""
+        with self._lock:
+            entries = list(self._engines.items())
+
+        stats = {}
+        for source_id, ((_, params_hash), engine) in entries:
+            pool = engine.pool
+            stats[source_id] = {
+                'params_hash': params_hash,
+                'dialect': engine.dialect.name,
+                'pool_size': pool.size() if hasattr(pool, 'size') else None,
+                'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+                'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+                'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+                'status': pool.status()
+            }
+        return stats
+
+
+engine_registry = EngineRegistry()
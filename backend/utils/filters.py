@@ -0,0 +1,282 @@
+import operator
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# SQL dialect of each data source type; file sources are queried in DuckDB
+DIALECTS = {
+    'file': 'duckdb',
+    'duckdb': 'duckdb',
+    'postgresql': 'postgresql',
+    'mysql': 'mysql'
+}
+
+# Binary filter operators, their SQL spelling and Arrow equivalent
+COMPARISON_OPERATORS = {
+    '=': ('=', operator.eq),
+    '!=': ('<>', operator.ne),
+    '>': ('>', operator.gt),
+    '<': ('<', operator.lt),
+    '>=': ('>=', operator.ge),
+    '<=': ('<=', operator.le)
+}
+
+
+def dialect_for(source_type):
+    """SQL dialect filters are compiled to for a data source type."""
+    if source_type not in DIALECTS:
+        raise ValueError(f"Unsupported data source type: {source_type}")
+    return DIALECTS[source_type]
+
+
+def quote_identifier(name, dialect):
+    """Quote a column name for a dialect."""
+    if dialect == 'mysql':
+        return '`' + str(name).replace('`', '``') + '`'
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class SQLCompiler:
+    """
+    Collects the bound parameters of a WHERE clause in the parameter style of
+    a dialect: a list for DuckDB's ``?`` placeholders, a dict of ``:name``
+    binds for the SQLAlchemy sources (PostgreSQL and MySQL).
+    """
+
+    def __init__(self, dialect):
+        if dialect not in DIALECTS.values():
+            raise ValueError(f"Unsupported SQL dialect: {dialect}")
+        self.dialect = dialect
+        self.params = [] if dialect == 'duckdb' else {}
+
+    def quote(self, name):
+        return quote_identifier(name, self.dialect)
+
+    def bind(self, value):
+        if self.dialect == 'duckdb':
+            self.params.append(value)
+            return "?"
+        name = f"param_{len(self.params)}"
+        self.params[name] = value
+        return f":{name}"
+
+
+def _is_scalar(value):
+    return not isinstance(value, (list, tuple, set, dict))
+
+
+def _arrow_scalar(value, field):
+    """
+    ``value`` as a scalar of a column's Arrow type, or None when it doesn't
+    convert losslessly (the filter is then left to SQL alone).
+    """
+    if value is None:
+        return None
+    if (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)) != isinstance(value, str):
+        # Only temporal columns are compared with text
+        if not (isinstance(value, str) and pa.types.is_temporal(field.type)):
+            return None
+    try:
+        return pa.scalar(value).cast(field.type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, TypeError, ValueError):
+        return None
+
+
+class Predicate:
+    """A node of a filter expression."""
+
+    def columns(self):
+        """Columns the predicate reads."""
+        raise NotImplementedError
+
+    def to_sql(self, compiler):
+        """SQL condition, with its values bound through ``compiler``."""
+        raise NotImplementedError
+
+    def to_arrow(self, schema):
+        """
+        Equivalent Arrow expression over ``schema``, or None if Arrow can't
+        evaluate it exactly like the database would.
+        """
+        raise NotImplementedError
+
+
+class Comparison(Predicate):
+    def __init__(self, column, op, value):
+        if op not in COMPARISON_OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        if not _is_scalar(value):
+            raise ValueError(f"Filter {column} {op} needs a single value")
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def columns(self):
+        return {self.column}
+
+    def to_sql(self, compiler):
+        return f"{compiler.quote(self.column)} {COMPARISON_OPERATORS[self.op][0]} {compiler.bind(self.value)}"
+
+    def to_arrow(self, schema):
+        if self.column not in schema.names:
+            return None
+        value = _arrow_scalar(self.value, schema.field(self.column))
+        if value is None:
+            return None
+        return COMPARISON_OPERATORS[self.op][1](pc.field(self.column), value)
+
+
+class InList(Predicate):
+    def __init__(self, column, values, negated=False):
+        values = list(values) if isinstance(values, (list, tuple, set)) else [values]
+        if not all(_is_scalar(value) for value in values):
+            raise ValueError(f"Filter {column} in needs a list of values")
+        self.column = column
+        self.values = values
+        self.negated = negated
+
+    def columns(self):
+        return {self.column}
+
+    def to_sql(self, compiler):
+        if not self.values:
+            # Nothing is in an empty list
+            return "1 = 1" if self.negated else "1 = 0"
+        placeholders = ", ".join(compiler.bind(value) for value in self.values)
+        return f"{compiler.quote(self.column)} {'NOT IN' if self.negated else 'IN'} ({placeholders})"
+
+    def to_arrow(self, schema):
+        if self.column not in schema.names:
+            return None
+        field = schema.field(self.column)
+        values = [_arrow_scalar(value, field) for value in self.values]
+        if any(value is None for value in values):
+            return None
+        if not values:
+            return pc.scalar(self.negated)
+
+        column = pc.field(self.column)
+        contained = column.isin(pa.array([value.as_py() for value in values], type=field.type))
+        if self.negated:
+            # NOT IN is unknown, not true, for NULLs
+            return ~contained & column.is_valid()
+        return contained
+
+
+class Like(Predicate):
+    def __init__(self, column, pattern, negated=False):
+        if not isinstance(pattern, str):
+            raise ValueError(f"Filter {column} like needs a text pattern")
+        self.column = column
+        self.pattern = pattern
+        self.negated = negated
+
+    def columns(self):
+        return {self.column}
+
+    def to_sql(self, compiler):
+        return f"{compiler.quote(self.column)} {'NOT LIKE' if self.negated else 'LIKE'} {compiler.bind(self.pattern)}"
+
+    def to_arrow(self, schema):
+        if self.column not in schema.names:
+            return None
+        if not pa.types.is_string(schema.field(self.column).type):
+            return None
+        # Only file sources (DuckDB) are pushed down to, and DuckDB's LIKE
+        # has no escape character; Arrow's escapes with backslashes, so they
+        # are doubled to match themselves
+        matched = pc.match_like(pc.field(self.column), self.pattern.replace('\\', '\\\\'))
+        return ~matched if self.negated else matched
+
+
+class IsNull(Predicate):
+    def __init__(self, column, negated=False):
+        self.column = column
+        self.negated = negated
+
+    def columns(self):
+        return {self.column}
+
+    def to_sql(self, compiler):
+        return f"{compiler.quote(self.column)} {'IS NOT NULL' if self.negated else 'IS NULL'}"
+
+    def to_arrow(self, schema):
+        if self.column not in schema.names:
+            return None
+        column = pc.field(self.column)
+        return column.is_valid() if self.negated else column.is_null()
+
+
+class And(Predicate):
+    def __init__(self, predicates):
+        self.predicates = list(predicates)
+
+    def columns(self):
+        return set().union(*(predicate.columns() for predicate in self.predicates))
+
+    def to_sql(self, compiler):
+        return " AND ".join(predicate.to_sql(compiler) for predicate in self.predicates)
+
+    def to_arrow(self, schema):
+        # Conditions Arrow can't evaluate are left out; the database applies
+        # all of them anyway, so the scan only returns a superset
+        expression = None
+        for predicate in self.predicates:
+            condition = predicate.to_arrow(schema)
+            if condition is not None:
+                expression = condition if expression is None else expression & condition
+        return expression
+
+
+def parse_filter(column, op, value=None):
+    """Predicate of one (column, operator, value) filter."""
+    op = str(op).lower()
+    if op in COMPARISON_OPERATORS:
+        return Comparison(column, op, value)
+    if op in ('in', 'not in'):
+        return InList(column, value, negated=op == 'not in')
+    if op in ('like', 'not like'):
+        return Like(column, value, negated=op == 'not like')
+    if op in ('is null', 'is not null'):
+        return IsNull(column, negated=op == 'is not null')
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def parse_filters(filters):
+    """
+    Predicate of a list of (column, operator, value) filters, all of which
+    must hold. A predicate is returned as it is.
+    """
+    if isinstance(filters, Predicate):
+        return filters
+    return And(parse_filter(*f) for f in filters or [])
+
+
+def compile_where(filters, dialect):
+    """
+    Compile filters into a WHERE clause and its bound parameters for a
+    dialect (``duckdb``, ``postgresql`` or ``mysql``). Returns ``("", None)``
+    without filters.
+    """
+    predicate = parse_filters(filters)
+    if isinstance(predicate, And) and not predicate.predicates:
+        return "", None
+
+    compiler = SQLCompiler(dialect)
+    return "WHERE " + predicate.to_sql(compiler), compiler.params
+
+
+def to_arrow_expression(filters, schema):
+    """
+    Arrow expression of filters over a dataset schema, for pushing them into
+    a scan; None if none of them can be. Rows the expression keeps are a
+    superset of those the filters keep in SQL.
+    """
+    return parse_filters(filters).to_arrow(schema)
+
+
+def filter_dataset(dataset, filters):
+    """An Arrow dataset restricted to the rows filters can keep."""
+    if not filters:
+        return dataset
+    expression = to_arrow_expression(filters, dataset.schema)
+    return dataset.filter(expression) if expression is not None else dataset
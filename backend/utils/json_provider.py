@@ -0,0 +1,143 @@
+import dataclasses
+import json
+import math
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from flask.json.provider import DefaultJSONProvider
+from backend.utils.response_formats import column_values
+
+try:
+    import orjson
+except ImportError:  # The standard library encoder is used instead
+    orjson = None
+
+
+class JSONRows:
+    """
+    The rows of a DataFrame or Arrow table, to be encoded as JSON arrays
+    (or objects, with ``records``) straight from its columns. Each column is
+    converted in bulk, so neither a row-major object array nor a pandas
+    scalar per cell is built on the way.
+    """
+
+    def __init__(self, data, records=False):
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data, preserve_index=False)
+        self.table = data
+        self.records = records
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def rows(self):
+        """The rows as tuples, or dicts with ``records``."""
+        rows = zip(*(column_values(column) for column in self.table.columns))
+        if self.records:
+            names = self.table.column_names
+            return [dict(zip(names, row)) for row in rows]
+        return list(rows)
+
+
+def _finite(value):
+    """``value`` with NaN and infinite floats, however nested, as None."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def _default(o):
+    """
+    JSON-ready equivalent of a value neither encoder handles itself: NumPy
+    and pandas values, Decimal (as a number), UUID, dates and times (ISO
+    8601), dataclasses and markup.
+    """
+    if isinstance(o, JSONRows):
+        return o.rows()
+    if isinstance(o, np.datetime64):
+        return None if np.isnat(o) else pd.Timestamp(o).isoformat()
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, np.ndarray):
+        if o.dtype.kind == 'M':
+            # tolist() would give nanoseconds as integers
+            return np.where(np.isnat(o), None, np.datetime_as_string(o, unit='s')).tolist()
+        return o.tolist()
+    if isinstance(o, pd.DataFrame):
+        return JSONRows(o, records=True).rows()
+    if isinstance(o, (pd.Series, pd.Index)):
+        return o.astype(object).where(o.notna(), None).tolist()
+    if o is pd.NaT or o is pd.NA:
+        return None
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class _StandardEncoder(json.JSONEncoder):
+    def default(self, o):
+        # What it converts to is encoded by json again, NaN included
+        return _finite(_default(o))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider encoding responses with orjson when it is installed, and
+    the standard library otherwise. Either way NumPy arrays and scalars,
+    pandas Timestamps and frames, Decimal and UUID values are encoded
+    without a custom encoder per endpoint, and NaN is encoded as null.
+    ``JSONRows`` encode DataFrame and Arrow rows directly.
+    """
+
+    def _orjson_option(self, indent=False):
+        # NumPy values go through _default too: orjson's own encoding of
+        # them writes NaT as a date in 1677
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _encode(self, obj, indent=False):
+        if orjson is not None:
+            return orjson.dumps(obj, default=_default, option=self._orjson_option(indent))
+        return json.dumps(
+            _finite(obj), cls=_StandardEncoder, sort_keys=self.sort_keys, ensure_ascii=self.ensure_ascii,
+            indent=2 if indent else None, separators=None if indent else (',', ':')
+        ).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or orjson is None:
+            kwargs.setdefault('cls', _StandardEncoder)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            return json.dumps(_finite(obj), **kwargs)
+        return self._encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs or orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self._encode(obj, indent) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,130 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+from backend.app import db
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+# How list responses report their total: a COUNT(*), the planner's estimate,
+# or not at all
+TOTAL_MODES = ('exact', 'estimate', 'none')
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values):
+    """Opaque cursor pointing just after the row with these sort key values."""
+    payload = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Sort key values of a cursor; raises ValueError if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = [_decode_value(value) for value in values]
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+    if len(values) != length:
+        raise ValueError("Invalid cursor: wrong number of values")
+
+    return values
+
+
+def keyset_after(columns, values, descending=False):
+    """
+    Predicate selecting rows ordered after ``values`` on ``columns``, i.e.
+    ``(a, b) > (x, y)`` spelled out so every database can use an index on
+    the columns for it.
+    """
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        ties = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*ties, column < value if descending else column > value))
+    return or_(*clauses)
+
+
+def estimate_count(query):
+    """
+    Row count of a query as estimated by the PostgreSQL planner, from table
+    statistics rather than a scan. Other databases get an exact count.
+    """
+    query = query.order_by(None)
+    if db.engine.dialect.name != 'postgresql':
+        return query.count()
+
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def paginate_query(query, order, args):
+    """
+    Page through a query, newest first, as requested by ``args``:
+
+    - ``cursor``: continue after the last row of a previous page (keyset
+      pagination, the same cost at any depth)
+    - ``page``: page number, skipped over with OFFSET
+    - ``per_page``: rows per page, at most ``MAX_PER_PAGE``
+    - ``total``: one of ``TOTAL_MODES``; ``exact`` by default
+
+    ``order`` lists the sort columns, the last one unique (e.g. created_at,
+    id). Returns the page's items with the fields of a list response; raises
+    ValueError on invalid arguments.
+    """
+    per_page = max(1, min(args.get('per_page', DEFAULT_PER_PAGE, type=int), MAX_PER_PAGE))
+    page = args.get('page', 1, type=int)
+    cursor = args.get('cursor')
+
+    total_mode = args.get('total', 'exact')
+    if total_mode not in TOTAL_MODES:
+        raise ValueError(f"total must be one of: {', '.join(TOTAL_MODES)}")
+
+    total = None
+    if total_mode == 'exact':
+        total = query.order_by(None).count()
+    elif total_mode == 'estimate':
+        total = estimate_count(query)
+
+    ordered = query.order_by(*[column.desc() for column in order])
+    if cursor:
+        ordered = ordered.filter(keyset_after(order, decode_cursor(cursor, len(order)), descending=True))
+        page = None
+    elif page > 1:
+        ordered = ordered.offset((page - 1) * per_page)
+
+    # One extra row tells whether there is a next page
+    rows = ordered.limit(per_page + 1).all()
+    items = rows[:per_page]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor([getattr(items[-1], column.key) for column in order])
+
+    return {
+        'items': items,
+        'total': total,
+        'pages': (total + per_page - 1) // per_page if total is not None else None,
+        'page': page,
+        'per_page': per_page,
+        'next_cursor': next_cursor
+    }
@@ -0,0 +1,177 @@
+import os
+import re
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas as pd
+from backend.pii_matching import PII_PATTERNS, scan_values
+
+# Common PII indicators in column names
+PII_KEYWORDS = [
+    'name', 'email', 'phone', 'address', 'zip', 'postal', 'ssn', 'social',
+    'birth', 'dob', 'credit', 'card', 'passport', 'license', 'gender',
+    'nationality', 'account', 'password', 'username', 'ip', 'location'
+]
+
+KEYWORD_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in PII_KEYWORDS))
+
+# Number of non-null values sampled per column
+DEFAULT_SAMPLE_SIZE = 1000
+
+# A column is flagged when more than this fraction of its sample matches
+DEFAULT_MATCH_THRESHOLD = 0.0
+
+# Tables with at least this many columns to scan are spread over a pool
+PARALLEL_MIN_COLUMNS = 8
+
+# Sampled values below which a process pool isn't worth starting processes
+# and shipping the values to them; smaller scans run inline
+PROCESS_MIN_VALUES = 200000
+
+# Most workers of either pool
+MAX_POOL_WORKERS = 4
+
+# Executors: 'inline' scans on the calling thread. The regex matching holds
+# the GIL, so only 'process' scans columns in parallel; 'thread' merely
+# keeps the scan off the calling thread
+EXECUTORS = ('inline', 'thread', 'process')
+DEFAULT_EXECUTOR = 'inline'
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(kind):
+    """Lazily created, process-wide executor of the given kind."""
+    with _executors_lock:
+        if kind not in _executors:
+            max_workers = min(MAX_POOL_WORKERS, os.cpu_count() or 1)
+            if kind == 'process':
+                # Forking a threaded web worker is unsafe, so spawn fresh interpreters
+                _executors[kind] = ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            elif kind == 'thread':
+                _executors[kind] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pii-scan')
+            else:
+                raise ValueError(f"Unsupported executor: {kind}")
+        return _executors[kind]
+
+
+@atexit.register
+def _shutdown_executors():
+    """Stop the pools' workers when the interpreter exits."""
+    with _executors_lock:
+        for pool in _executors.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+
+
+def _pool_for(executor, to_scan):
+    """The pool to scan columns on, or None to scan them inline."""
+    executor = executor or 'inline'
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unsupported executor: {executor}")
+    if executor == 'inline' or len(to_scan) < PARALLEL_MIN_COLUMNS:
+        return None
+    if executor == 'process' and sum(len(values) for _, values in to_scan) < PROCESS_MIN_VALUES:
+        return None
+    return _get_executor(executor)
+
+
+def _empty_report(column, matched_by=None):
+    return {
+        'column': column,
+        'matched_by': matched_by,
+        'sampled': 0,
+        'matched': 0,
+        'pattern_matches': {name: 0 for name in PII_PATTERNS}
+    }
+
+
+def _finalize(report, threshold):
+    """Derive match ratios and the PII verdict from raw counts."""
+    sampled = report['sampled']
+    report['match_ratio'] = report['matched'] / sampled if sampled else 0.0
+    report['pattern_ratios'] = {
+        name: (count / sampled if sampled else 0.0)
+        for name, count in report['pattern_matches'].items()
+    }
+
+    if report['matched_by'] != 'name':
+        report['matched_by'] = 'pattern' if report['matched'] and report['match_ratio'] > threshold else None
+    report['is_pii'] = report['matched_by'] is not None
+    return report
+
+
+def scan_pii(df, sample_size=DEFAULT_SAMPLE_SIZE, threshold=DEFAULT_MATCH_THRESHOLD, executor=DEFAULT_EXECUTOR):
+    """
+    Scan DataFrame columns for PII.
+
+    Column names are checked against PII keywords. Other columns have a
+    sample of their values matched against one precompiled pattern set using
+    vectorized ``Series.str`` operations, inline by default; with a
+    ``process`` (or ``thread``) executor, wide tables with many sampled
+    values are spread over a pool. Returns a report per column with
+    per-pattern match ratios.
+    """
+    reports = {}
+    to_scan = []
+
+    for column in df.columns:
+        if KEYWORD_PATTERN.search(str(column).lower()):
+            reports[column] = _empty_report(column, matched_by='name')
+            continue
+
+        col_data = df[column]
+        reports[column] = _empty_report(column)
+        if pd.api.types.is_bool_dtype(col_data) or pd.api.types.is_datetime64_any_dtype(col_data):
+            continue
+
+        sample = col_data.dropna()
+        if sample_size is not None:
+            sample = sample.head(sample_size)
+        if len(sample):
+            to_scan.append((column, sample.astype(str)))
+
+    pool = _pool_for(executor, to_scan)
+    if pool is not None:
+        results = pool.map(scan_values, [values for _, values in to_scan])
+    else:
+        results = (scan_values(values) for _, values in to_scan)
+
+    for (column, _), counts in zip(to_scan, results):
+        reports[column].update(counts)
+
+    return {column: _finalize(report, threshold) for column, report in reports.items()}
+
+
+def merge_pii_reports(current, new, threshold=DEFAULT_MATCH_THRESHOLD):
+    """Fold the reports of two chunks of the same table into one."""
+    if not current:
+        return new
+
+    merged = {}
+    for column, report in new.items():
+        previous = current.get(column)
+        if previous is None:
+            merged[column] = report
+            continue
+
+        combined = _empty_report(column, matched_by='name' if report['matched_by'] == 'name' else None)
+        combined['sampled'] = previous['sampled'] + report['sampled']
+        combined['matched'] = previous['matched'] + report['matched']
+        combined['pattern_matches'] = {
+            name: previous['pattern_matches'][name] + report['pattern_matches'][name]
+            for name in PII_PATTERNS
+        }
+        merged[column] = _finalize(combined, threshold)
+
+    return merged
+
+
+def pii_columns_from_reports(reports):
+    """Names of the columns flagged as PII, in table order."""
+    return [column for column, report in reports.items() if report['is_pii']]
@@ -0,0 +1,230 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Number of rows sampled per column for the string type checks
+DEFAULT_SAMPLE_SIZE = 10000
+
+# Number of smallest value hashes kept per column for distinct estimates
+DISTINCT_SKETCH_SIZE = 1024
+
+# Fraction of sampled values that must look like dates
+DATE_MATCH_RATIO = 0.9
+
+# Common date patterns, combined so each value is matched once
+DATE_PATTERN = re.compile(
+    r'^(?:'
+    r'\d{4}-\d{2}-\d{2}'  # YYYY-MM-DD
+    r'|\d{2}/\d{2}/\d{4}'  # MM/DD/YYYY
+    r'|\d{2}-\d{2}-\d{4}'  # DD-MM-YYYY
+    r'|\d{4}/\d{2}/\d{2}'  # YYYY/MM/DD
+    r'|\d{1,2}\s+[A-Za-z]{3}\s+\d{4}'  # 1 Jan 2020
+    r')$'
+)
+
+# Common boolean representations
+BOOLEAN_VALUES = ['true', 't', 'yes', 'y', '1', 'false', 'f', 'no', 'n', '0']
+
+_HASH_SPACE = float(2 ** 64)
+
+
+def _merge_types(current, new):
+    """Combine the suggested types of one column seen in two different chunks."""
+    if current is None or current == new:
+        return new
+
+    pair = {current, new}
+    if pair <= {'integer', 'float'}:
+        return 'float'
+    if pair <= {'date', 'timestamp'}:
+        return 'timestamp'
+
+    # Anything else degrades to string
+    return 'string'
+
+
+def _to_python(value):
+    """Convert numpy/pandas scalars into JSON-friendly Python values."""
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _smallest_hashes(values, k=DISTINCT_SKETCH_SIZE):
+    """The ``k`` smallest distinct 64-bit hashes of a Series' values, sorted."""
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+    # Hash-based dedup is O(n); only the survivors need partitioning
+    unique = pd.unique(hashes)
+    if len(unique) > k:
+        unique = np.partition(unique, k - 1)[:k]
+    return np.sort(unique)
+
+
+class _ColumnState:
+    """Running statistics for a single column."""
+
+    def __init__(self, name):
+        self.name = name
+        self.original_type = None
+        self.suggested_type = None
+        self.rows = 0
+        self.null_count = 0
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.min = None
+        self.max = None
+        self.comparable = True
+
+    def merge_range(self, lo, hi):
+        """Fold a chunk's min/max into the running range."""
+        if not self.comparable or lo is None:
+            return
+
+        try:
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+        except TypeError:
+            # Values of different kinds can't be ordered against each other
+            self.comparable = False
+            self.min = self.max = None
+
+    @property
+    def distinct_count(self):
+        """
+        Exact distinct count for small columns, a KMV estimate otherwise,
+        never more than the number of non-null values.
+        """
+        if len(self.hashes) < DISTINCT_SKETCH_SIZE:
+            return int(len(self.hashes))
+        kth = float(self.hashes[DISTINCT_SKETCH_SIZE - 1])
+        estimate = int(round((DISTINCT_SKETCH_SIZE - 1) * _HASH_SPACE / kth))
+        return min(estimate, self.rows - self.null_count)
+
+
+class ColumnProfiler:
+    """
+    Vectorized, single-pass column profiler.
+
+    Every column is scanned once per ``update`` with NumPy/pandas operations.
+    Profiles can be folded over any number of chunks; distinct counts are
+    estimated with a mergeable k-minimum-values sketch of the value hashes.
+    """
+
+    def __init__(self, sample_size=DEFAULT_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._columns = {}
+
+    def update(self, df):
+        """Fold a DataFrame (or a chunk of one) into the profile."""
+        for name in df.columns:
+            state = self._columns.get(name)
+            if state is None:
+                state = self._columns[name] = _ColumnState(name)
+            self._update_column(state, df[name])
+        return self
+
+    def _update_column(self, state, col_data):
+        mask = col_data.notna().to_numpy()
+        non_null = int(mask.sum())
+
+        state.rows += len(col_data)
+        state.null_count += len(col_data) - non_null
+
+        # All-null chunks say nothing about the column's type
+        if non_null == 0:
+            return
+
+        values = col_data[mask] if non_null < len(col_data) else col_data
+
+        dtype = str(col_data.dtype)
+        if state.original_type is None:
+            state.original_type = dtype
+        elif state.original_type != dtype:
+            pair = {state.original_type, dtype}
+            state.original_type = 'float64' if pair <= {'int64', 'float64'} else 'object'
+
+        state.hashes = np.union1d(state.hashes, _smallest_hashes(values))[:DISTINCT_SKETCH_SIZE]
+
+        suggested_type, lo, hi = self._infer(values)
+        state.suggested_type = _merge_types(state.suggested_type, suggested_type)
+        state.merge_range(lo, hi)
+
+    def _infer(self, values):
+        """Suggested type and min/max of a column's non-null values."""
+        dtype = values.dtype
+
+        if pd.api.types.is_bool_dtype(dtype):
+            return 'boolean', bool(values.min()), bool(values.max())
+
+        if pd.api.types.is_numeric_dtype(dtype):
+            arr = values.to_numpy()
+            lo, hi = _to_python(arr.min()), _to_python(arr.max())
+            if pd.api.types.is_integer_dtype(dtype):
+                return 'integer', lo, hi
+            if np.isfinite(arr).all() and np.array_equal(arr, np.floor(arr)):
+                return 'integer', lo, hi
+            return 'float', lo, hi
+
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return 'timestamp', values.min(), values.max()
+
+        # Text columns: the range covers every value, the type checks only
+        # look at a sample
+        strings = values.astype(str)
+        lo, hi = strings.min(), strings.max()
+
+        sample = values
+        if self.sample_size is not None and len(values) > self.sample_size:
+            sample = values.sample(self.sample_size, random_state=0)
+            strings = strings.loc[sample.index]
+
+        try:
+            date_matches = sample.str.match(DATE_PATTERN).fillna(False)
+            if date_matches.mean() >= DATE_MATCH_RATIO:
+                return 'date', lo, hi
+        except AttributeError:
+            # Not a string column (e.g. Decimal objects)
+            pass
+
+        if strings.str.lower().isin(BOOLEAN_VALUES).all():
+            return 'boolean', lo, hi
+
+        return 'string', lo, hi
+
+    def result(self):
+        """Column schema with suggested types and summary statistics."""
+        schema = []
+
+        for state in self._columns.values():
+            non_null = state.rows - state.null_count
+            distinct_count = state.distinct_count
+            suggested_type = state.suggested_type or 'string'
+
+            # Check if it's a categorical column
+            if suggested_type == 'string' and distinct_count < min(10, non_null * 0.1):
+                suggested_type = 'categorical'
+
+            schema.append({
+                'name': state.name,
+                'original_type': state.original_type or 'object',
+                'nullable': state.null_count > 0,
+                'suggested_type': suggested_type,
+                'null_count': state.null_count,
+                'distinct_count': distinct_count,
+                'min': _to_python(state.min),
+                'max': _to_python(state.max)
+            })
+
+        return schema
+
+
+def profile_columns(df, sample_size=DEFAULT_SAMPLE_SIZE):
+    """
+    Profile every column of a DataFrame in a single vectorized pass.
+
+    Returns the ``detect_column_types`` schema extended with null counts,
+    distinct estimates and min/max values.
+    """
+    return ColumnProfiler(sample_size=sample_size).update(df).result()
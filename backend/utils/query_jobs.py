@@ -0,0 +1,260 @@
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from backend.models import DataSource
+from backend.utils.data_processor import DataProcessor
+from backend.utils.result_cache import result_cache
+
+# Job states; the last four are final
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TIMEOUT = 'timeout'
+FINAL_STATES = (COMPLETED, FAILED, CANCELLED, TIMEOUT)
+
+# Seconds between checks for cancellation requests while a query runs
+CANCEL_POLL_INTERVAL = 0.5
+
+# Seconds a job waits before retrying when its source has no free slot
+SOURCE_BUSY_RETRY_DELAY = 2
+
+# Extra seconds the Celery soft and hard limits allow past the query timeout
+TASK_TIME_LIMIT_GRACE = 30
+
+_JSON_FIELDS = ('params', 'columns')
+
+
+class SourceBusyError(RuntimeError):
+    """All concurrency slots of a data source are taken."""
+
+
+class QueryJobStore:
+    """
+    Redis-backed state of asynchronous query jobs.
+
+    Jobs are hashes readable by every web and worker process. Per-source
+    concurrency is limited with a sorted-set semaphore whose entries expire,
+    so a worker that dies mid-query can't hold a slot forever.
+    """
+
+    def __init__(self, app=None, prefix='query_job:'):
+        self.client = None
+        self.prefix = prefix
+        self.timeout = 300
+        self.source_concurrency = 4
+        self.job_ttl = 24 * 60 * 60
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        import redis
+        self.client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+        self.timeout = app.config['QUERY_JOB_TIMEOUT']
+        self.source_concurrency = app.config['QUERY_JOB_SOURCE_CONCURRENCY']
+        self.job_ttl = app.config['QUERY_JOB_TTL']
+
+    def _job_key(self, job_id):
+        return f'{self.prefix}{job_id}'
+
+    def _slots_key(self, source_id):
+        return f'{self.prefix}slots:{source_id}'
+
+    def create(self, source_id, query, params=None, user_id=None):
+        job = {
+            'id': str(uuid.uuid4()),
+            'status': QUEUED,
+            'source_id': source_id,
+            'query': query,
+            'params': params or {},
+            'submitted_by': user_id,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        self.update(job['id'], **job)
+        return job
+
+    def get(self, job_id):
+        raw = self.client.hgetall(self._job_key(job_id))
+        if not raw:
+            return None
+
+        job = {key.decode('utf-8'): value.decode('utf-8') for key, value in raw.items()}
+        for field in _JSON_FIELDS:
+            if field in job:
+                job[field] = json.loads(job[field])
+        if 'row_count' in job:
+            job['row_count'] = int(job['row_count'])
+        job['cancel_requested'] = job.get('cancel_requested') == '1'
+        return job
+
+    def update(self, job_id, **fields):
+        mapping = {
+            key: json.dumps(value) if key in _JSON_FIELDS else ('' if value is None else value)
+            for key, value in fields.items()
+        }
+        pipe = self.client.pipeline()
+        pipe.hset(self._job_key(job_id), mapping=mapping)
+        pipe.expire(self._job_key(job_id), self.job_ttl)
+        pipe.execute()
+
+    def request_cancel(self, job_id):
+        self.client.hset(self._job_key(job_id), 'cancel_requested', '1')
+
+    def cancel_requested(self, job_id):
+        return self.client.hget(self._job_key(job_id), 'cancel_requested') == b'1'
+
+    def acquire_slot(self, source_id, job_id, ttl):
+        """Take one of a source's concurrency slots for at most ``ttl`` seconds."""
+        key = self._slots_key(source_id)
+        now = time.time()
+
+        # Drop slots whose holders died without releasing them
+        self.client.zremrangebyscore(key, '-inf', now)
+
+        def take(pipe):
+            if pipe.zcard(key) >= self.source_concurrency:
+                return False
+            pipe.multi()
+            pipe.zadd(key, {job_id: now + ttl})
+            pipe.expire(key, int(ttl) + 1)
+            return True
+
+        return self.client.transaction(take, key, value_from_callable=True)
+
+    def release_slot(self, source_id, job_id):
+        self.client.zrem(self._slots_key(source_id), job_id)
+
+
+query_jobs = QueryJobStore()
+
+
+def submit_job(source, query, params=None, user_id=None):
+    """Record a query job and queue it on the Celery workers."""
+    from backend.tasks import run_query_job
+
+    job = query_jobs.create(source.id, query, params=params, user_id=user_id)
+    try:
+        run_query_job.apply_async(
+            args=[job['id']],
+            task_id=job['id'],
+            soft_time_limit=query_jobs.timeout + TASK_TIME_LIMIT_GRACE,
+            time_limit=query_jobs.timeout + 2 * TASK_TIME_LIMIT_GRACE
+        )
+    except Exception as e:
+        query_jobs.update(job['id'], status=FAILED, error=f'Could not queue job: {str(e)}')
+        raise
+
+    return job
+
+
+def cancel_job(job_id):
+    """
+    Cancel a job. Queued jobs are revoked outright; running jobs have their
+    statement interrupted by the worker executing them.
+    """
+    job = query_jobs.get(job_id)
+    if job is None or job['status'] in FINAL_STATES:
+        return job
+
+    query_jobs.request_cancel(job_id)
+    if job['status'] == QUEUED:
+        from backend.app import celery
+        celery.control.revoke(job_id)
+        query_jobs.update(job_id, status=CANCELLED, finished_at=datetime.utcnow().isoformat())
+
+    return query_jobs.get(job_id)
+
+
+def run_job(job_id):
+    """
+    Execute a queued job; called by the Celery task.
+
+    Raises ``SourceBusyError`` when the job's source is at its concurrency
+    limit, in which case the task is retried later.
+    """
+    job = query_jobs.get(job_id)
+    if job is None or job['status'] != QUEUED:
+        return
+
+    if job['cancel_requested']:
+        query_jobs.update(job_id, status=CANCELLED, finished_at=datetime.utcnow().isoformat())
+        return
+
+    slot_ttl = query_jobs.timeout + 2 * TASK_TIME_LIMIT_GRACE
+    if not query_jobs.acquire_slot(job['source_id'], job_id, slot_ttl):
+        raise SourceBusyError(f"Data source {job['source_id']} is at its concurrency limit")
+
+    try:
+        _execute(job)
+    finally:
+        query_jobs.release_slot(job['source_id'], job_id)
+
+
+def _execute(job):
+    job_id = job['id']
+
+    source = DataSource.query.filter_by(id=job['source_id']).first()
+    if not source:
+        query_jobs.update(job_id, status=FAILED, error='Data source not found',
+                          finished_at=datetime.utcnow().isoformat())
+        return
+
+    query_jobs.update(job_id, status=RUNNING, started_at=datetime.utcnow().isoformat())
+
+    processor = DataProcessor(data_source=source)
+    outcome = {}
+    stop = threading.Event()
+
+    def watch():
+        # Interrupts the statement on cancellation or once the timeout passes;
+        # databases that support it also enforce the timeout server-side
+        deadline = time.monotonic() + query_jobs.timeout
+        while not stop.wait(CANCEL_POLL_INTERVAL):
+            if query_jobs.cancel_requested(job_id):
+                outcome['status'] = CANCELLED
+            elif time.monotonic() > deadline:
+                outcome['status'] = TIMEOUT
+            else:
+                continue
+            processor.interrupt()
+            return
+
+    watcher = threading.Thread(target=watch, name=f'query-job-{job_id}', daemon=True)
+    watcher.start()
+
+    try:
+        params = job['params'] or None
+        key = result_cache.key_for(source, job['query'], params)
+        df = result_cache.get(key)
+
+        if df is None:
+            # Whatever the SQL does, it can't write to the source or read
+            # files, as on the streaming endpoint
+            processor.open_user_query()
+            processor.set_statement_timeout(query_jobs.timeout)
+            df = processor.execute_query(job['query'], params)
+
+            if not result_cache.set(key, df):
+                raise ValueError('Result is too large to keep; use the streaming endpoint instead')
+
+        query_jobs.update(
+            job_id,
+            status=COMPLETED,
+            result_key=key,
+            row_count=len(df),
+            columns=[str(column) for column in df.columns],
+            finished_at=datetime.utcnow().isoformat()
+        )
+    except Exception as e:
+        status = outcome.get('status', FAILED)
+        error = {
+            CANCELLED: 'Query was cancelled',
+            TIMEOUT: f'Query exceeded the {query_jobs.timeout}s timeout'
+        }.get(status, str(e))
+        query_jobs.update(job_id, status=status, error=error, finished_at=datetime.utcnow().isoformat())
+    finally:
+        stop.set()
+        processor.close()
@@ -0,0 +1,105 @@
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from flask import request, jsonify, current_app
+from backend.utils.streaming import ARROW_STREAM_MIMETYPE
+
+JSON_MIMETYPE = 'application/json'
+COLUMNAR_JSON_MIMETYPE = 'application/vnd.nexus.columnar+json'
+
+# Formats tabular responses can be negotiated in (with the Accept header);
+# plain JSON keeps each endpoint's row-oriented payload
+RESPONSE_FORMATS = {
+    'json': JSON_MIMETYPE,
+    'columnar': COLUMNAR_JSON_MIMETYPE,
+    'arrow': ARROW_STREAM_MIMETYPE
+}
+
+
+def negotiate_format():
+    """The response format the current request accepts best; ``json`` by default."""
+    mimetypes = list(RESPONSE_FORMATS.values())
+    best = request.accept_mimetypes.best_match(mimetypes, default=JSON_MIMETYPE)
+    return next(fmt for fmt, mimetype in RESPONSE_FORMATS.items() if mimetype == best)
+
+
+def column_values(column):
+    """
+    An Arrow column as a JSON-ready list, converted from its buffers in bulk
+    rather than cell by cell: timestamps and dates as ISO strings, decimals
+    as floats, nulls as None.
+    """
+    if pa.types.is_timestamp(column.type):
+        # Whole seconds, like chart labels
+        seconds = pc.cast(column, pa.timestamp('s', column.type.tz), safe=False)
+        column = pc.strftime(seconds, format='%Y-%m-%dT%H:%M:%S')
+    elif pa.types.is_date(column.type):
+        column = pc.strftime(column, format='%Y-%m-%d')
+    elif pa.types.is_decimal(column.type):
+        column = column.cast(pa.float64())
+
+    if not column.null_count:
+        return column.to_numpy(zero_copy_only=False).tolist()
+
+    if pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_boolean(column.type):
+        # Numbers with nulls would come out as floats (NaN); fill, convert and
+        # put the nulls back
+        placeholder = pa.scalar(False if pa.types.is_boolean(column.type) else 0, type=column.type)
+        values = pc.fill_null(column, placeholder).to_numpy(zero_copy_only=False).tolist()
+        for i in np.flatnonzero(column.is_null().to_numpy(zero_copy_only=False)):
+            values[i] = None
+        return values
+
+    return column.to_numpy(zero_copy_only=False).tolist()
+
+
+def arrow_ipc_bytes(table, metadata=None):
+    """
+    A table in the Arrow IPC streaming format, with ``metadata`` as
+    JSON-encoded schema metadata.
+    """
+    if metadata:
+        table = table.replace_schema_metadata({
+            key: json.dumps(value, default=str) for key, value in metadata.items()
+        })
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def table_response(table, fmt, metadata=None, status=200):
+    """
+    A response holding an Arrow table in a negotiated format other than
+    ``json``: Arrow IPC, or columnar JSON (``{"columns": [..], "data":
+    [[column 0 values], ..]}`` plus ``metadata`` keys).
+    """
+    if fmt == 'arrow':
+        response = current_app.response_class(arrow_ipc_bytes(table, metadata), status=status, mimetype=ARROW_STREAM_MIMETYPE)
+    elif fmt == 'columnar':
+        response = jsonify(dict(
+            metadata or {},
+            columns=table.column_names,
+            data=[column_values(column) for column in table.columns]
+        ))
+        response.status_code = status
+        response.mimetype = COLUMNAR_JSON_MIMETYPE
+    else:
+        raise ValueError(f"Unsupported response format: {fmt}")
+
+    response.vary.add('Accept')
+    return response
+
+
+def json_response(data, status=200):
+    """
+    The plain JSON response of an endpoint negotiating its format. Like
+    ``table_response``, it varies on Accept, so shared caches don't serve it
+    to clients asking for another format.
+    """
+    response = jsonify(data)
+    response.status_code = status
+    response.vary.add('Accept')
+    return response
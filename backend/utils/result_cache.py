@@ -0,0 +1,279 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+import pyarrow as pa
+import sqlparse
+
+logger = logging.getLogger(__name__)
+
+# Whole results larger than this (compressed) are never cached
+DEFAULT_MAX_ENTRY_BYTES = 32 * 1024 * 1024
+
+# Total compressed bytes kept before least recently used results are evicted
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+DEFAULT_TTL = 600
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(query):
+    """
+    Normalized form of a SQL statement: comments removed, keywords upper-cased
+    and whitespace between tokens collapsed, so trivially different spellings
+    of one query share a cache entry. String literals and quoted identifiers
+    are kept as they are.
+    """
+    parts = []
+    tokens = (token for statement in sqlparse.parse(query) for token in statement.flatten())
+    for token in tokens:
+        if token.is_whitespace or token.ttype in sqlparse.tokens.Comment:
+            # Comments separate tokens like whitespace does
+            if parts and parts[-1] != ' ':
+                parts.append(' ')
+        elif token.is_keyword:
+            parts.append(token.normalized)
+        else:
+            parts.append(token.value)
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+def source_version(data_source):
+    """
+    Version of the data behind a source.
+
+    Editing a source changes its ``updated_at`` and params; file sources also
+    track their columnar copy, which is rewritten whenever the file is
+    re-ingested. External databases change without notice, so their results
+    only live as long as the cache TTL.
+    """
+    params = data_source.connection_params or {}
+    parts = [
+        data_source.type,
+        data_source.updated_at.isoformat() if getattr(data_source, 'updated_at', None) else '',
+        json.dumps(params, sort_keys=True, default=str)
+    ]
+
+    parquet_path = params.get('parquet_path') if data_source.type == 'file' else None
+    if parquet_path and os.path.exists(parquet_path):
+        stat = os.stat(parquet_path)
+        parts.append(f'{stat.st_mtime_ns}:{stat.st_size}')
+
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def encode_result(df):
+    """Serialize a DataFrame as a zstd-compressed Arrow IPC stream."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression='zstd')
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_result(blob):
+    """Inverse of ``encode_result``."""
+    return pa.ipc.open_stream(pa.py_buffer(blob)).read_all().to_pandas()
+
+
+class LocalResultStore:
+    """In-process LRU store with a byte budget, for tests and single workers."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, blob = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return blob
+
+    def set(self, key, blob, ttl):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, blob)
+            self._bytes += len(blob)
+
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= len(entry[1])
+
+
+class RedisResultStore:
+    """
+    Redis store with a byte budget shared by all workers.
+
+    Blobs are plain keys with a TTL; a sorted set ordered by last access and a
+    hash of blob sizes let the least recently used results be evicted once
+    their total size exceeds the budget.
+    """
+
+    def __init__(self, client, max_bytes=DEFAULT_MAX_BYTES, prefix='result_cache:'):
+        self.client = client
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self._lru_key = f'{prefix}lru'
+        self._sizes_key = f'{prefix}sizes'
+        self._bytes_key = f'{prefix}bytes'
+
+    def _blob_key(self, key):
+        return f'{self.prefix}blob:{key}'
+
+    def get(self, key):
+        blob = self.client.get(self._blob_key(key))
+        if blob is None:
+            # Expired by its TTL; drop it from the accounting as well
+            if self.client.zscore(self._lru_key, key) is not None:
+                self._forget(key)
+            return None
+
+        self.client.zadd(self._lru_key, {key: time.time()})
+        return blob
+
+    def set(self, key, blob, ttl):
+        previous = self.client.hget(self._sizes_key, key)
+
+        pipe = self.client.pipeline()
+        pipe.set(self._blob_key(key), blob, ex=ttl)
+        pipe.zadd(self._lru_key, {key: time.time()})
+        pipe.hset(self._sizes_key, key, len(blob))
+        pipe.incrby(self._bytes_key, len(blob) - int(previous or 0))
+        total = pipe.execute()[-1]
+
+        while total > self.max_bytes:
+            oldest = self.client.zrange(self._lru_key, 0, 0)
+            if not oldest:
+                break
+            total = self._forget(oldest[0].decode('utf-8'), delete=True)
+
+    def clear(self):
+        keys = [self._blob_key(key.decode('utf-8')) for key in self.client.zrange(self._lru_key, 0, -1)]
+        self.client.delete(self._lru_key, self._sizes_key, self._bytes_key, *keys)
+
+    def _forget(self, key, delete=False):
+        """Drop a key from the LRU accounting; returns the new byte total."""
+        size = self.client.hget(self._sizes_key, key)
+
+        pipe = self.client.pipeline()
+        if delete:
+            pipe.delete(self._blob_key(key))
+        pipe.zrem(self._lru_key, key)
+        pipe.hdel(self._sizes_key, key)
+        pipe.decrby(self._bytes_key, int(size or 0))
+        return pipe.execute()[-1]
+
+
+class ResultCache:
+    """
+    Cache of query results keyed by data source, source data version, SQL
+    fingerprint and bound parameters.
+
+    Results are stored as compressed Arrow IPC blobs, so identical queries
+    issued by different charts and users share one entry. Cache failures are
+    logged and treated as misses; they never fail a query.
+    """
+
+    def __init__(self, app=None):
+        self.store = LocalResultStore()
+        self.ttl = DEFAULT_TTL
+        self.max_entry_bytes = DEFAULT_MAX_ENTRY_BYTES
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config['RESULT_CACHE_BACKEND']
+        max_bytes = app.config['RESULT_CACHE_MAX_BYTES']
+
+        if backend == 'redis':
+            import redis
+            client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+            self.store = RedisResultStore(client, max_bytes=max_bytes)
+        elif backend == 'local':
+            self.store = LocalResultStore(max_bytes=max_bytes)
+        elif backend == 'none':
+            self.store = None
+        else:
+            raise ValueError(f"Unsupported result cache backend: {backend}")
+
+        self.ttl = app.config['RESULT_CACHE_TTL']
+        self.max_entry_bytes = app.config['RESULT_CACHE_MAX_ENTRY_BYTES']
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    def key_for(self, data_source, query, params=None):
+        """Cache key of a query's result on a data source."""
+        payload = json.dumps(
+            {'sql': fingerprint(query), 'params': params or {}},
+            sort_keys=True,
+            default=str
+        )
+        digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return f'{data_source.id}:{source_version(data_source)}:{digest}'
+
+    def get(self, key):
+        """Return the cached DataFrame for a key, or None."""
+        if not self.enabled:
+            return None
+
+        try:
+            blob = self.store.get(key)
+            return decode_result(blob) if blob is not None else None
+        except Exception as e:
+            logger.warning(f"Result cache read failed: {str(e)}")
+            return None
+
+    def set(self, key, df):
+        """Cache a DataFrame unless it is too large. Returns whether it was stored."""
+        if not self.enabled:
+            return False
+
+        try:
+            blob = encode_result(df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # Mixed-type object columns have no Arrow representation
+            return False
+
+        if len(blob) > self.max_entry_bytes:
+            return False
+
+        try:
+            self.store.set(key, blob, self.ttl)
+        except Exception as e:
+            logger.warning(f"Result cache write failed: {str(e)}")
+            return False
+
+        return True
+
+    def clear(self):
+        if self.enabled:
+            self.store.clear()
+
+
+result_cache = ResultCache()
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy.orm import selectinload
+from backend.app import db
+from backend.models import Chart, Dashboard, Dataset, DataSource, Rollup
+from backend.utils.result_cache import source_version
+
+logger = logging.getLogger(__name__)
+
+# Parts stored for each decomposable aggregation; averages are re-aggregated
+# as SUM(sum) / SUM(count). count_distinct can't be rebuilt from parts
+COMPONENTS = {
+    'sum': ('sum',),
+    'avg': ('sum', 'count'),
+    'count': ('count',),
+    'min': ('min',),
+    'max': ('max',)
+}
+
+# Rollups with more groups than this aren't worth keeping
+DEFAULT_MAX_ROWS = 1000000
+
+# Rollups kept per dataset, for the most used dimension sets
+DEFAULT_MAX_PER_DATASET = 5
+
+# Seconds after which a rollup is no longer used; 0 keeps rollups of
+# databases until they are rebuilt
+DEFAULT_MAX_AGE = 2 * 60 * 60
+
+
+def component_column(column, component):
+    """Name of a stored part in a rollup; rows are counted in ``count``."""
+    if column == '*':
+        return 'count'
+    return f'{column}_{component}'
+
+
+def measure_components(metrics):
+    """
+    Parts a rollup must store to answer (column, aggregation) metrics, as
+    ``{column: [component, ..]}``; None if a metric isn't decomposable. Row
+    counts (``*``) are always stored.
+    """
+    needed = {}
+    for column, aggregation in metrics:
+        aggregation = str(aggregation).lower()
+        if aggregation not in COMPONENTS:
+            return None
+        if column == '*':
+            if aggregation != 'count':
+                return None
+            continue
+        needed.setdefault(column, set()).update(COMPONENTS[aggregation])
+
+    return {column: sorted(parts) for column, parts in needed.items()}
+
+
+def _covers(measures, needed):
+    return all(set(parts) <= set((measures or {}).get(column, ())) for column, parts in needed.items())
+
+
+def rollup_key(dimensions):
+    payload = json.dumps(sorted(dimensions))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class RollupManager:
+    """
+    Pre-aggregated copies of datasets for the GROUP BYs charts run.
+
+    A scheduled refresh looks at the dimensions, filter columns and metrics
+    of every chart and materializes, per dataset, the most used dimension
+    sets grouped with the sums, counts, minimums and maximums they need.
+    Rollups are Parquet files queried with DuckDB, like file sources, and
+    are catalogued in the ``rollups`` table.
+
+    Aggregation queries are answered from the smallest fresh rollup whose
+    dimensions include the query's dimensions and filter columns; anything
+    else runs against the base table as before.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.max_rows = DEFAULT_MAX_ROWS
+        self.max_per_dataset = DEFAULT_MAX_PER_DATASET
+        self.max_age = DEFAULT_MAX_AGE
+        self.build_timeout = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['ROLLUPS_ENABLED']
+        self.directory = app.config['ROLLUP_DIR']
+        self.max_rows = app.config['ROLLUP_MAX_ROWS']
+        self.max_per_dataset = app.config['ROLLUP_MAX_PER_DATASET']
+        self.max_age = app.config['ROLLUP_MAX_AGE']
+        self.build_timeout = app.config['QUERY_JOB_TIMEOUT']
+
+    def find(self, dataset, data_source, dimensions, metrics, filters=None):
+        """
+        The rollup to answer an aggregation from, or None.
+
+        ``dimensions`` are all the columns grouped by, ``metrics`` the
+        (column, aggregation) pairs and ``filters`` the (column, operator,
+        value) filters of the query. Rollups built from older source data, or
+        before the dataset was last edited, are skipped.
+        """
+        if not self.enabled:
+            return None
+
+        needed = measure_components(metrics)
+        if needed is None:
+            return None
+
+        required = set(dimensions) | {column for column, _, _ in filters or []}
+        oldest = datetime.utcnow() - timedelta(seconds=self.max_age) if self.max_age else None
+
+        candidates = db.session.query(Rollup).filter_by(
+            dataset_id=dataset.id,
+            source_version=source_version(data_source)
+        ).order_by(Rollup.row_count)
+
+        for rollup in candidates:
+            if dataset.updated_at and rollup.built_at < dataset.updated_at:
+                continue
+            if oldest and rollup.built_at < oldest:
+                continue
+            if required <= set(rollup.dimensions) and _covers(rollup.measures, needed) and os.path.exists(rollup.path):
+                return rollup
+
+        return None
+
+    def plan(self):
+        """
+        Rollups to build: ``{dataset_id: [(dimensions, measures), ..]}``, most
+        used dimension sets first.
+
+        Each chart needs its dimensions plus the columns it is filtered on,
+        by its own filters or by those of the dashboards showing it. Scatter
+        charts aren't aggregated, and time-bucketed charts and charts counting
+        distinct values can't be answered from a rollup, so none of them is
+        planned for.
+        """
+        from backend.utils.chart_data import build_chart_spec, merge_filters
+
+        # Dashboard filters are keyed by column
+        dashboard_columns = {}
+        for dashboard in db.session.query(Dashboard).options(selectinload(Dashboard.charts)):
+            columns = set(dashboard.filters) if isinstance(dashboard.filters, dict) else set()
+            for dashboard_chart in dashboard.charts:
+                dashboard_columns.setdefault(dashboard_chart.chart_id, []).append(columns)
+
+        usage = {}
+        for chart in db.session.query(Chart).filter(Chart.dataset_id.isnot(None)):
+            if chart.chart_type == 'scatter':
+                continue
+            try:
+                spec = build_chart_spec(chart, merge_filters(chart))
+            except (TypeError, ValueError):
+                continue
+            if spec.get('time'):
+                continue
+
+            needed = measure_components((metric['column'], metric['aggregation']) for metric in spec['metrics'])
+            if needed is None:
+                continue
+
+            dimensions = set(spec['dimensions']) | {column for column, _, _ in spec['filters']}
+            placements = dashboard_columns.get(chart.id, [])
+            for columns in placements:
+                dimensions |= columns
+
+            entry = usage.setdefault((chart.dataset_id, frozenset(dimensions)), [0, {}])
+            entry[0] += 1 + len(placements)
+            for column, parts in needed.items():
+                entry[1][column] = sorted(set(entry[1].get(column, ())) | set(parts))
+
+        planned = {}
+        for (dataset_id, dimensions), (uses, measures) in sorted(usage.items(), key=lambda item: -item[1][0]):
+            candidates = planned.setdefault(dataset_id, [])
+            if len(candidates) < self.max_per_dataset:
+                candidates.append((sorted(dimensions), measures))
+
+        return planned
+
+    def build(self, dataset, data_source, dimensions, measures, rollup=None):
+        """
+        Aggregate a dataset over ``dimensions`` into its rollup file and
+        record it. Returns the rollup, or None when it has more than
+        ``max_rows`` groups.
+        """
+        from backend.utils.data_processor import DataProcessor
+
+        version = source_version(data_source)
+        metrics = [('*', 'count')] + [
+            (column, component) for column, parts in sorted(measures.items()) for component in parts
+        ]
+
+        processor = DataProcessor(data_source=data_source, statement_timeout=self.build_timeout)
+        try:
+            df = processor.get_grouped_data(
+                dataset,
+                grouping_sets=[dimensions],
+                metrics=metrics,
+                limit=self.max_rows + 1,
+                direct=True
+            )
+        finally:
+            processor.close()
+
+        if len(df) > self.max_rows:
+            logger.info(f"Rollup of dataset {dataset.id} over {dimensions} exceeds {self.max_rows} rows; skipped")
+            return None
+
+        key = rollup_key(dimensions)
+        path = os.path.join(self.directory, dataset.id, f'{key}.parquet')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Readers only ever see a complete file
+        tmp_path = path + '.tmp'
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+
+        if rollup is None:
+            rollup = Rollup(dataset_id=dataset.id, key=key)
+            db.session.add(rollup)
+
+        rollup.dimensions = list(dimensions)
+        rollup.measures = measures
+        rollup.path = path
+        rollup.row_count = len(df)
+        rollup.source_version = version
+        rollup.built_at = datetime.utcnow()
+        db.session.commit()
+        return rollup
+
+    def _is_current(self, rollup, dataset, data_source, measures):
+        """Whether a file source's rollup can be kept as it is."""
+        # Only file sources tell when their data changes
+        return (
+            data_source.type == 'file'
+            and rollup.source_version == source_version(data_source)
+            and not (dataset.updated_at and rollup.built_at < dataset.updated_at)
+            and _covers(rollup.measures, measures)
+            and os.path.exists(rollup.path)
+        )
+
+    def refresh(self):
+        """
+        Build the planned rollups and drop those no longer planned. Called by
+        the scheduled Celery task; returns counts of what was done.
+        """
+        counts = {'built': 0, 'kept': 0, 'skipped': 0, 'failed': 0, 'dropped': 0}
+        kept_ids = set()
+
+        for dataset_id, candidates in self.plan().items():
+            dataset = db.session.get(Dataset, dataset_id)
+            data_source = db.session.get(DataSource, dataset.source_id) if dataset else None
+            if not data_source:
+                continue
+
+            existing = {rollup.key: rollup for rollup in db.session.query(Rollup).filter_by(dataset_id=dataset_id)}
+            for dimensions, measures in candidates:
+                rollup = existing.get(rollup_key(dimensions))
+                if rollup is not None and self._is_current(rollup, dataset, data_source, measures):
+                    kept_ids.add(rollup.id)
+                    counts['kept'] += 1
+                    continue
+
+                try:
+                    rollup = self.build(dataset, data_source, dimensions, measures, rollup)
+                except Exception as e:
+                    # e.g. a dashboard filter on a column this dataset lacks
+                    db.session.rollback()
+                    logger.warning(f"Could not build rollup of dataset {dataset_id} over {dimensions}: {str(e)}")
+                    counts['failed'] += 1
+                    continue
+
+                if rollup is None:
+                    counts['skipped'] += 1
+                else:
+                    kept_ids.add(rollup.id)
+                    counts['built'] += 1
+
+        for rollup in db.session.query(Rollup):
+            if rollup.id not in kept_ids:
+                if os.path.exists(rollup.path):
+                    os.remove(rollup.path)
+                db.session.delete(rollup)
+                counts['dropped'] += 1
+        db.session.commit()
+
+        return counts
+
+
+rollups = RollupManager()
@@ -0,0 +1,241 @@
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.parquet as pq
+from backend.app import db
+from backend.models import Chart, Dataset, DataSource, Sample
+from backend.utils.result_cache import source_version
+
+logger = logging.getLogger(__name__)
+
+UNIFORM = 'uniform'
+STRATIFIED = 'stratified'
+
+# Column holding the number of dataset rows each sampled row stands for
+WEIGHT_COLUMN = '__weight'
+
+# Aggregations estimated from samples; the others need sketches or an exact scan
+SAMPLE_AGGREGATIONS = ('sum', 'avg', 'count', 'min', 'max')
+
+# Margins of error are given at this confidence, i.e. +/- Z standard errors
+CONFIDENCE = 0.95
+CONFIDENCE_Z = 1.96
+
+# Relative standard error of DuckDB's approx_count_distinct, about that of
+# a HyperLogLog with 4096 registers (1.04 / sqrt(4096))
+HLL_RELATIVE_ERROR = 0.0163
+
+# Rows drawn for a uniform sample
+DEFAULT_SAMPLE_ROWS = 1000000
+
+# Rows drawn per value of the strata column, and most values stratified over
+DEFAULT_STRATUM_ROWS = 10000
+DEFAULT_MAX_STRATA = 100
+
+# Datasets smaller than this are fast enough to scan and aren't sampled
+DEFAULT_MIN_ROWS = 5000000
+
+# Seconds after which a sample is no longer used; 0 for no limit
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+
+class SampleManager:
+    """
+    Persisted random samples of large datasets for approximate queries.
+
+    A scheduled refresh draws, for every dataset of at least ``min_rows``
+    rows, a uniform sample of about ``sample_rows`` rows and, stratified over
+    the dimension its charts group by most, up to ``stratum_rows`` rows per
+    value, so small groups aren't lost. Each sampled row carries the number
+    of rows it stands for (``__weight``), from which aggregates and their
+    margins of error are estimated.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.sample_rows = DEFAULT_SAMPLE_ROWS
+        self.stratum_rows = DEFAULT_STRATUM_ROWS
+        self.max_strata = DEFAULT_MAX_STRATA
+        self.min_rows = DEFAULT_MIN_ROWS
+        self.max_age = DEFAULT_MAX_AGE
+        self.build_timeout = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['SAMPLES_ENABLED']
+        self.directory = app.config['SAMPLE_DIR']
+        self.sample_rows = app.config['SAMPLE_ROWS']
+        self.stratum_rows = app.config['SAMPLE_STRATUM_ROWS']
+        self.max_strata = app.config['SAMPLE_MAX_STRATA']
+        self.min_rows = app.config['SAMPLE_MIN_ROWS']
+        self.max_age = app.config['SAMPLE_MAX_AGE']
+        self.build_timeout = app.config['QUERY_JOB_TIMEOUT']
+
+    def find(self, dataset, data_source, dimensions):
+        """
+        The sample to estimate an aggregation over ``dimensions`` from, or
+        None: the stratified one when it is stratified over one of the
+        dimensions, the uniform one otherwise.
+        """
+        if not self.enabled:
+            return None
+
+        oldest = datetime.utcnow() - timedelta(seconds=self.max_age) if self.max_age else None
+        fresh = {}
+        for sample in db.session.query(Sample).filter_by(dataset_id=dataset.id, source_version=source_version(data_source)):
+            if dataset.updated_at and sample.built_at < dataset.updated_at:
+                continue
+            if oldest and sample.built_at < oldest:
+                continue
+            if os.path.exists(sample.path):
+                fresh[sample.kind] = sample
+
+        stratified = fresh.get(STRATIFIED)
+        if stratified is not None and stratified.strata in dimensions:
+            return stratified
+        return fresh.get(UNIFORM)
+
+    def strata_column(self, dataset_id):
+        """The dimension a dataset's charts group by most, if any."""
+        from backend.utils.chart_data import build_chart_spec
+
+        uses = Counter()
+        for chart in db.session.query(Chart).filter_by(dataset_id=dataset_id):
+            if chart.chart_type == 'scatter':
+                continue
+            try:
+                uses[build_chart_spec(chart)['x']] += 1
+            except (TypeError, ValueError):
+                continue
+
+        return uses.most_common(1)[0][0] if uses else None
+
+    def build(self, dataset, data_source, kind, base_rows, strata=None, sample=None):
+        """
+        Draw a sample of a dataset into its file and record it. Returns the
+        sample, or None when a stratified sample would need more than
+        ``max_strata`` strata.
+        """
+        from backend.utils.data_processor import DataProcessor
+
+        version = source_version(data_source)
+        processor = DataProcessor(data_source=data_source, statement_timeout=self.build_timeout)
+        try:
+            if kind == UNIFORM:
+                df = processor.get_sample(dataset, fraction=min(1.0, self.sample_rows / base_rows))
+            else:
+                distinct = processor.get_aggregated_data(dataset, metrics={strata: 'count_distinct'})
+                if int(distinct.iloc[0, 0]) > self.max_strata:
+                    logger.info(f"Dataset {dataset.id} has more than {self.max_strata} values of {strata}; not stratified")
+                    return None
+                df = processor.get_sample(dataset, strata=strata, stratum_rows=self.stratum_rows)
+        finally:
+            processor.close()
+
+        path = os.path.join(self.directory, dataset.id, f'{kind}.parquet')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Readers only ever see a complete file
+        tmp_path = path + '.tmp'
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+
+        if sample is None:
+            sample = Sample(dataset_id=dataset.id, kind=kind)
+            db.session.add(sample)
+
+        sample.strata = strata
+        sample.path = path
+        sample.row_count = len(df)
+        sample.base_row_count = base_rows
+        sample.source_version = version
+        sample.built_at = datetime.utcnow()
+        db.session.commit()
+        return sample
+
+    def _is_current(self, sample, dataset, data_source, strata):
+        """Whether a file source's sample can be kept as it is."""
+        # Only file sources tell when their data changes
+        return (
+            data_source.type == 'file'
+            and sample.source_version == source_version(data_source)
+            and not (dataset.updated_at and sample.built_at < dataset.updated_at)
+            and sample.strata == strata
+            and os.path.exists(sample.path)
+        )
+
+    def refresh(self):
+        """
+        Draw fresh samples of every large dataset and drop the others. Called
+        by the scheduled Celery task; returns counts of what was done.
+        """
+        from backend.utils.data_processor import DataProcessor
+
+        counts = {'built': 0, 'kept': 0, 'skipped': 0, 'failed': 0, 'dropped': 0}
+        kept_ids = set()
+
+        for dataset in db.session.query(Dataset).all():
+            data_source = db.session.get(DataSource, dataset.source_id) if dataset.source_id else None
+            if not data_source:
+                continue
+
+            existing = {sample.kind: sample for sample in db.session.query(Sample).filter_by(dataset_id=dataset.id)}
+            try:
+                processor = DataProcessor(data_source=data_source, statement_timeout=self.build_timeout)
+                try:
+                    base_rows = int(processor.get_aggregated_data(dataset, metrics={'*': 'count'})['count'].iloc[0])
+                finally:
+                    processor.close()
+            except Exception as e:
+                # Keep what there is; it is used for as long as it is fresh
+                db.session.rollback()
+                logger.warning(f"Could not count the rows of dataset {dataset.id}: {str(e)}")
+                kept_ids.update(sample.id for sample in existing.values())
+                counts['failed'] += 1
+                continue
+
+            if base_rows < self.min_rows:
+                continue
+
+            planned = [(UNIFORM, None)]
+            strata = self.strata_column(dataset.id)
+            if strata:
+                planned.append((STRATIFIED, strata))
+
+            for kind, strata in planned:
+                sample = existing.get(kind)
+                if sample is not None and self._is_current(sample, dataset, data_source, strata):
+                    kept_ids.add(sample.id)
+                    counts['kept'] += 1
+                    continue
+
+                try:
+                    sample = self.build(dataset, data_source, kind, base_rows, strata, sample)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(f"Could not sample dataset {dataset.id} ({kind}): {str(e)}")
+                    counts['failed'] += 1
+                    continue
+
+                if sample is None:
+                    counts['skipped'] += 1
+                else:
+                    kept_ids.add(sample.id)
+                    counts['built'] += 1
+
+        for sample in db.session.query(Sample):
+            if sample.id not in kept_ids:
+                if os.path.exists(sample.path):
+                    os.remove(sample.path)
+                db.session.delete(sample)
+                counts['dropped'] += 1
+        db.session.commit()
+
+        return counts
+
+
+samples = SampleManager()
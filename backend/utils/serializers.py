@@ -0,0 +1,148 @@
+from sqlalchemy import func, literal
+from sqlalchemy.orm import aliased, selectinload, joinedload
+from backend.app import db
+from backend.models import Chart, Dashboard, DashboardChart, DashboardComment
+from backend.utils.pagination import encode_cursor, decode_cursor, keyset_after
+
+# Chart columns loaded for summaries; configurations stay in the database
+CHART_SUMMARY_COLUMNS = ('id', 'name', 'dataset_id', 'chart_type')
+
+# Levels of replies returned below each comment; deeper ones are fetched on request
+DEFAULT_REPLY_DEPTH = 2
+
+
+def dashboard_load_options(summary=False):
+    """
+    Loader options fetching a dashboard's charts with it: dashboard charts
+    for every loaded dashboard in one ``IN`` query, their charts joined in.
+    """
+    charts = selectinload(Dashboard.charts).joinedload(DashboardChart.chart)
+    if summary:
+        charts = charts.load_only(*[getattr(Chart, column) for column in CHART_SUMMARY_COLUMNS])
+    return [charts]
+
+
+def dashboards_query(summary=False):
+    """Dashboard query whose results serialize without further queries."""
+    return Dashboard.query.options(*dashboard_load_options(summary=summary))
+
+
+def load_dashboard(dashboard_id, summary=False):
+    return dashboards_query(summary=summary).filter_by(id=dashboard_id).first()
+
+
+def serialize_dashboards(dashboards, summary=False):
+    """
+    Serialize dashboards loaded with ``dashboards_query``. Summaries list
+    each chart's name and type instead of its full configuration.
+    """
+    return [dashboard.to_dict(summary=summary) for dashboard in dashboards]
+
+
+def serialize_dashboard_export(dashboard):
+    """A dashboard with its charts flattened, each carrying its position."""
+    data = dashboard.to_dict(summary=True)
+
+    charts = []
+    for dashboard_chart in dashboard.charts:
+        chart = dashboard_chart.chart.to_dict() if dashboard_chart.chart else {}
+        chart['position'] = dashboard_chart.position
+        charts.append(chart)
+
+    data['charts'] = charts
+    return data
+
+
+def _comments_query():
+    """Comments with their authors and direct reply counts, in one query."""
+    replies = aliased(DashboardComment)
+    reply_count = db.session.query(func.count(replies.id)).filter(
+        replies.parent_id == DashboardComment.id
+    ).correlate(DashboardComment).scalar_subquery()
+
+    return db.session.query(DashboardComment, reply_count.label('reply_count')).options(
+        joinedload(DashboardComment.user)
+    )
+
+
+def _comment_node(comment, reply_count):
+    node = comment.to_dict(include_replies=False)
+    node['reply_count'] = reply_count
+    node['replies'] = []
+    return node
+
+
+def _load_replies(parent_ids, depth):
+    """Comments up to ``depth`` levels below the given ones, in one recursive query."""
+    if not parent_ids or depth < 1:
+        return []
+
+    tree = db.session.query(
+        DashboardComment.id.label('id'), literal(1).label('depth')
+    ).filter(DashboardComment.parent_id.in_(parent_ids)).cte('comment_tree', recursive=True)
+
+    child = aliased(DashboardComment)
+    tree = tree.union_all(
+        db.session.query(child.id, tree.c.depth + 1).filter(
+            child.parent_id == tree.c.id,
+            tree.c.depth < depth
+        )
+    )
+
+    return _comments_query().join(tree, tree.c.id == DashboardComment.id).order_by(
+        DashboardComment.created_at, DashboardComment.id
+    ).all()
+
+
+def build_comment_tree(parents, rows):
+    """
+    Attach (comment, reply_count) rows below their parents, found through a
+    dict index of every node. Replies keep the order of ``rows``.
+    """
+    index = {node['id']: node for node in parents}
+
+    nodes = [_comment_node(comment, reply_count) for comment, reply_count in rows]
+    index.update((node['id'], node) for node in nodes)
+
+    for node in nodes:
+        index[node['parent_id']]['replies'].append(node)
+
+    return parents
+
+
+def comment_threads(dashboard_id, limit=20, cursor=None, depth=DEFAULT_REPLY_DEPTH):
+    """
+    A page of a dashboard's top-level comments, oldest first, each with up to
+    ``depth`` levels of replies. Every node carries its ``reply_count``, so
+    clients can tell where replies were cut off.
+
+    Returns the threads and the cursor of the next page (None on the last).
+    """
+    order = (DashboardComment.created_at, DashboardComment.id)
+    query = _comments_query().filter(
+        DashboardComment.dashboard_id == dashboard_id,
+        DashboardComment.parent_id.is_(None)
+    )
+    if cursor:
+        query = query.filter(keyset_after(order, decode_cursor(cursor, len(order))))
+
+    rows = query.order_by(*order).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    threads = [_comment_node(comment, reply_count) for comment, reply_count in rows]
+    build_comment_tree(threads, _load_replies([thread['id'] for thread in threads], depth))
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1][0]
+        next_cursor = encode_cursor([last.created_at, last.id])
+
+    return threads, next_cursor
+
+
+def comment_replies(comment, depth=DEFAULT_REPLY_DEPTH):
+    """Replies to a comment, up to ``depth`` levels deep."""
+    root = {'id': comment.id, 'replies': []}
+    build_comment_tree([root], _load_replies([comment.id], depth))
+    return root['replies']
@@ -0,0 +1,52 @@
+import io
+import pyarrow as pa
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+STREAM_FORMATS = {
+    'ndjson': NDJSON_MIMETYPE,
+    'arrow': ARROW_STREAM_MIMETYPE
+}
+
+
+def _drain(sink):
+    """Return the bytes written to a BytesIO sink so far and reset it."""
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def ndjson_stream(batches):
+    """Encode Arrow record batches as newline-delimited JSON, one chunk per batch."""
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        chunk = batch.to_pandas().to_json(orient='records', lines=True, date_format='iso')
+        yield chunk.rstrip('\n') + '\n'
+
+
+def arrow_ipc_stream(batches):
+    """Encode Arrow record batches in the Arrow IPC streaming format."""
+    sink = io.BytesIO()
+    writer = None
+
+    for batch in batches:
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        yield _drain(sink)
+
+    if writer is not None:
+        writer.close()
+        yield _drain(sink)
+
+
+def encode_stream(batches, fmt):
+    """Encode record batches in one of ``STREAM_FORMATS``."""
+    if fmt == 'ndjson':
+        return ndjson_stream(batches)
+    if fmt == 'arrow':
+        return arrow_ipc_stream(batches)
+    raise ValueError(f"Unsupported stream format: {fmt}")
@@ -0,0 +1,252 @@
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from backend.app import cache
+
+# Entries kept in each worker's memory, and for how long at most
+DEFAULT_LOCAL_MAX_ENTRIES = 1024
+DEFAULT_LOCAL_TTL = 30
+
+# Seconds an expired entry stays in Redis to be served while it is recomputed
+DEFAULT_STALE_TTL = 60
+
+# Seconds a recompute lock is held at most, and waited for at most
+DEFAULT_LOCK_TIMEOUT = 60
+DEFAULT_LOCK_WAIT = 10
+
+# Weight of the compute time in probabilistic early refresh; 0 disables it
+DEFAULT_EARLY_REFRESH_BETA = 1.0
+
+_POLL_INTERVAL = 0.05
+_MAX_POLL_INTERVAL = 0.5
+
+STAT_NAMES = (
+    'local_hits',
+    'remote_hits',
+    'misses',
+    'early_refreshes',
+    'stale_served',
+    'waits',
+    'wait_timeouts',
+    'computes'
+)
+
+
+class LocalTier:
+    """Thread-safe LRU of entries with an absolute expiry, per worker."""
+
+    def __init__(self, max_entries=DEFAULT_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+
+            expires_at, entry = item
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredCache:
+    """
+    Two-tier cache: a small in-memory LRU per worker in front of the shared
+    Flask-Caching (Redis) store.
+
+    Entries carry their expiry and the time they took to compute.
+    ``get_or_compute`` lets a single worker recompute a missing or expired
+    key under a Redis lock while the others are served the stale entry or
+    wait for the new one, and refreshes hot keys shortly before they expire
+    (probabilistic early expiration, weighted by compute time).
+
+    The local tier can't see deletes made by other workers, so it suits
+    versioned keys, which change instead of being deleted.
+    """
+
+    def __init__(self, app=None):
+        self.local = LocalTier()
+        self.local_ttl = DEFAULT_LOCAL_TTL
+        self.stale_ttl = DEFAULT_STALE_TTL
+        self.lock_timeout = DEFAULT_LOCK_TIMEOUT
+        self.lock_wait = DEFAULT_LOCK_WAIT
+        self.beta = DEFAULT_EARLY_REFRESH_BETA
+        self._stats = dict.fromkeys(STAT_NAMES, 0)
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.local = LocalTier(app.config['TIERED_CACHE_LOCAL_MAX_ENTRIES'])
+        self.local_ttl = app.config['TIERED_CACHE_LOCAL_TTL']
+        self.stale_ttl = app.config['TIERED_CACHE_STALE_TTL']
+        self.lock_timeout = app.config['TIERED_CACHE_LOCK_TIMEOUT']
+        self.lock_wait = app.config['TIERED_CACHE_LOCK_WAIT']
+        self.beta = app.config['TIERED_CACHE_EARLY_REFRESH_BETA']
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _lookup(self, key):
+        """The entry of a key, from memory or else Redis (then kept in memory)."""
+        entry = self.local.get(key)
+        if entry is not None:
+            self._count('local_hits')
+            return entry
+
+        entry = cache.get(key)
+        if entry is not None:
+            self._count('remote_hits')
+            self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        # Never keep an entry in memory past its own expiry
+        self.local.set(key, entry, min(entry['expires_at'], time.time() + self.local_ttl))
+
+    def _should_refresh(self, entry):
+        """XFetch: the closer to expiry and the slower to compute, the likelier."""
+        if not self.beta or not entry['delta']:
+            return False
+        gap = -entry['delta'] * self.beta * math.log(1.0 - random.random())
+        return time.time() + gap >= entry['expires_at']
+
+    def get(self, key):
+        """The value of a key, or None if it is missing or expired."""
+        entry = self._lookup(key)
+        if entry is None or entry['expires_at'] <= time.time():
+            self._count('misses')
+            return None
+        return entry['value']
+
+    def get_many(self, *keys):
+        """Values of several keys, with one Redis round trip for those not in memory."""
+        now = time.time()
+        entries = [self.local.get(key) for key in keys]
+
+        remote_keys = [key for key, entry in zip(keys, entries) if entry is None]
+        remote = dict(zip(remote_keys, cache.get_many(*remote_keys))) if remote_keys else {}
+
+        values = []
+        for key, entry in zip(keys, entries):
+            if entry is not None:
+                self._count('local_hits')
+            else:
+                entry = remote.get(key)
+                if entry is not None:
+                    self._count('remote_hits')
+                    self._remember(key, entry)
+
+            if entry is None or entry['expires_at'] <= now:
+                self._count('misses')
+                values.append(None)
+            else:
+                values.append(entry['value'])
+        return values
+
+    def set(self, key, value, timeout, delta=0.0):
+        """
+        Store a value for ``timeout`` seconds; Redis keeps it ``stale_ttl``
+        seconds longer to serve while it is recomputed. ``delta`` is how long
+        the value took to compute.
+        """
+        entry = {'value': value, 'expires_at': time.time() + timeout, 'delta': delta}
+        cache.set(key, entry, timeout=timeout + self.stale_ttl)
+        self._remember(key, entry)
+
+    def get_or_compute(self, key, compute, timeout):
+        """
+        The value of a key, computing and storing it with ``compute()`` if
+        needed. Only the worker holding the key's lock computes; the others
+        get the stale value if there is one, or wait for the new value up to
+        ``lock_wait`` seconds before computing it themselves.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            if entry['expires_at'] > time.time():
+                if not self._should_refresh(entry):
+                    return entry['value']
+                self._count('early_refreshes')
+        else:
+            self._count('misses')
+
+        lock_key = f'lock:{key}'
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, timeout=self.lock_timeout):
+            try:
+                return self._compute(key, compute, timeout)
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        # Someone else is computing it
+        if entry is not None:
+            if entry['expires_at'] <= time.time():
+                self._count('stale_served')
+            return entry['value']
+
+        self._count('waits')
+        deadline = time.monotonic() + self.lock_wait
+        interval = _POLL_INTERVAL
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            interval = min(interval * 2, _MAX_POLL_INTERVAL)
+
+            entry = cache.get(key)
+            if entry is not None and entry['expires_at'] > time.time():
+                self._remember(key, entry)
+                return entry['value']
+            if cache.get(lock_key) is None:
+                # The holder failed; compute it here instead
+                break
+        else:
+            self._count('wait_timeouts')
+
+        return self._compute(key, compute, timeout)
+
+    def _compute(self, key, compute, timeout):
+        self._count('computes')
+        started = time.monotonic()
+        value = compute()
+        self.set(key, value, timeout, delta=time.monotonic() - started)
+        return value
+
+    def stats(self):
+        """Counters of this worker since it started."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['local_entries'] = len(self.local)
+        stats['pid'] = os.getpid()
+        return stats
+
+
+tiered_cache = TieredCache()